@@ -3,30 +3,68 @@ AI Services Module
 Handles notes generation, quiz creation, and study planning
 """
 from typing import List, Optional
-from datetime import datetime, timedelta
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
-from config import settings
 from models import (
     NotesResponse, NotesSection,
     QuizResponse, QuizQuestion, DifficultyLevel,
-    StudyPlanResponse, DailyTask
+    StudyPlanResponse
 )
 from rag_engine import RAGEngine
+from study_planner import StudyPlanner, Topic
+from llm import create_chat_model
+from llm_scheduler import Priority, llm_user
+from startup import timed
+from metrics import stage
 import json
 
 class AIServices:
     """AI-powered services for study assistance"""
     
-    def __init__(self):
-        """Initialize LLM and RAG engine"""
-        self.llm = ChatGoogleGenerativeAI(
-            model=settings.MODEL_NAME,
-            google_api_key=settings.GOOGLE_API_KEY,
-            temperature=0.4,  # Slightly higher for creative tasks
-            max_output_tokens=settings.MAX_OUTPUT_TOKENS
+    def __init__(self, rag_engine: Optional[RAGEngine] = None):
+        """Initialize RAG engine; the LLM client is created on first use"""
+        self._llm = None
+        self.rag_engine = rag_engine or RAGEngine()
+        self.study_planner = StudyPlanner(self.rag_engine.vector_store, labeler=self._label_topics)
+    
+    @property
+    def llm(self):
+        """Chat model client, created on first access"""
+        if self._llm is None:
+            with timed("ai_services.llm"):
+                # Slightly higher temperature for creative tasks; queued behind chat
+                self._llm = create_chat_model(temperature=0.4, priority=Priority.BATCH)
+        return self._llm
+    
+    def _label_topics(self, topics: List[Topic]) -> Optional[List[str]]:
+        """Name study topics with a single LLM call"""
+        sections = "\n".join(
+            f"{i}. [{topic.resource}] keywords: {', '.join(topic.keywords)}\n   {topic.text[:300]}"
+            for i, topic in enumerate(topics, 1)
         )
-        self.rag_engine = RAGEngine()
+        prompt = f"""You are Velosify Study Copilot. Give each study section a short topic name (max 6 words).
+
+SECTIONS:
+{sections}
+
+Format as JSON with exactly {len(topics)} names, in order:
+{{
+    "topics": ["Name 1", "Name 2"]
+}}
+
+NAME {len(topics)} TOPICS:"""
+        
+        with stage("planner.llm"):
+            response = self.llm.invoke(prompt)
+        return self._parse_json_response(response.content, "planner").get("topics")
+    
+    def _parse_json_response(self, content: str, kind: str) -> dict:
+        """Parse a JSON model response, removing markdown code blocks if present"""
+        with stage(f"{kind}.parse"):
+            if "```json" in content:
+                content = content.split("```json")[1].split("```")[0]
+            elif "```" in content:
+                content = content.split("```")[1].split("```")[0]
+            
+            return json.loads(content.strip())
     
     def generate_notes(
         self,
@@ -43,12 +81,13 @@ class AIServices:
             topic = "General Study Notes"
         
         # Retrieve relevant context
-        relevant_chunks = self.rag_engine.get_context_for_topic(
-            user_id=user_id,
-            topic=topic,
-            document_ids=document_ids,
-            max_chunks=15
-        )
+        with stage("notes.retrieve"):
+            relevant_chunks = self.rag_engine.get_context_for_topic(
+                user_id=user_id,
+                topic=topic,
+                document_ids=document_ids,
+                max_chunks=15
+            )
         
         if not relevant_chunks:
             return NotesResponse(
@@ -91,17 +130,11 @@ Format your response as JSON:
 GENERATE NOTES:"""
         
         try:
-            response = self.llm.invoke(prompt)
-            content = response.content
+            with stage("notes.llm"), llm_user(user_id):
+                response = self.llm.invoke(prompt)
             
             # Parse JSON response
-            # Remove markdown code blocks if present
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0]
-            
-            data = json.loads(content.strip())
+            data = self._parse_json_response(response.content, "notes")
             
             sections = []
             for section_data in data.get("sections", []):
@@ -144,12 +177,13 @@ GENERATE NOTES:"""
             topic = "General Assessment"
         
         # Retrieve relevant context
-        relevant_chunks = self.rag_engine.get_context_for_topic(
-            user_id=user_id,
-            topic=topic,
-            document_ids=document_ids,
-            max_chunks=20
-        )
+        with stage("quiz.retrieve"):
+            relevant_chunks = self.rag_engine.get_context_for_topic(
+                user_id=user_id,
+                topic=topic,
+                document_ids=document_ids,
+                max_chunks=20
+            )
         
         if not relevant_chunks:
             return QuizResponse(
@@ -201,16 +235,11 @@ Format as JSON:
 GENERATE {num_questions} QUESTIONS:"""
         
         try:
-            response = self.llm.invoke(prompt)
-            content = response.content
-            
-            # Parse JSON
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0]
+            with stage("quiz.llm"), llm_user(user_id):
+                response = self.llm.invoke(prompt)
             
-            data = json.loads(content.strip())
+            # Parse JSON response
+            data = self._parse_json_response(response.content, "quiz")
             
             questions = []
             for q_data in data.get("questions", [])[:num_questions]:
@@ -247,99 +276,19 @@ GENERATE {num_questions} QUESTIONS:"""
         weak_topics: Optional[List[str]] = None,
         document_ids: Optional[List[str]] = None
     ) -> StudyPlanResponse:
-        """Generate personalized study plan"""
-        
-        # Calculate days until exam
+        """
+        Generate personalized study plan
+        The schedule is computed locally; the LLM only names the topics
+        """
         try:
-            exam_datetime = datetime.fromisoformat(exam_date)
-            today = datetime.now()
-            days_remaining = (exam_datetime - today).days
-            
-            if days_remaining <= 0:
-                days_remaining = 7  # Default to 1 week
-        except:
-            days_remaining = 30  # Default to 1 month
-        
-        # Get document context if available
-        context = ""
-        if document_ids:
-            chunks = self.rag_engine.get_context_for_topic(
-                user_id=user_id,
-                topic="study topics and syllabus",
-                document_ids=document_ids,
-                max_chunks=10
-            )
-            context = "\n".join([chunk['text'][:500] for chunk in chunks])
-        
-        weak_topics_str = ", ".join(weak_topics) if weak_topics else "None specified"
-        
-        # Study plan generation prompt
-        prompt = f"""You are Velosify Study Copilot. Create a personalized study plan.
-
-EXAM DATE: {exam_date}
-DAYS REMAINING: {days_remaining}
-AVAILABLE HOURS/DAY: {available_hours_per_day}
-WEAK TOPICS: {weak_topics_str}
-
-SYLLABUS CONTEXT:
-{context if context else "General comprehensive preparation"}
-
-Create a day-by-day study plan with:
-1. Balanced topic coverage
-2. Extra focus on weak topics
-3. Regular revision slots
-4. Mock tests before exam
-5. Realistic daily tasks
-
-Format as JSON:
-{{
-    "daily_tasks": [
-        {{
-            "day": 1,
-            "date": "2026-02-07",
-            "topic": "Topic name",
-            "duration_hours": 3.0,
-            "task_type": "study|revision|practice|mock_test",
-            "resources": ["Resource 1", "Resource 2"]
-        }}
-    ],
-    "revision_slots": [5, 10, 15],
-    "weak_topic_focus": ["Topic 1", "Topic 2"]
-}}
-
-GENERATE STUDY PLAN:"""
-        
-        try:
-            response = self.llm.invoke(prompt)
-            content = response.content
-            
-            # Parse JSON
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0]
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0]
-            
-            data = json.loads(content.strip())
-            
-            daily_tasks = []
-            for task_data in data.get("daily_tasks", []):
-                task = DailyTask(
-                    day=task_data.get("day", 1),
-                    date=task_data.get("date", ""),
-                    topic=task_data.get("topic", ""),
-                    duration_hours=task_data.get("duration_hours", 2.0),
-                    task_type=task_data.get("task_type", "study"),
-                    resources=task_data.get("resources", [])
+            with stage("planner.schedule"), llm_user(user_id):
+                return self.study_planner.plan(
+                    user_id=user_id,
+                    exam_date=exam_date,
+                    available_hours_per_day=available_hours_per_day,
+                    weak_topics=weak_topics,
+                    document_ids=document_ids
                 )
-                daily_tasks.append(task)
-            
-            return StudyPlanResponse(
-                success=True,
-                total_days=len(daily_tasks),
-                daily_tasks=daily_tasks,
-                revision_slots=data.get("revision_slots", []),
-                weak_topic_focus=data.get("weak_topic_focus", weak_topics or [])
-            )
             
         except Exception as e:
             print(f"Error generating study plan: {e}")
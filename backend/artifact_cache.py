@@ -0,0 +1,172 @@
+"""
+Artifact Cache Module
+Durable cache of generated notes, quizzes and study plans
+
+Entries are keyed by a hash of the request inputs, the content fingerprint
+of the referenced documents and the chunking/embedding/model settings that
+shaped them. Each entry records which (user, document) pairs it was built
+from so deleting or re-ingesting a document drops it. The total payload
+size is kept under ARTIFACT_CACHE_MAX_BYTES by evicting least recently
+used entries.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+from config import settings
+
+
+def make_cache_key(kind: str, inputs: tuple) -> str:
+    """Stable key for a generation's inputs and the settings that affect its output"""
+    material = json.dumps(
+        [
+            kind,
+            inputs,
+            settings.CHUNK_SIZE,
+            settings.CHUNK_OVERLAP,
+            settings.EMBEDDING_PROVIDER,
+            settings.MODEL_NAME,
+        ],
+        default=str
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class ArtifactCache:
+    """Generated artifacts stored as JSON in SQLite (WAL mode)"""
+
+    def __init__(self, db_path: Optional[Path] = None, max_bytes: Optional[int] = None):
+        self.db_path = db_path or settings.ARTIFACT_CACHE_DB_PATH
+        self.max_bytes = max_bytes or settings.ARTIFACT_CACHE_MAX_BYTES
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # One connection per thread; sqlite3 connections are not thread-safe
+        self._local = threading.local()
+        self._create_schema()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Get this thread's database connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        """Create tables and indexes if they don't exist"""
+        conn = self._get_connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    cache_key TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS artifact_documents (
+                    cache_key TEXT NOT NULL REFERENCES artifacts (cache_key) ON DELETE CASCADE,
+                    user_id TEXT NOT NULL,
+                    document_id TEXT NOT NULL,
+                    PRIMARY KEY (cache_key, user_id, document_id)
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_artifact_documents_doc
+                ON artifact_documents (user_id, document_id)
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_artifacts_access
+                ON artifacts (last_access)
+            """)
+
+    def get(self, cache_key: str) -> Optional[str]:
+        """Cached JSON payload, or None"""
+        conn = self._get_connection()
+        row = conn.execute(
+            "SELECT payload FROM artifacts WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute(
+                "UPDATE artifacts SET last_access = ? WHERE cache_key = ?",
+                (time.time(), cache_key)
+            )
+        return row[0]
+
+    def put(
+        self,
+        cache_key: str,
+        kind: str,
+        payload: str,
+        user_id: str,
+        document_ids: Iterable[str]
+    ):
+        """Store a payload and the documents it was generated from"""
+        now = time.time()
+        conn = self._get_connection()
+        with conn:
+            # Upsert rather than REPLACE, which would cascade-delete the
+            # document references recorded by other users
+            conn.execute(
+                "INSERT INTO artifacts "
+                "(cache_key, kind, payload, size_bytes, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (cache_key) DO UPDATE SET "
+                "payload = excluded.payload, size_bytes = excluded.size_bytes, "
+                "created_at = excluded.created_at, last_access = excluded.last_access",
+                (cache_key, kind, payload, len(payload.encode()), now, now)
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO artifact_documents (cache_key, user_id, document_id) "
+                "VALUES (?, ?, ?)",
+                [(cache_key, user_id, document_id) for document_id in set(document_ids)]
+            )
+        self._evict()
+
+    def invalidate_document(self, user_id: str, document_id: str) -> int:
+        """
+        Drop every artifact generated from the document
+        Returns: number of artifacts removed
+        """
+        conn = self._get_connection()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM artifacts WHERE cache_key IN ("
+                "SELECT cache_key FROM artifact_documents WHERE user_id = ? AND document_id = ?)",
+                (user_id, document_id)
+            )
+        return cursor.rowcount
+
+    def total_bytes(self) -> int:
+        row = self._get_connection().execute(
+            "SELECT COALESCE(SUM(size_bytes), 0) FROM artifacts"
+        ).fetchone()
+        return row[0]
+
+    def _evict(self):
+        """Remove least recently used artifacts until under the size limit"""
+        excess = self.total_bytes() - self.max_bytes
+        if excess <= 0:
+            return
+
+        conn = self._get_connection()
+        victims, freed = [], 0
+        for cache_key, size_bytes in conn.execute(
+            "SELECT cache_key, size_bytes FROM artifacts ORDER BY last_access"
+        ):
+            victims.append((cache_key,))
+            freed += size_bytes
+            if freed >= excess:
+                break
+        with conn:
+            conn.executemany("DELETE FROM artifacts WHERE cache_key = ?", victims)
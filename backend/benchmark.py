@@ -0,0 +1,230 @@
+"""
+Offline retrieval benchmark for VectorStore and RAGEngine
+
+Generates a synthetic corpus, ingests it with the fake (or local)
+embedding provider in a temporary directory and reports ingest
+throughput, index load time, search latency percentiles, recall,
+delete cost and memory per chunk as JSON.
+
+Usage:
+    python benchmark.py --docs 20 --pages 30 --queries 200 --output results.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+
+from config import settings
+
+
+def percentiles(samples_s: List[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds"""
+    if not samples_s:
+        return {}
+    samples_ms = np.array(samples_s) * 1000
+    return {
+        "count": int(len(samples_ms)),
+        "mean_ms": round(float(samples_ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(samples_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(samples_ms, 99)), 3),
+        "max_ms": round(float(samples_ms.max()), 3),
+    }
+
+
+def git_commit() -> str:
+    """Current commit, so results can be tracked across changes"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=str(Path(__file__).parent),
+            capture_output=True,
+            text=True
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+def run_benchmark(args) -> Dict:
+    """Run all benchmark stages and return the results"""
+    from synthetic_data import make_corpus, make_queries
+    from pdf_processor import PDFProcessor
+    from vector_store import VectorStore
+    from rag_engine import RAGEngine
+    from embeddings import get_embedding_provider
+    from mock_services import MockChatModel, LatencyModel
+
+    work_dir = Path(tempfile.mkdtemp(prefix="velosify_bench_"))
+    settings.VECTOR_STORE_DIR = work_dir / "vector_stores"
+    # A fresh text cache, so repeated runs time extraction instead of cache hits
+    settings.TEXT_CACHE_DIR = work_dir / "text_cache"
+    settings.SIMILARITY_THRESHOLD = args.similarity_threshold
+    settings.COSINE_SIMILARITY_THRESHOLD = args.cosine_threshold
+    upload_dir = work_dir / "uploads"
+    upload_dir.mkdir(parents=True)
+
+    try:
+        documents = make_corpus(args.docs, args.pages, args.words_per_page, seed=args.seed)
+        queries = make_queries(documents, args.queries, seed=args.seed + 1)
+
+        processor = PDFProcessor()
+        vector_store = VectorStore(get_embedding_provider(args.provider))
+        user_id = "bench_user"
+
+        # Ingest: extraction + chunking, then embedding + index append
+        process_times, add_times = [], []
+        total_pages = total_chunks = 0
+        document_ids = []
+        for document in documents:
+            file_path = upload_dir / document["filename"]
+            file_path.write_bytes(document["pdf"])
+
+            start = time.perf_counter()
+            metadata, chunks = processor.process_pdf(file_path, user_id, document["filename"])
+            process_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            vector_store.add_documents(user_id, chunks)
+            add_times.append(time.perf_counter() - start)
+
+            total_pages += metadata.total_pages
+            total_chunks += len(chunks)
+            document_ids.append(metadata.document_id)
+
+        ingest_seconds = sum(process_times) + sum(add_times)
+
+        # Index load: open vectors and unpickle metadata
+        load_times = []
+        for _ in range(args.load_repeats):
+            start = time.perf_counter()
+            vectors, metadata = vector_store.load_index(user_id)
+            load_times.append(time.perf_counter() - start)
+            del vectors, metadata
+
+        # Heap cost of a loaded index (mapped vectors are not heap)
+        tracemalloc.start()
+        vectors, metadata = vector_store.load_index(user_id)
+        heap_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del vectors, metadata
+
+        user_dir = settings.VECTOR_STORE_DIR / user_id
+        disk_bytes = sum(f.stat().st_size for f in user_dir.iterdir() if f.is_file())
+
+        # Search latency and recall@k against the page each query came from
+        search_times, hits = [], 0
+        for query in queries:
+            start = time.perf_counter()
+            results = vector_store.search(user_id, query["query"], top_k=args.top_k)
+            search_times.append(time.perf_counter() - start)
+            if any(
+                r["filename"] == query["filename"] and r["page_number"] == query["page_number"]
+                for r in results
+            ):
+                hits += 1
+
+        # Batched search
+        batch_times = []
+        query_texts = [q["query"] for q in queries]
+        for i in range(0, len(query_texts), args.batch_size):
+            start = time.perf_counter()
+            vector_store.search_batch(user_id, query_texts[i:i + args.batch_size], top_k=args.top_k)
+            batch_times.append(time.perf_counter() - start)
+
+        # RAGEngine chat path with an instant LLM
+        rag_engine = RAGEngine(vector_store=vector_store)
+        rag_engine._llm = MockChatModel(LatencyModel())
+        chat_times = []
+        for query in queries[:args.chat_queries]:
+            start = time.perf_counter()
+            rag_engine.chat(user_id, query["query"], max_results=args.top_k)
+            chat_times.append(time.perf_counter() - start)
+
+        # Delete cost: remove one document from the middle of the index
+        start = time.perf_counter()
+        vector_store.delete_document(user_id, document_ids[len(document_ids) // 2])
+        delete_seconds = time.perf_counter() - start
+
+        return {
+            "config": {
+                "docs": args.docs,
+                "pages_per_doc": args.pages,
+                "words_per_page": args.words_per_page,
+                "queries": args.queries,
+                "top_k": args.top_k,
+                "provider": vector_store.embedder.signature,
+                "chunk_size": settings.CHUNK_SIZE,
+                "chunk_overlap": settings.CHUNK_OVERLAP,
+                "metric": settings.VECTOR_METRIC,
+                "similarity_threshold": args.similarity_threshold,
+                "cosine_threshold": args.cosine_threshold,
+                "seed": args.seed,
+            },
+            "environment": {
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+            },
+            "results": {
+                "ingest": {
+                    "pages": total_pages,
+                    "chunks": total_chunks,
+                    "seconds": round(ingest_seconds, 4),
+                    "pages_per_second": round(total_pages / ingest_seconds, 2),
+                    "chunks_per_second": round(total_chunks / ingest_seconds, 2),
+                    "process_pdf": percentiles(process_times),
+                    "add_documents": percentiles(add_times),
+                },
+                "index_load": percentiles(load_times),
+                "search": percentiles(search_times),
+                "search_batch": {
+                    "batch_size": args.batch_size,
+                    **percentiles(batch_times),
+                    "per_query_ms": round(sum(batch_times) * 1000 / max(1, len(query_texts)), 3),
+                },
+                "rag_chat_without_llm": percentiles(chat_times),
+                "recall_at_k": round(hits / max(1, len(queries)), 4),
+                "delete_document_ms": round(delete_seconds * 1000, 3),
+                "memory": {
+                    "disk_bytes_per_chunk": round(disk_bytes / max(1, total_chunks), 1),
+                    "heap_bytes_per_chunk_loaded": round(heap_bytes / max(1, total_chunks), 1),
+                },
+            },
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark")
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=20, help="Pages per document")
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--chat-queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--load-repeats", type=int, default=20)
+    parser.add_argument("--provider", default="fake", help="Embedding provider (fake, local, google)")
+    parser.add_argument("--similarity-threshold", type=float, default=0.0, help="L2 score threshold")
+    parser.add_argument("--cosine-threshold", type=float, default=-1.0, help="Cosine threshold (-1 keeps all)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args()
+
+    results = run_benchmark(args)
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output)
+        print(f"Results written to {args.output}", file=sys.stderr)
@@ -0,0 +1,156 @@
+"""
+Similarity Threshold Calibration
+Picks COSINE_SIMILARITY_THRESHOLD from a labeled query sample
+
+Each labeled query names the chunks that should answer it. For every
+candidate threshold the report gives:
+    recall       share of queries whose best relevant chunk passes
+    precision    share of passing top-k hits that are relevant
+    empty_rate   share of queries left with no hits at all ("no results")
+and recommends the highest threshold that keeps recall at --target-recall.
+
+Labeled sample (JSON lines); `relevant` entries match chunks on every key
+they give, e.g. a whole document or one page of it:
+    {"user_id": "u1", "query": "What is osmosis?",
+     "relevant": [{"document_id": "...", "page_number": 4}]}
+
+Usage:
+    python calibration.py --labels labeled.jsonl
+    python calibration.py --synthetic 200 --provider fake   # offline, temporary corpus
+"""
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+import numpy as np
+from config import settings
+from quantization import normalize
+
+
+def score_labeled_queries(vector_store, labeled: List[Dict], top_k: int) -> List[Dict]:
+    """
+    Cosine scores per labeled query
+    Returns: [{"relevant_best": float, "top": [(score, is_relevant), ...]}]
+    """
+    scored, indexes = [], {}
+    for item in labeled:
+        user_id = item["user_id"]
+        if user_id not in indexes:
+            indexes[user_id] = vector_store.load_index(user_id)
+        vectors, metadata = indexes[user_id]
+        if len(vectors) == 0:
+            continue
+
+        query = normalize(vector_store.create_query_embedding(item["query"]))
+        scores = np.asarray(vectors) @ query.ravel()
+        relevant = np.array([
+            any(all(chunk.get(key) == value for key, value in label.items()) for label in item["relevant"])
+            for chunk in metadata
+        ])
+        top = np.argsort(-scores, kind="stable")[:top_k]
+        scored.append({
+            "relevant_best": float(scores[relevant].max()) if relevant.any() else None,
+            "top": [(float(scores[i]), bool(relevant[i])) for i in top],
+        })
+    return scored
+
+
+def threshold_table(scored: List[Dict], step: float = 0.01) -> List[Dict]:
+    """Recall, precision and empty-result rate for thresholds from -1 to 1"""
+    table = []
+    answerable = [s for s in scored if s["relevant_best"] is not None]
+    for threshold in np.round(np.arange(-1.0, 1.0 + step / 2, step), 4):
+        passing = [(score, hit) for s in scored for score, hit in s["top"] if score >= threshold]
+        table.append({
+            "threshold": float(threshold),
+            "recall": round(sum(s["relevant_best"] >= threshold for s in answerable) / max(1, len(answerable)), 4),
+            "precision": round(sum(hit for _, hit in passing) / len(passing), 4) if passing else None,
+            "empty_rate": round(sum(s["top"][0][0] < threshold for s in scored) / max(1, len(scored)), 4),
+        })
+    return table
+
+
+def recommend(table: List[Dict], target_recall: float) -> Dict:
+    """Highest threshold that keeps recall at or above the target"""
+    eligible = [row for row in table if row["recall"] >= target_recall]
+    return max(eligible, key=lambda row: row["threshold"]) if eligible else table[0]
+
+
+def synthetic_labels(vector_store, num_queries: int, seed: int) -> List[Dict]:
+    """Ingest a synthetic corpus and label its generated queries with their source page"""
+    from synthetic_data import make_corpus, make_queries
+    from pdf_processor import PDFProcessor
+
+    documents = make_corpus(10, 10, 300, seed=seed)
+    upload_dir = settings.VECTOR_STORE_DIR.parent / "uploads"
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    processor = PDFProcessor()
+    for document in documents:
+        file_path = upload_dir / document["filename"]
+        file_path.write_bytes(document["pdf"])
+        _, chunks = processor.process_pdf(file_path, "calibration", document["filename"])
+        vector_store.add_documents("calibration", chunks)
+
+    return [
+        {
+            "user_id": "calibration",
+            "query": query["query"],
+            "relevant": [{"filename": query["filename"], "page_number": query["page_number"]}],
+        }
+        for query in make_queries(documents, num_queries, seed=seed + 1)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate COSINE_SIMILARITY_THRESHOLD")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--labels", help="Labeled queries (JSON lines)")
+    source.add_argument("--synthetic", type=int, metavar="QUERIES", help="Use a temporary synthetic corpus")
+    parser.add_argument("--provider", help="Embedding provider (default: EMBEDDING_PROVIDER)")
+    parser.add_argument("--top-k", type=int, default=settings.TOP_K_RESULTS)
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the full JSON report to this file")
+    args = parser.parse_args()
+
+    from embeddings import get_embedding_provider
+    from vector_store import VectorStore
+
+    work_dir = None
+    if args.synthetic:
+        work_dir = Path(tempfile.mkdtemp(prefix="velosify_calibration_"))
+        settings.VECTOR_STORE_DIR = work_dir / "vector_stores"
+        # Keep the synthetic PDFs' extractions out of the real text cache
+        settings.TEXT_CACHE_DIR = work_dir / "text_cache"
+    try:
+        vector_store = VectorStore(get_embedding_provider(args.provider))
+        if args.synthetic:
+            labeled = synthetic_labels(vector_store, args.synthetic, args.seed)
+        else:
+            with open(args.labels) as f:
+                labeled = [json.loads(line) for line in f if line.strip()]
+
+        scored = score_labeled_queries(vector_store, labeled, args.top_k)
+        table = threshold_table(scored)
+        best = recommend(table, args.target_recall)
+        current = min(table, key=lambda row: abs(row["threshold"] - settings.COSINE_SIMILARITY_THRESHOLD))
+        report = {
+            "queries": len(scored),
+            "provider": vector_store.embedder.signature,
+            "top_k": args.top_k,
+            "target_recall": args.target_recall,
+            "recommended": best,
+            "current": current,
+            "table": [row for row in table if round(row["threshold"] * 100) % 5 == 0],
+        }
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(json.dumps({key: value for key, value in report.items() if key != "table"}, indent=2))
+    print(f"COSINE_SIMILARITY_THRESHOLD={best['threshold']}", file=sys.stderr)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
@@ -0,0 +1,265 @@
+"""
+Chat Sessions Module
+Server-side conversation state for follow-up questions
+
+A session keeps the chunk set its last search retrieved, the query
+embedding that retrieved it (the session topic), the previous question
+and a compact running summary of earlier turns. Follow-ups close to the
+topic reuse the cached chunks instead of searching again; follow-ups that
+find nothing on their own ("explain the second point more") are searched
+again together with the previous question, and fall back to the cached
+chunks if that finds nothing either.
+
+Sessions are rows in SQLite (CHAT_SESSION_DB_PATH, WAL mode), so every
+worker sees the same sessions and the same invalidations: deleting,
+replacing or detaching a document drops its cached chunks, and uploading
+or attaching one drops the cached sets it could have been part of.
+
+Storage is bounded: each session holds at most CHAT_SESSION_MAX_CHUNKS
+chunks and CHAT_SESSION_SUMMARY_CHARS of summary, sessions expire after
+CHAT_SESSION_TTL_SECONDS idle, and the least recently used are evicted
+beyond CHAT_SESSION_MAX_SESSIONS.
+"""
+import json
+import pickle
+import secrets
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from config import settings
+from metrics import Counter, Gauge, register
+
+SESSION_TURNS = register(Counter(
+    "velosify_chat_session_turns_total",
+    "Session chat turns by retrieval outcome (cached, fresh, contextual, followup, none)",
+    ["outcome"]
+))
+ACTIVE_SESSIONS = register(Gauge("velosify_chat_sessions", "Live chat sessions"))
+
+# Longest question/answer excerpt kept per summary line
+_EXCERPT_CHARS = 200
+
+_COLUMNS = "session_id, user_id, document_ids, chunks, topic, last_query, summary, last_used"
+
+
+def _scope(document_ids: Optional[List[str]]) -> Optional[Tuple[str, ...]]:
+    return tuple(sorted(document_ids)) if document_ids else None
+
+
+def _excerpt(text: str) -> str:
+    """First sentence of a text, whitespace collapsed and capped"""
+    text = " ".join(text.split())
+    end = text.find(". ")
+    if 0 <= end < _EXCERPT_CHARS:
+        return text[:end + 1]
+    return text if len(text) <= _EXCERPT_CHARS else text[:_EXCERPT_CHARS - 3] + "..."
+
+
+class ChatSession:
+    """One conversation's retrieval cache and running summary, as loaded for a turn"""
+
+    __slots__ = (
+        "session_id", "user_id", "document_ids", "chunks", "topic", "last_query", "summary", "last_used"
+    )
+
+    def __init__(self, session_id: str, user_id: str):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.document_ids: Optional[Tuple[str, ...]] = None  # scope the chunks were retrieved for
+        self.chunks: List[Dict] = []
+        self.topic: Optional[np.ndarray] = None
+        self.last_query: Optional[str] = None
+        self.summary: List[str] = []  # one line per earlier turn, oldest first
+        self.last_used = time.time()
+
+    def cached_chunks(self, document_ids: Optional[List[str]]) -> List[Dict]:
+        """Cached chunks, if they were retrieved for the same documents"""
+        if self.topic is None or _scope(document_ids) != self.document_ids:
+            return []
+        return self.chunks
+
+    def topic_similarity(self, query_embedding: np.ndarray) -> float:
+        """Cosine similarity between a query and the session topic"""
+        if self.topic is None:
+            return 0.0
+        query_embedding = np.ravel(query_embedding)
+        denominator = float(np.linalg.norm(query_embedding) * np.linalg.norm(self.topic))
+        return float(np.dot(query_embedding, self.topic)) / denominator if denominator else 0.0
+
+    def history(self) -> str:
+        """Running summary for the prompt"""
+        return "\n".join(self.summary)
+
+
+class ChatSessionStore:
+    """Chat sessions stored in SQLite (WAL mode) with idle expiry and an LRU cap"""
+
+    def __init__(self, db_path: Optional[Path] = None, ttl_seconds: float = None, max_sessions: int = None):
+        self.db_path = db_path or settings.CHAT_SESSION_DB_PATH
+        self.ttl_seconds = settings.CHAT_SESSION_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_sessions = max_sessions or settings.CHAT_SESSION_MAX_SESSIONS
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # One connection per thread; sqlite3 connections are not thread-safe
+        self._local = threading.local()
+        self._create_schema()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Get this thread's database connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        """Create tables and indexes if they don't exist"""
+        conn = self._get_connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    document_ids TEXT,
+                    chunks BLOB,
+                    topic BLOB,
+                    last_query TEXT,
+                    summary TEXT NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_chat_sessions_user
+                ON chat_sessions (user_id)
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_chat_sessions_used
+                ON chat_sessions (last_used)
+            """)
+
+    def _from_row(self, row: tuple) -> ChatSession:
+        session_id, user_id, document_ids, chunks, topic, last_query, summary, last_used = row
+        session = ChatSession(session_id, user_id)
+        session.document_ids = None if document_ids is None else tuple(json.loads(document_ids))
+        session.chunks = pickle.loads(chunks) if chunks is not None else []
+        session.topic = None if topic is None else np.frombuffer(topic, dtype=np.float32).copy()
+        session.last_query = last_query
+        session.summary = json.loads(summary)
+        session.last_used = last_used
+        return session
+
+    def _save_chunks(self, conn: sqlite3.Connection, session: ChatSession):
+        conn.execute(
+            "UPDATE chat_sessions SET document_ids = ?, chunks = ?, topic = ? WHERE session_id = ?",
+            (
+                None if session.document_ids is None else json.dumps(session.document_ids),
+                pickle.dumps(session.chunks) if session.chunks else None,
+                None if session.topic is None else session.topic.tobytes(),
+                session.session_id
+            )
+        )
+
+    def get_or_create(self, user_id: str, session_id: Optional[str] = None) -> ChatSession:
+        """
+        The user's live session with this ID, or a new session
+        Unknown, expired or other users' IDs start a new session under a new ID
+        """
+        now = time.time()
+        conn = self._get_connection()
+        with conn:
+            conn.execute("DELETE FROM chat_sessions WHERE last_used < ?", (now - self.ttl_seconds,))
+            row = conn.execute(
+                f"SELECT {_COLUMNS} FROM chat_sessions WHERE session_id = ? AND user_id = ?",
+                (session_id, user_id)
+            ).fetchone() if session_id else None
+            if row is None:
+                session = ChatSession(secrets.token_urlsafe(16), user_id)
+                conn.execute(
+                    "INSERT INTO chat_sessions (session_id, user_id, summary, last_used) VALUES (?, ?, ?, ?)",
+                    (session.session_id, user_id, "[]", now)
+                )
+                # Evict the least recently used beyond the cap
+                conn.execute(
+                    "DELETE FROM chat_sessions WHERE session_id IN ("
+                    "SELECT session_id FROM chat_sessions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_sessions,)
+                )
+            else:
+                session = self._from_row(row)
+                conn.execute(
+                    "UPDATE chat_sessions SET last_used = ? WHERE session_id = ?", (now, session.session_id)
+                )
+            session.last_used = now
+            ACTIVE_SESSIONS.set(conn.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0])
+        return session
+
+    def remember_chunks(
+        self,
+        session: ChatSession,
+        chunks: List[Dict],
+        topic: np.ndarray,
+        document_ids: Optional[List[str]]
+    ):
+        """Replace the session's cached chunk set and topic"""
+        session.chunks = list(chunks[:settings.CHAT_SESSION_MAX_CHUNKS])
+        session.topic = np.array(np.ravel(topic), dtype=np.float32)
+        session.document_ids = _scope(document_ids)
+        conn = self._get_connection()
+        with conn:
+            self._save_chunks(conn, session)
+
+    def record_turn(self, session: ChatSession, query: str, answer: str):
+        """Add a turn to the running summary, dropping the oldest lines beyond the limit"""
+        session.last_query = query
+        session.summary.append(f"Q: {_excerpt(query)} A: {_excerpt(answer)}")
+        limit = settings.CHAT_SESSION_SUMMARY_CHARS
+        while len(session.summary) > 1 and sum(len(line) + 1 for line in session.summary) > limit:
+            session.summary.pop(0)
+        conn = self._get_connection()
+        with conn:
+            conn.execute(
+                "UPDATE chat_sessions SET last_query = ?, summary = ? WHERE session_id = ?",
+                (query, json.dumps(session.summary), session.session_id)
+            )
+
+    def end(self, user_id: str, session_id: str) -> bool:
+        """Drop a session; False if the user has no such session"""
+        conn = self._get_connection()
+        with conn:
+            deleted = conn.execute(
+                "DELETE FROM chat_sessions WHERE session_id = ? AND user_id = ?", (session_id, user_id)
+            ).rowcount
+            ACTIVE_SESSIONS.set(conn.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0])
+        return deleted > 0
+
+    def _cached_sessions(self, conn: sqlite3.Connection, user_id: str) -> List[ChatSession]:
+        rows = conn.execute(
+            f"SELECT {_COLUMNS} FROM chat_sessions WHERE user_id = ? AND topic IS NOT NULL", (user_id,)
+        ).fetchall()
+        return [self._from_row(row) for row in rows]
+
+    def forget_document(self, user_id: str, document_id: str):
+        """Drop a deleted or replaced document's chunks from the user's sessions"""
+        conn = self._get_connection()
+        with conn:
+            for session in self._cached_sessions(conn, user_id):
+                chunks = [chunk for chunk in session.chunks if chunk["document_id"] != document_id]
+                if len(chunks) == len(session.chunks):
+                    continue
+                session.chunks = chunks
+                if not chunks:
+                    session.topic = None
+                self._save_chunks(conn, session)
+
+    def document_added(self, user_id: str, document_id: str):
+        """Drop the user's cached chunk sets a new or attached document could have been part of"""
+        conn = self._get_connection()
+        with conn:
+            for session in self._cached_sessions(conn, user_id):
+                if session.document_ids is None or document_id in session.document_ids:
+                    session.chunks, session.topic, session.document_ids = [], None, None
+                    self._save_chunks(conn, session)
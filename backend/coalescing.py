@@ -0,0 +1,90 @@
+"""
+Request Coalescing Module
+Single-flight execution of identical generations with a short-lived result cache
+
+Concurrent callers with the same key share one in-flight call, which runs
+in the thread pool as its own task so a disconnecting caller doesn't
+cancel it for the others. Successful results are kept for a few seconds
+to absorb the tail of a burst.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+from starlette.concurrency import run_in_threadpool
+from config import settings
+from metrics import Counter, register
+
+GENERATION_REQUESTS = register(Counter(
+    "velosify_generation_requests_total",
+    "Generation requests by outcome (computed, coalesced, cached, artifact_cache)",
+    ["kind", "outcome"]
+))
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with equal keys"""
+
+    def __init__(self, ttl_seconds: float = None, max_entries: int = None):
+        self.ttl_seconds = settings.GENERATION_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self.max_entries = max_entries or settings.GENERATION_CACHE_MAX_ENTRIES
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        # {key: (expires_at, result)}, oldest first
+        self._results: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def _get_cached(self, key: Hashable):
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        expires_at, result = entry
+        if expires_at < time.monotonic():
+            del self._results[key]
+            return None
+        return result
+
+    def _store(self, key: Hashable, result: Any):
+        if self.ttl_seconds <= 0:
+            return
+        self._results[key] = (time.monotonic() + self.ttl_seconds, result)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            self._results.popitem(last=False)
+
+    async def run(
+        self,
+        kind: str,
+        key: Hashable,
+        func: Callable,
+        *args,
+        refresh: bool = False,
+        **kwargs
+    ):
+        """
+        Return func(*args, **kwargs), sharing the call with concurrent callers
+        that use the same key. Results with success=False are not cached;
+        refresh skips the cached result but still joins an in-flight call.
+        """
+        key = (kind, key)
+        cached = None if refresh else self._get_cached(key)
+        if cached is not None:
+            GENERATION_REQUESTS.inc(kind, "cached")
+            return cached
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            GENERATION_REQUESTS.inc(kind, "coalesced")
+            return await asyncio.shield(task)
+
+        GENERATION_REQUESTS.inc(kind, "computed")
+        task = asyncio.ensure_future(run_in_threadpool(func, *args, **kwargs))
+        self._in_flight[key] = task
+
+        def finished(done: asyncio.Future):
+            self._in_flight.pop(key, None)
+            if not done.cancelled() and done.exception() is None:
+                result = done.result()
+                if getattr(result, "success", True):
+                    self._store(key, result)
+
+        task.add_done_callback(finished)
+        return await asyncio.shield(task)
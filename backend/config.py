@@ -26,28 +26,145 @@ class Settings:
     BASE_DIR: Path = Path(__file__).parent
     UPLOAD_DIR: Path = BASE_DIR / os.getenv("UPLOAD_DIR", "uploads")
     VECTOR_STORE_DIR: Path = BASE_DIR / os.getenv("VECTOR_STORE_DIR", "vector_stores")
+    VECTOR_STORE_ENGINE: str = os.getenv("VECTOR_STORE_ENGINE", "per_user")  # per_user, shared
+    SHARED_INDEX_DIR: Path = BASE_DIR / os.getenv("SHARED_INDEX_DIR", "shared_index")
+    SHARED_INDEX_SHARDS: int = int(os.getenv("SHARED_INDEX_SHARDS", "16"))
+    CONTENT_STORE_DIR: Path = BASE_DIR / os.getenv("CONTENT_STORE_DIR", "content_store")
+    
+    # Metadata Store Configuration
+    METADATA_BACKEND: str = os.getenv("METADATA_BACKEND", "sqlite")
+    METADATA_DB_PATH: Path = BASE_DIR / os.getenv("METADATA_DB_PATH", "metadata.db")
+    
+    # Text Extraction (extractors tried in this order for each file type)
+    EXTRACTORS: list = [
+        name.strip() for name in os.getenv(
+            "EXTRACTORS", "pymupdf,pdfium,pypdf2,docx,pptx,markdown,text"
+        ).split(",") if name.strip()
+    ]
+    EXTRACT_PAGE_TIMEOUT_S: float = float(os.getenv("EXTRACT_PAGE_TIMEOUT_S", "10"))
+    EXTRACT_VIRTUAL_PAGE_CHARS: int = int(os.getenv("EXTRACT_VIRTUAL_PAGE_CHARS", "3000"))
+    
+    # Extracted Text Cache (compressed page text and chunks by file hash)
+    TEXT_CACHE_ENABLED: bool = os.getenv("TEXT_CACHE_ENABLED", "true").lower() == "true"
+    TEXT_CACHE_DIR: Path = BASE_DIR / os.getenv("TEXT_CACHE_DIR", "text_cache")
+    
+    # Streaming Ingest (chunks embedded and appended to the index per batch)
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "256"))
     
     # File Upload Limits
     MAX_FILE_SIZE_MB: int = int(os.getenv("MAX_FILE_SIZE_MB", "50"))
     MAX_FILE_SIZE_BYTES: int = MAX_FILE_SIZE_MB * 1024 * 1024
-    ALLOWED_EXTENSIONS: set = {"pdf"}
     
     # RAG Configuration
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
     TOP_K_RESULTS: int = 5
     SIMILARITY_THRESHOLD: float = 0.7
+    # cosine (normalized vectors, inner product) or l2 (legacy indexes)
+    VECTOR_METRIC: str = os.getenv("VECTOR_METRIC", "cosine")
+    # Placeholder default, not calibrated for any provider; set it from calibration.py
+    COSINE_SIMILARITY_THRESHOLD: float = float(os.getenv("COSINE_SIMILARITY_THRESHOLD", "0.6"))
+    
+    # Vector Quantization (none, fp16, int8, pq); users can override
+    VECTOR_QUANTIZATION: str = os.getenv("VECTOR_QUANTIZATION", "none")
+    VECTOR_PQ_SUBQUANTIZERS: int = int(os.getenv("VECTOR_PQ_SUBQUANTIZERS", "0"))  # 0 = dimension / 4
+    VECTOR_RESCORE_FACTOR: int = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+    VECTOR_CODES_CACHE_USERS: int = int(os.getenv("VECTOR_CODES_CACHE_USERS", "64"))
+    
+    # Re-ranking Configuration
+    RERANK_ENABLED: bool = os.getenv("RERANK_ENABLED", "false").lower() == "true"
+    RERANK_MODEL: str = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    RERANK_CANDIDATES: int = int(os.getenv("RERANK_CANDIDATES", "20"))
+    RERANK_TOP_N: int = int(os.getenv("RERANK_TOP_N", "3"))
+    RERANK_BATCH_SIZE: int = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+    RERANK_BUDGET_MS: float = float(os.getenv("RERANK_BUDGET_MS", "150"))
+    
+    # Chat Sessions (cached retrieval and running summary for follow-ups)
+    CHAT_SESSIONS_ENABLED: bool = os.getenv("CHAT_SESSIONS_ENABLED", "true").lower() == "true"
+    CHAT_SESSION_DB_PATH: Path = BASE_DIR / os.getenv("CHAT_SESSION_DB_PATH", "chat_sessions.db")
+    CHAT_SESSION_TTL_SECONDS: float = float(os.getenv("CHAT_SESSION_TTL_SECONDS", "1800"))
+    CHAT_SESSION_MAX_SESSIONS: int = int(os.getenv("CHAT_SESSION_MAX_SESSIONS", "1000"))
+    CHAT_SESSION_MAX_CHUNKS: int = int(os.getenv("CHAT_SESSION_MAX_CHUNKS", "10"))
+    CHAT_SESSION_SUMMARY_CHARS: int = int(os.getenv("CHAT_SESSION_SUMMARY_CHARS", "1500"))
+    # Follow-ups at least this similar to the session topic reuse its chunks
+    CHAT_SESSION_TOPIC_THRESHOLD: float = float(os.getenv("CHAT_SESSION_TOPIC_THRESHOLD", "0.75"))
     
     # LLM Configuration
     MODEL_NAME: str = "gemini-pro"
     EMBEDDING_MODEL: str = "models/embedding-001"
+    
+    # Embedding Provider Configuration
+    EMBEDDING_PROVIDER: str = os.getenv("EMBEDDING_PROVIDER", "google")  # google, local, fake
+    LOCAL_EMBEDDING_MODEL: str = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    EMBEDDING_THREADS: int = int(os.getenv("EMBEDDING_THREADS", "0"))  # 0 = torch default
+    EMBEDDING_QUANTIZE: str = os.getenv("EMBEDDING_QUANTIZE", "none")  # none, int8
+    FAKE_EMBEDDING_DIMENSION: int = int(os.getenv("FAKE_EMBEDDING_DIMENSION", "768"))
+    EMBEDDING_AUTO_MIGRATE: bool = os.getenv("EMBEDDING_AUTO_MIGRATE", "false").lower() == "true"
     TEMPERATURE: float = 0.3
     MAX_OUTPUT_TOKENS: int = 2048
+    BATCH_CHAT_CONCURRENCY: int = int(os.getenv("BATCH_CHAT_CONCURRENCY", "4"))
+    LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "google")  # google, mock
+    
+    # LLM Scheduler (adaptive concurrency, priorities, fair queuing)
+    LLM_SCHEDULER_ENABLED: bool = os.getenv("LLM_SCHEDULER_ENABLED", "true").lower() == "true"
+    LLM_INITIAL_CONCURRENCY: int = int(os.getenv("LLM_INITIAL_CONCURRENCY", "4"))
+    LLM_MIN_CONCURRENCY: int = int(os.getenv("LLM_MIN_CONCURRENCY", "1"))
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    LLM_LATENCY_TARGET_MS: float = float(os.getenv("LLM_LATENCY_TARGET_MS", "20000"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_INTERACTIVE_DEADLINE_S: float = float(os.getenv("LLM_INTERACTIVE_DEADLINE_S", "30"))
+    LLM_BATCH_DEADLINE_S: float = float(os.getenv("LLM_BATCH_DEADLINE_S", "120"))
+    
+    # Generation Coalescing (notes, quiz, planner)
+    COALESCE_GENERATIONS: bool = os.getenv("COALESCE_GENERATIONS", "true").lower() == "true"
+    GENERATION_CACHE_TTL_SECONDS: float = float(os.getenv("GENERATION_CACHE_TTL_SECONDS", "30"))
+    GENERATION_CACHE_MAX_ENTRIES: int = int(os.getenv("GENERATION_CACHE_MAX_ENTRIES", "256"))
+    
+    # Artifact Cache (persisted notes, quizzes, study plans)
+    ARTIFACT_CACHE_ENABLED: bool = os.getenv("ARTIFACT_CACHE_ENABLED", "true").lower() == "true"
+    ARTIFACT_CACHE_DB_PATH: Path = BASE_DIR / os.getenv("ARTIFACT_CACHE_DB_PATH", "artifacts.db")
+    ARTIFACT_CACHE_MAX_BYTES: int = int(os.getenv("ARTIFACT_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+    
+    # Shared Document Library (published once, attached by reference)
+    LIBRARY_DB_PATH: Path = BASE_DIR / os.getenv("LIBRARY_DB_PATH", "library.db")
+    LIBRARY_AUTO_ATTACH: bool = os.getenv("LIBRARY_AUTO_ATTACH", "true").lower() == "true"
+    
+    # Mock Services (LLM_PROVIDER=mock / EMBEDDING_PROVIDER=fake)
+    MOCK_LATENCY_DISTRIBUTION: str = os.getenv("MOCK_LATENCY_DISTRIBUTION", "normal")  # normal, lognormal, exponential
+    MOCK_LLM_LATENCY_MS: float = float(os.getenv("MOCK_LLM_LATENCY_MS", "0"))
+    MOCK_LLM_JITTER_MS: float = float(os.getenv("MOCK_LLM_JITTER_MS", "0"))
+    MOCK_LLM_FAILURE_RATE: float = float(os.getenv("MOCK_LLM_FAILURE_RATE", "0"))
+    MOCK_EMBEDDING_LATENCY_MS: float = float(os.getenv("MOCK_EMBEDDING_LATENCY_MS", "0"))
+    MOCK_EMBEDDING_JITTER_MS: float = float(os.getenv("MOCK_EMBEDDING_JITTER_MS", "0"))
+    MOCK_EMBEDDING_FAILURE_RATE: float = float(os.getenv("MOCK_EMBEDDING_FAILURE_RATE", "0"))
+    
+    # Study Planner Configuration
+    PLANNER_MAX_DAYS: int = int(os.getenv("PLANNER_MAX_DAYS", "365"))
+    PLANNER_MAX_TOPICS: int = int(os.getenv("PLANNER_MAX_TOPICS", "24"))
+    PLANNER_LLM_LABELS: bool = os.getenv("PLANNER_LLM_LABELS", "true").lower() == "true"
+    PLANNER_WEAK_TOPIC_WEIGHT: float = float(os.getenv("PLANNER_WEAK_TOPIC_WEIGHT", "1.5"))
+    PLANNER_REVISION_SHARE: float = float(os.getenv("PLANNER_REVISION_SHARE", "0.2"))
+    PLANNER_REVISION_INTERVALS: list = [
+        int(days) for days in os.getenv("PLANNER_REVISION_INTERVALS", "1,3,7").split(",") if days.strip()
+    ]
+    
+    # Startup Configuration
+    WARMUP_SERVICES: bool = os.getenv("WARMUP_SERVICES", "false").lower() == "true"
+    IMPORT_TIME_BUDGET_MS: float = float(os.getenv("IMPORT_TIME_BUDGET_MS", "800"))
+    
+    # Metrics Configuration
+    METRICS_ENABLED: bool = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    
+    # Admin & Profiling Configuration
+    ADMIN_TOKEN: str = os.getenv("ADMIN_TOKEN", "")  # Admin endpoints are disabled when empty
+    PROFILE_DIR: Path = BASE_DIR / os.getenv("PROFILE_DIR", "profiles")
     
     def __init__(self):
         """Create necessary directories on initialization"""
         self.UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
         self.VECTOR_STORE_DIR.mkdir(parents=True, exist_ok=True)
+        self.CONTENT_STORE_DIR.mkdir(parents=True, exist_ok=True)
     
     def validate(self) -> bool:
         """Validate that required settings are present"""
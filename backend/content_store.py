@@ -0,0 +1,223 @@
+"""
+Content Store Module
+Shares extracted chunks and embeddings between identical uploads
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from config import settings
+
+class ContentStore:
+    """
+    Content-addressed cache of processed documents
+
+    Entries are keyed by the SHA-256 of the uploaded bytes, so the same
+    file uploaded by different users is extracted, chunked and embedded
+    only once. Chunks are stored without user-specific fields and are
+    stamped with the caller's document_id/filename on reuse. Embeddings
+    are kept per embedding signature, since vectors from different
+    providers are not interchangeable.
+    """
+
+    def __init__(self, base_dir: Optional[Path] = None):
+        self.base_dir = base_dir or settings.CONTENT_STORE_DIR
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+
+    def _get_entry_dir(self, content_hash: str) -> Path:
+        """Get directory holding a content entry"""
+        return self.base_dir / content_hash[:2] / content_hash
+
+    def _get_embeddings_path(self, entry_dir: Path, embedding_signature: str) -> Path:
+        """Get path of an entry's embeddings for one provider"""
+        key = hashlib.sha256(embedding_signature.encode()).hexdigest()[:16]
+        return entry_dir / f"embeddings-{key}.npy"
+
+    def get(self, content_hash: str, embedding_signature: str) -> Optional[Dict]:
+        """
+        Load a processed entry for the given content hash
+        Returns: {"total_pages", "chunks", "embeddings"} or None
+        """
+        entry_dir = self._get_entry_dir(content_hash)
+        info_path = entry_dir / "info.json"
+        embeddings_path = self._get_embeddings_path(entry_dir, embedding_signature)
+
+        if not info_path.exists() or not embeddings_path.exists():
+            return None
+
+        try:
+            with open(info_path, 'r') as f:
+                info = json.load(f)
+            chunks = self._read_chunks(entry_dir / "chunks.pkl")
+            embeddings = np.load(embeddings_path)
+        except Exception as e:
+            print(f"Error reading content store entry {content_hash}: {e}")
+            return None
+
+        return {
+            "total_pages": info["total_pages"],
+            "chunks": chunks,
+            "embeddings": embeddings
+        }
+
+    def _read_chunks(self, chunks_path: Path) -> List[Dict]:
+        """Chunk templates from a file of one or more pickled lists"""
+        chunks = []
+        with open(chunks_path, 'rb') as f:
+            while True:
+                try:
+                    chunks.extend(pickle.load(f))
+                except EOFError:
+                    return chunks
+
+    def _templates(self, chunks: List[Dict]) -> List[Dict]:
+        """Strip user-specific fields before sharing"""
+        return [
+            {
+                "page_number": chunk["page_number"],
+                "page_hash": chunk.get("page_hash"),
+                "chunk_index": chunk["chunk_index"],
+                "text": chunk["text"]
+            }
+            for chunk in chunks
+        ]
+
+    def _add_embeddings(self, entry_dir: Path, embeddings: np.ndarray, embedding_signature: str):
+        """Add embeddings for another provider to an existing entry"""
+        embeddings_path = self._get_embeddings_path(entry_dir, embedding_signature)
+        if not embeddings_path.exists():
+            tmp_path = embeddings_path.with_suffix(".tmp.npy")
+            np.save(tmp_path, np.asarray(embeddings, dtype=np.float32))
+            os.replace(tmp_path, embeddings_path)
+
+    def _make_tmp_dir(self, content_hash: str) -> Path:
+        """Empty directory to build a new entry in"""
+        tmp_dir = self._get_entry_dir(content_hash).with_name(f"{content_hash}.tmp")
+        if tmp_dir.exists():
+            shutil.rmtree(tmp_dir)
+        tmp_dir.mkdir(parents=True)
+        return tmp_dir
+
+    def _finish_entry(
+        self,
+        content_hash: str,
+        tmp_dir: Path,
+        total_pages: int,
+        chunk_count: int,
+        embeddings: np.ndarray,
+        embedding_signature: str
+    ):
+        """Write embeddings and info next to chunks.pkl and publish the entry"""
+        np.save(
+            self._get_embeddings_path(tmp_dir, embedding_signature),
+            np.asarray(embeddings, dtype=np.float32)
+        )
+        with open(tmp_dir / "info.json", 'w') as f:
+            json.dump({
+                "total_pages": total_pages,
+                "chunk_count": chunk_count
+            }, f)
+
+        # Rename so readers never observe a partially written entry
+        try:
+            tmp_dir.rename(self._get_entry_dir(content_hash))
+        except OSError:
+            # Another worker stored the same content concurrently
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def put(
+        self,
+        content_hash: str,
+        total_pages: int,
+        chunks: List[Dict],
+        embeddings: np.ndarray,
+        embedding_signature: str
+    ):
+        """Store processed chunks and embeddings for a content hash"""
+        entry_dir = self._get_entry_dir(content_hash)
+        if (entry_dir / "info.json").exists():
+            # Chunks already shared; add embeddings for this provider if missing
+            self._add_embeddings(entry_dir, embeddings, embedding_signature)
+            return
+
+        templates = self._templates(chunks)
+        tmp_dir = self._make_tmp_dir(content_hash)
+        with open(tmp_dir / "chunks.pkl", 'wb') as f:
+            pickle.dump(templates, f)
+        self._finish_entry(content_hash, tmp_dir, total_pages, len(templates), embeddings, embedding_signature)
+
+    def put_stream(
+        self,
+        content_hash: str,
+        total_pages: int,
+        batches: Iterable[Tuple[List[Dict], np.ndarray]],
+        embedding_signature: str
+    ) -> int:
+        """
+        Store a document arriving as (chunks, embeddings) batches
+        Chunk templates and embeddings are both spooled to disk as batches
+        pass through (chunks.pkl holds one pickled list per batch), so
+        nothing accumulates in memory
+        Returns: number of chunks consumed
+        """
+        spool_prefix = f"{content_hash}.{os.getpid()}"
+        chunks_spool = self.base_dir / f"{spool_prefix}.chunks.spool"
+        vectors_spool = self.base_dir / f"{spool_prefix}.vectors.spool"
+        count = 0
+        dimension = None
+        try:
+            with open(chunks_spool, 'wb') as chunk_file, open(vectors_spool, 'wb') as vector_file:
+                for chunks, embeddings in batches:
+                    pickle.dump(self._templates(chunks), chunk_file)
+                    vector_file.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+                    count += len(chunks)
+                    dimension = embeddings.shape[1]
+            if count:
+                embeddings = np.memmap(vectors_spool, dtype=np.float32, mode='r', shape=(count, dimension))
+                entry_dir = self._get_entry_dir(content_hash)
+                if (entry_dir / "info.json").exists():
+                    self._add_embeddings(entry_dir, embeddings, embedding_signature)
+                else:
+                    tmp_dir = self._make_tmp_dir(content_hash)
+                    os.replace(chunks_spool, tmp_dir / "chunks.pkl")
+                    self._finish_entry(
+                        content_hash, tmp_dir, total_pages, count, embeddings, embedding_signature
+                    )
+                del embeddings
+        finally:
+            chunks_spool.unlink(missing_ok=True)
+            vectors_spool.unlink(missing_ok=True)
+        return count
+
+    def materialize_chunks(
+        self,
+        entry: Dict,
+        document_id: str,
+        filename: str,
+        content_hash: str
+    ) -> List[Dict]:
+        """Stamp shared chunk templates with a user's document identity"""
+        return [
+            {
+                "document_id": document_id,
+                "filename": filename,
+                "content_hash": content_hash,
+                "page_number": chunk["page_number"],
+                "page_hash": chunk.get("page_hash"),
+                "chunk_index": chunk["chunk_index"],
+                "text": chunk["text"]
+            }
+            for chunk in entry["chunks"]
+        ]
+
+    def delete(self, content_hash: str) -> bool:
+        """Remove a content entry"""
+        entry_dir = self._get_entry_dir(content_hash)
+        if not entry_dir.exists():
+            return False
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        return True
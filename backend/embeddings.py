@@ -0,0 +1,210 @@
+"""
+Embeddings Module
+Pluggable embedding providers: Gemini API, local CPU model, deterministic fake
+"""
+import hashlib
+import re
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import List
+import numpy as np
+from config import settings
+from startup import timed
+
+class EmbeddingProvider(ABC):
+    """Interface for embedding backends"""
+
+    name: str = ""
+
+    @property
+    @abstractmethod
+    def model(self) -> str:
+        """Model identifier"""
+
+    @property
+    @abstractmethod
+    def dimension(self) -> int:
+        """Embedding dimension"""
+
+    @property
+    def signature(self) -> str:
+        """
+        Identifies the vector space; indexes built with a different
+        signature are not comparable with this provider's vectors
+        """
+        return f"{self.name}:{self.model}:{self.dimension}"
+
+    def load(self):
+        """Load the client or model eagerly (no-op by default)"""
+
+    @abstractmethod
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        """Embed texts for indexing. Returns float32 array (n, dimension)"""
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed queries. Returns float32 array (n, dimension)"""
+        return self.embed_documents(queries)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a single query. Returns float32 array (1, dimension)"""
+        return self.embed_queries([query])
+
+
+class GoogleEmbeddingProvider(EmbeddingProvider):
+    """Gemini embeddings through the Google Generative AI API"""
+
+    name = "google"
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def model(self) -> str:
+        return settings.EMBEDDING_MODEL
+
+    @property
+    def dimension(self) -> int:
+        return 768  # Gemini embedding dimension
+
+    @property
+    def client(self):
+        """Gemini embeddings client, created on first access"""
+        if self._client is None:
+            with timed("embeddings.google"):
+                from langchain_google_genai import GoogleGenerativeAIEmbeddings
+                self._client = GoogleGenerativeAIEmbeddings(
+                    model=settings.EMBEDDING_MODEL,
+                    google_api_key=settings.GOOGLE_API_KEY
+                )
+        return self._client
+
+    def load(self):
+        self.client
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        return np.array(self.client.embed_documents(texts), dtype=np.float32)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return np.array([self.client.embed_query(query)], dtype=np.float32)
+
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    sentence-transformers model running on CPU
+
+    Texts are encoded in batches of EMBEDDING_BATCH_SIZE using
+    EMBEDDING_THREADS torch threads. With EMBEDDING_QUANTIZE=int8 the
+    model's linear layers are dynamically quantized to int8.
+    """
+
+    name = "local"
+
+    def __init__(self):
+        self._model = None
+
+    @property
+    def model(self) -> str:
+        suffix = "+int8" if settings.EMBEDDING_QUANTIZE == "int8" else ""
+        return settings.LOCAL_EMBEDDING_MODEL + suffix
+
+    @property
+    def encoder(self):
+        """Loaded SentenceTransformer, created on first access"""
+        if self._model is None:
+            with timed("embeddings.local"):
+                import torch
+                from sentence_transformers import SentenceTransformer
+
+                if settings.EMBEDDING_THREADS > 0:
+                    torch.set_num_threads(settings.EMBEDDING_THREADS)
+
+                model = SentenceTransformer(settings.LOCAL_EMBEDDING_MODEL, device="cpu")
+                if settings.EMBEDDING_QUANTIZE == "int8":
+                    model = torch.quantization.quantize_dynamic(
+                        model, {torch.nn.Linear}, dtype=torch.qint8
+                    )
+                self._model = model
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        return self.encoder.get_sentence_embedding_dimension()
+
+    def load(self):
+        self.encoder
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        embeddings = self.encoder.encode(
+            texts,
+            batch_size=settings.EMBEDDING_BATCH_SIZE,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+
+
+@lru_cache(maxsize=65536)
+def _token_vector(dimension: int, token: str) -> np.ndarray:
+    """Fixed pseudo-random vector for a token (shared by all fake providers)"""
+    seed = int.from_bytes(hashlib.sha256(token.encode()).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+
+
+class FakeEmbeddingProvider(EmbeddingProvider):
+    """
+    Deterministic hashed bag-of-words embeddings for benchmarks and tests
+
+    Each token maps to a fixed pseudo-random vector; a text embeds to the
+    normalized sum of its tokens, so texts sharing words are close.
+    No network, no model download, identical output on every machine.
+    """
+
+    name = "fake"
+
+    def __init__(self, dimension: int = None, latency=None):
+        from mock_services import LatencyModel
+
+        self._dimension = dimension or settings.FAKE_EMBEDDING_DIMENSION
+        # Optional simulated API latency/failures for load tests
+        self.latency = latency or LatencyModel(
+            settings.MOCK_EMBEDDING_LATENCY_MS,
+            settings.MOCK_EMBEDDING_JITTER_MS,
+            settings.MOCK_EMBEDDING_FAILURE_RATE,
+            settings.MOCK_LATENCY_DISTRIBUTION
+        )
+
+    @property
+    def model(self) -> str:
+        return "hashed-bow"
+
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self._dimension, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            vector += _token_vector(self._dimension, token)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def embed_documents(self, texts: List[str]) -> np.ndarray:
+        self.latency.simulate()
+        if not texts:
+            return np.empty((0, self._dimension), dtype=np.float32)
+        return np.stack([self._embed(text) for text in texts])
+
+
+EMBEDDING_PROVIDERS = {
+    "google": GoogleEmbeddingProvider,
+    "local": LocalEmbeddingProvider,
+    "fake": FakeEmbeddingProvider,
+}
+
+
+def get_embedding_provider(name: str = None) -> EmbeddingProvider:
+    """Create the configured embedding provider"""
+    name = name or settings.EMBEDDING_PROVIDER
+    if name not in EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown embedding provider: {name}")
+    return EMBEDDING_PROVIDERS[name]()
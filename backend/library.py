@@ -0,0 +1,422 @@
+"""
+Document Library Module
+Shared textbooks published once and attached to many workspaces
+
+A published document keeps a single copy of its file, chunks and vectors
+under its own library namespace (`__library__<document_id>`) in the
+configured vector store and upload directory. Users attach it by
+reference: an attachment is one SQLite row, with no copying and no
+embedding calls.
+
+Storage is reference-counted. Each attachment holds a reference, and so
+does the catalog entry while the document is published. Unpublishing
+stops new attachments; the file and vectors are freed when the last
+reference goes.
+
+Searches go through LibraryVectorStore, which embeds the query once and
+merges hits from the user's private index with those from their
+attached documents.
+"""
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from config import settings
+from models import DocumentMetadata, IngestStatus, LibraryDocument
+
+# Namespace prefix for library documents in the vector store and uploads
+LIBRARY_USER_ID = "__library__"
+
+
+def library_namespace(document_id: str) -> str:
+    """Vector store and upload namespace holding one library document"""
+    return f"{LIBRARY_USER_ID}{document_id}"
+
+
+class DocumentLibrary:
+    """Published documents and per-user attachments in SQLite (WAL mode)"""
+
+    def __init__(self, vector_store, metadata_store, pdf_processor, db_path: Optional[Path] = None):
+        self.vector_store = vector_store
+        self.metadata_store = metadata_store
+        self.pdf_processor = pdf_processor
+        self.db_path = db_path or settings.LIBRARY_DB_PATH
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # One connection per thread; sqlite3 connections are not thread-safe
+        self._local = threading.local()
+        self._create_schema()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Get this thread's database connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        """Create tables and indexes if they don't exist"""
+        conn = self._get_connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS library_documents (
+                    document_id TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    metadata TEXT NOT NULL,
+                    published INTEGER NOT NULL DEFAULT 1,
+                    published_by TEXT,
+                    published_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS library_attachments (
+                    user_id TEXT NOT NULL,
+                    document_id TEXT NOT NULL REFERENCES library_documents (document_id),
+                    attached_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, document_id)
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_library_attachments_doc
+                ON library_attachments (document_id)
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_library_documents_hash
+                ON library_documents (content_hash)
+            """)
+
+    def _to_metadata(self, payload: str) -> DocumentMetadata:
+        return DocumentMetadata.parse_raw(payload).copy(update={"shared": True})
+
+    # ------------------------------------------------------------------
+    # Catalog
+    # ------------------------------------------------------------------
+
+    def publish(self, user_id: str, document_id: str) -> Optional[DocumentMetadata]:
+        """
+        Move a user's document into the library and attach it back to them
+        Chunks and vectors are copied from the user's index, not re-embedded;
+        the private copy is then deleted
+        Returns: library metadata, or None if the user has no such ready document
+        """
+        metadata = self.metadata_store.get_document(user_id, document_id)
+        if metadata is None or metadata.status != IngestStatus.READY:
+            return None
+
+        published = self.find_published(metadata.content_hash) if metadata.content_hash else None
+        if published is None:
+            library_id = self.pdf_processor.generate_document_id(
+                LIBRARY_USER_ID, metadata.content_hash or document_id
+            )
+            namespace = library_namespace(library_id)
+            if self.get_document(library_id) is None:
+                # Drop rows left by an interrupted publish before copying
+                self.vector_store.delete_document(namespace, library_id)
+                self._copy_document(user_id, document_id, namespace, library_id)
+            published = metadata.copy(update={"document_id": library_id})
+            conn = self._get_connection()
+            with conn:
+                # A document unpublished but still referenced is published again
+                conn.execute(
+                    "INSERT INTO library_documents "
+                    "(document_id, content_hash, metadata, published, published_by, published_at) "
+                    "VALUES (?, ?, ?, 1, ?, ?) "
+                    "ON CONFLICT (document_id) DO UPDATE SET published = 1",
+                    (library_id, metadata.content_hash or "", published.json(), user_id, time.time())
+                )
+
+        self.attach(user_id, published.document_id)
+        self.vector_store.delete_document(user_id, document_id)
+        self.metadata_store.delete_document(user_id, document_id)
+        self.pdf_processor.delete_document_files(user_id, document_id)
+        return self.get_document(published.document_id)
+
+    def _copy_document(self, user_id: str, document_id: str, namespace: str, library_id: str):
+        """Copy a document's chunks, vectors and file into its library namespace"""
+        vectors, metadata = self.vector_store.load_index(user_id)
+        rows = [i for i, chunk in enumerate(metadata) if chunk["document_id"] == document_id]
+        if rows:
+            self.vector_store.add_documents(
+                namespace,
+                [{**metadata[i], "document_id": library_id} for i in rows],
+                embeddings=np.asarray(vectors[rows], dtype=np.float32)
+            )
+        for file_path in (settings.UPLOAD_DIR / user_id).glob(f"{document_id}_*"):
+            self.pdf_processor.save_uploaded_file(
+                file_path.read_bytes(), namespace, file_path.name[len(document_id) + 1:], library_id
+            )
+
+    def unpublish(self, document_id: str) -> bool:
+        """
+        Remove a document from the catalog; existing attachments keep working
+        Returns: False if it was not published
+        """
+        conn = self._get_connection()
+        with conn:
+            cursor = conn.execute(
+                "UPDATE library_documents SET published = 0 WHERE document_id = ? AND published = 1",
+                (document_id,)
+            )
+        if cursor.rowcount == 0:
+            return False
+        self._release(document_id)
+        return True
+
+    def get_document(self, document_id: str) -> Optional[DocumentMetadata]:
+        """Library metadata of a document, published or still referenced"""
+        row = self._get_connection().execute(
+            "SELECT metadata FROM library_documents WHERE document_id = ?", (document_id,)
+        ).fetchone()
+        return self._to_metadata(row[0]) if row else None
+
+    def find_published(self, content_hash: str) -> Optional[DocumentMetadata]:
+        """Published document with these bytes, if any"""
+        row = self._get_connection().execute(
+            "SELECT metadata FROM library_documents WHERE content_hash = ? AND published = 1",
+            (content_hash,)
+        ).fetchone()
+        return self._to_metadata(row[0]) if row else None
+
+    def list_published(self) -> List[LibraryDocument]:
+        """Catalog of published documents with their attachment counts, newest first"""
+        rows = self._get_connection().execute(
+            "SELECT d.metadata, COUNT(a.user_id) FROM library_documents d "
+            "LEFT JOIN library_attachments a ON a.document_id = d.document_id "
+            "WHERE d.published = 1 GROUP BY d.document_id ORDER BY d.published_at DESC"
+        ).fetchall()
+        return [
+            LibraryDocument(**self._to_metadata(payload).dict(), attachments=attachments)
+            for payload, attachments in rows
+        ]
+
+    # ------------------------------------------------------------------
+    # Attachments
+    # ------------------------------------------------------------------
+
+    def attach(self, user_id: str, document_id: str) -> Optional[DocumentMetadata]:
+        """
+        Add a published document to a user's workspace (idempotent)
+        Returns: library metadata, or None if the document is not published
+        """
+        conn = self._get_connection()
+        with conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO library_attachments (user_id, document_id, attached_at) "
+                "SELECT ?, document_id, ? FROM library_documents WHERE document_id = ? AND published = 1",
+                (user_id, time.time(), document_id)
+            )
+        if cursor.rowcount == 0 and not self.is_attached(user_id, document_id):
+            return None
+        return self.get_document(document_id)
+
+    def detach(self, user_id: str, document_id: str) -> bool:
+        """
+        Remove a document from a user's workspace, freeing it if unreferenced
+        Returns: False if it was not attached
+        """
+        conn = self._get_connection()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM library_attachments WHERE user_id = ? AND document_id = ?",
+                (user_id, document_id)
+            )
+        if cursor.rowcount == 0:
+            return False
+        self._release(document_id)
+        return True
+
+    def is_attached(self, user_id: str, document_id: str) -> bool:
+        row = self._get_connection().execute(
+            "SELECT 1 FROM library_attachments WHERE user_id = ? AND document_id = ?",
+            (user_id, document_id)
+        ).fetchone()
+        return row is not None
+
+    def get_attached(self, user_id: str, document_id: str) -> Optional[DocumentMetadata]:
+        """Library metadata of a document the user has attached"""
+        return self.get_document(document_id) if self.is_attached(user_id, document_id) else None
+
+    def attached_ids(self, user_id: str) -> List[str]:
+        """IDs of the user's attached documents, oldest attachment first"""
+        rows = self._get_connection().execute(
+            "SELECT document_id FROM library_attachments WHERE user_id = ? ORDER BY attached_at, document_id",
+            (user_id,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def list_attached(self, user_id: str, offset: int = 0, limit: int = 50) -> List[DocumentMetadata]:
+        """Page of the user's attached documents, newest attachment first"""
+        rows = self._get_connection().execute(
+            "SELECT d.metadata FROM library_attachments a "
+            "JOIN library_documents d ON d.document_id = a.document_id "
+            "WHERE a.user_id = ? ORDER BY a.attached_at DESC, a.document_id LIMIT ? OFFSET ?",
+            (user_id, limit, offset)
+        ).fetchall()
+        return [self._to_metadata(row[0]) for row in rows]
+
+    def count_attached(self, user_id: str) -> int:
+        row = self._get_connection().execute(
+            "SELECT COUNT(*) FROM library_attachments WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0]
+
+    # ------------------------------------------------------------------
+    # Reference counting
+    # ------------------------------------------------------------------
+
+    def references(self, document_id: str) -> int:
+        """Attachments plus one while the document is published"""
+        row = self._get_connection().execute(
+            "SELECT d.published + (SELECT COUNT(*) FROM library_attachments a "
+            "WHERE a.document_id = d.document_id) "
+            "FROM library_documents d WHERE d.document_id = ?",
+            (document_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _release(self, document_id: str):
+        """Free a document's storage once nothing references it"""
+        conn = self._get_connection()
+        with conn:
+            # Attach only succeeds while published, so an unreferenced,
+            # unpublished row can't gain a reference after this delete
+            cursor = conn.execute(
+                "DELETE FROM library_documents WHERE document_id = ? AND published = 0 "
+                "AND NOT EXISTS (SELECT 1 FROM library_attachments WHERE document_id = ?)",
+                (document_id, document_id)
+            )
+        if cursor.rowcount:
+            namespace = library_namespace(document_id)
+            self.vector_store.delete_document(namespace, document_id)
+            self.pdf_processor.delete_document_files(namespace, document_id)
+
+    def storage_stats(self) -> Dict:
+        """Published and referenced documents, and the private copies attachments replace"""
+        conn = self._get_connection()
+        documents, published = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(published), 0) FROM library_documents"
+        ).fetchone()
+        attachments, bytes_referenced = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(json_extract(d.metadata, '$.file_size_bytes')), 0) "
+            "FROM library_attachments a JOIN library_documents d ON d.document_id = a.document_id"
+        ).fetchone()
+        bytes_stored = conn.execute(
+            "SELECT COALESCE(SUM(json_extract(metadata, '$.file_size_bytes')), 0) FROM library_documents"
+        ).fetchone()[0]
+        return {
+            "documents": documents,
+            "published": published,
+            "attachments": attachments,
+            "file_bytes_stored": bytes_stored,
+            "file_bytes_referenced": bytes_referenced,
+        }
+
+
+class LibraryVectorStore:
+    """
+    Vector store view over a user's private index plus attached library documents
+    Other attributes are passed through to the wrapped store
+    """
+
+    def __init__(self, store, library: DocumentLibrary):
+        self.store = store
+        self.library = library
+
+    def __getattr__(self, name: str):
+        return getattr(self.store, name)
+
+    def _sources(self, user_id: str, document_ids: Optional[List[str]]) -> List[Tuple[str, Optional[List[str]]]]:
+        """(namespace, document_ids) pairs to search for the user"""
+        attached = self.library.attached_ids(user_id)
+        wanted = set(document_ids or [])
+        sources = []
+        private_ids = [d for d in document_ids if d not in attached] if document_ids else None
+        if private_ids is None or private_ids:
+            sources.append((user_id, private_ids))
+        sources.extend(
+            (library_namespace(document_id), None)
+            for document_id in attached if not wanted or document_id in wanted
+        )
+        return sources
+
+    def search(
+        self,
+        user_id: str,
+        query: str,
+        top_k: int = 5,
+        document_ids: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """Search the user's private and attached documents"""
+        return self.search_batch(user_id, [query], top_k, document_ids)[0]
+
+    def search_batch(
+        self,
+        user_id: str,
+        queries: List[str],
+        top_k: int = 5,
+        document_ids: Optional[List[str]] = None
+    ) -> List[List[Dict]]:
+        """
+        Embed the queries once and search every source with them
+        Returns: one result list per query, best first across sources
+        """
+        sources = self._live_sources(user_id, document_ids)
+        if not sources or not queries:
+            return [[] for _ in queries]
+        if len(sources) == 1 and sources[0][0] == user_id:
+            return self.store.search_batch(user_id, queries, top_k, document_ids)
+        return self._search_sources(sources, self.store.create_query_embeddings(queries), top_k)
+
+    def search_embeddings(
+        self,
+        user_id: str,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        document_ids: Optional[List[str]] = None
+    ) -> List[List[Dict]]:
+        """Search the user's private and attached documents with precomputed query embeddings"""
+        query_embeddings = np.atleast_2d(query_embeddings)
+        sources = self._live_sources(user_id, document_ids)
+        if not sources:
+            return [[] for _ in query_embeddings]
+        return self._search_sources(sources, query_embeddings, top_k)
+
+    def _live_sources(self, user_id: str, document_ids: Optional[List[str]]) -> List[Tuple[str, Optional[List[str]]]]:
+        return [
+            (namespace, ids) for namespace, ids in self._sources(user_id, document_ids)
+            if self.store.get_document_count(namespace) > 0
+        ]
+
+    def _search_sources(
+        self,
+        sources: List[Tuple[str, Optional[List[str]]]],
+        query_embeddings: np.ndarray,
+        top_k: int
+    ) -> List[List[Dict]]:
+        """Best hits per query across sources"""
+        merged = [[] for _ in query_embeddings]
+        for namespace, ids in sources:
+            for results, hits in zip(merged, self.store.search_embeddings(namespace, query_embeddings, top_k, ids)):
+                results.extend(hits)
+        return [
+            sorted(results, key=lambda chunk: -chunk["similarity_score"])[:top_k]
+            for results in merged
+        ]
+
+    def load_index(self, user_id: str, check_embedding: bool = True) -> Tuple[np.ndarray, List[Dict]]:
+        """User's private rows followed by each attached document's rows"""
+        segments, metadata = [], []
+        for namespace, _ in self._sources(user_id, None):
+            vectors, chunks = self.store.load_index(namespace, check_embedding=check_embedding)
+            if len(chunks):
+                segments.append(np.asarray(vectors))
+                metadata.extend(chunks)
+        if not segments:
+            return np.empty((0, self.store.dimension), dtype=np.float32), []
+        return np.vstack(segments), metadata
+
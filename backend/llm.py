@@ -0,0 +1,30 @@
+"""
+LLM Client Module
+Creates chat model clients on demand
+"""
+from config import settings
+from llm_scheduler import Priority, ScheduledChatModel, scheduler
+
+def create_chat_model(temperature: float = None, priority: Priority = Priority.INTERACTIVE):
+    """
+    Create the configured chat model client
+    With LLM_SCHEDULER_ENABLED, calls go through the shared scheduler at
+    the given priority
+    The langchain_google_genai import is deferred because it dominates import time
+    """
+    if settings.LLM_PROVIDER == "mock":
+        from mock_services import MockChatModel
+        model = MockChatModel()
+    else:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        
+        model = ChatGoogleGenerativeAI(
+            model=settings.MODEL_NAME,
+            google_api_key=settings.GOOGLE_API_KEY,
+            temperature=settings.TEMPERATURE if temperature is None else temperature,
+            max_output_tokens=settings.MAX_OUTPUT_TOKENS
+        )
+    
+    if settings.LLM_SCHEDULER_ENABLED:
+        return ScheduledChatModel(model, scheduler, priority)
+    return model
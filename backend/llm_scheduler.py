@@ -0,0 +1,303 @@
+"""
+LLM Scheduler Module
+Client-side admission control for chat model calls
+
+All LLM calls in the process share one scheduler:
+- Concurrency adapts AIMD-style: +1/limit per fast success, halved on a
+  rate-limit (429) error, trimmed by 10% when latency exceeds the target
+- INTERACTIVE calls (chat) are dispatched before BATCH calls (notes,
+  quizzes, plans)
+- Within a priority, waiting users are served round-robin so one user's
+  burst can't starve the others
+- Calls still queued past their deadline are shed instead of sent, and so
+  are calls whose client went away: callers can attach a cancellation
+  event (llm_cancel_event) that is set, and passed to cancel(), when the
+  HTTP client disconnects. Calls already sent run to completion
+- Rate-limited calls are retried with backoff, re-entering the queue
+"""
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Deque, Dict, List, Optional
+from config import settings
+from metrics import Counter, Gauge, Histogram, register
+
+QUEUE_WAIT = register(Histogram(
+    "velosify_llm_queue_wait_seconds", "Time LLM calls wait for a concurrency slot", ["priority"]
+))
+LLM_CALLS = register(Counter(
+    "velosify_llm_calls_total",
+    "LLM calls by outcome (ok, rate_limited, error, shed, cancelled)",
+    ["priority", "outcome"]
+))
+CONCURRENCY_LIMIT = register(Gauge(
+    "velosify_llm_concurrency_limit", "Current adaptive LLM concurrency limit"
+))
+IN_FLIGHT = register(Gauge(
+    "velosify_llm_in_flight", "LLM calls currently running"
+))
+
+
+class Priority(IntEnum):
+    """Dispatch order; lower values go first"""
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+class LLMQueueTimeout(Exception):
+    """Raised when a call is shed because its deadline passed while queued"""
+
+
+class LLMRequestCancelled(Exception):
+    """Raised when a call is shed because its client disconnected"""
+
+
+# User the current LLM calls are made for, used for fair queuing
+_current_user: ContextVar[str] = ContextVar("llm_user", default="")
+# Set once the client the current LLM calls are made for has gone away
+_current_cancel: ContextVar[Optional[threading.Event]] = ContextVar("llm_cancel", default=None)
+
+
+@contextmanager
+def llm_user(user_id: str):
+    """Attribute LLM calls in this block to a user"""
+    token = _current_user.set(user_id)
+    try:
+        yield
+    finally:
+        _current_user.reset(token)
+
+
+@contextmanager
+def llm_cancel_event(event: threading.Event):
+    """Shed LLM calls in this block that are still queued once the event is set"""
+    token = _current_cancel.set(event)
+    try:
+        yield
+    finally:
+        _current_cancel.reset(token)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether the provider rejected the call for rate or quota reasons"""
+    message = str(error).lower()
+    return (
+        "ResourceExhausted" in type(error).__name__
+        or "429" in message
+        or "resource has been exhausted" in message
+        or "rate limit" in message
+    )
+
+
+class _Ticket:
+    __slots__ = ("user_id", "priority", "deadline", "cancel", "enqueued_at", "granted", "cancelled")
+
+    def __init__(self, user_id: str, priority: Priority, deadline: float, cancel: Optional[threading.Event]):
+        self.user_id = user_id
+        self.priority = priority
+        self.deadline = deadline
+        self.cancel = cancel
+        self.enqueued_at = time.monotonic()
+        self.granted = threading.Event()  # also set to wake a cancelled waiter
+        self.cancelled = False
+
+
+class LLMScheduler:
+    """Adaptive concurrency limiter with priority and per-user fair queues"""
+
+    def __init__(
+        self,
+        initial_limit: Optional[float] = None,
+        min_limit: Optional[float] = None,
+        max_limit: Optional[float] = None,
+        latency_target_ms: Optional[float] = None
+    ):
+        self.min_limit = min_limit or settings.LLM_MIN_CONCURRENCY
+        self.max_limit = max_limit or settings.LLM_MAX_CONCURRENCY
+        self.limit = float(initial_limit or settings.LLM_INITIAL_CONCURRENCY)
+        self.latency_target = (latency_target_ms or settings.LLM_LATENCY_TARGET_MS) / 1000
+        self.in_flight = 0
+        # {priority: {user_id: deque of tickets}}, users in round-robin order
+        self._queues: Dict[Priority, "OrderedDict[str, Deque[_Ticket]]"] = {
+            priority: OrderedDict() for priority in Priority
+        }
+        self._lock = threading.Lock()
+        self._last_decrease = 0.0
+        CONCURRENCY_LIMIT.set(self.limit)
+
+    # ------------------------------------------------------------------
+    # Slots
+    # ------------------------------------------------------------------
+
+    def _dispatch(self):
+        """Grant slots to waiting tickets while under the limit (lock held)"""
+        now = time.monotonic()
+        for priority in Priority:
+            users = self._queues[priority]
+            while users and self.in_flight < max(1, int(self.limit)):
+                user_id, tickets = next(iter(users.items()))
+                ticket = tickets.popleft()
+                if tickets:
+                    users.move_to_end(user_id)
+                else:
+                    del users[user_id]
+                if ticket.cancel is not None and ticket.cancel.is_set():
+                    ticket.cancelled = True
+                    ticket.granted.set()  # Wake the waiter to shed itself
+                    continue
+                if ticket.deadline < now:
+                    continue  # Waiter sheds itself when it wakes up
+                self.in_flight += 1
+                ticket.granted.set()
+        IN_FLIGHT.set(self.in_flight)
+
+    def _remove(self, ticket: _Ticket):
+        """Drop a ticket that gave up waiting (lock held)"""
+        tickets = self._queues[ticket.priority].get(ticket.user_id)
+        if tickets is not None and ticket in tickets:
+            tickets.remove(ticket)
+            if not tickets:
+                del self._queues[ticket.priority][ticket.user_id]
+
+    def acquire(
+        self,
+        priority: Priority,
+        deadline: float,
+        user_id: str = "",
+        cancel: Optional[threading.Event] = None
+    ):
+        """
+        Wait for a concurrency slot; raises LLMQueueTimeout past the deadline
+        and LLMRequestCancelled once `cancel` is set (see cancel())
+        """
+        ticket = _Ticket(user_id, priority, deadline, cancel)
+        with self._lock:
+            if cancel is not None and cancel.is_set():
+                ticket.cancelled = True
+            else:
+                self._queues[priority].setdefault(user_id, deque()).append(ticket)
+                self._dispatch()
+
+        if not ticket.cancelled:
+            ticket.granted.wait(max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            # The slot may have been granted right after the timeout
+            granted = ticket.granted.is_set() and not ticket.cancelled
+            if not granted:
+                self._remove(ticket)
+        QUEUE_WAIT.observe(time.monotonic() - ticket.enqueued_at, priority.name.lower())
+        if ticket.cancelled:
+            LLM_CALLS.inc(priority.name.lower(), "cancelled")
+            raise LLMRequestCancelled("LLM request shed: client disconnected while queued")
+        if not granted:
+            LLM_CALLS.inc(priority.name.lower(), "shed")
+            raise LLMQueueTimeout("LLM request shed: deadline passed while queued")
+
+    def cancel(self, event: threading.Event):
+        """Shed every queued call waiting under this cancellation event"""
+        with self._lock:
+            for users in self._queues.values():
+                for tickets in users.values():
+                    for ticket in tickets:
+                        if ticket.cancel is event:
+                            ticket.cancelled = True
+                            ticket.granted.set()
+
+    def release(self, latency: float, rate_limited: bool = False):
+        """Return a slot and adapt the limit to the call's outcome"""
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if rate_limited:
+                self._decrease(0.5, now)
+            elif latency > self.latency_target:
+                self._decrease(0.9, now)
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            CONCURRENCY_LIMIT.set(round(self.limit, 2))
+            self._dispatch()
+
+    def _decrease(self, factor: float, now: float):
+        # At most one decrease per second, so a burst of failures from
+        # the same overload doesn't collapse the limit
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
+
+    # ------------------------------------------------------------------
+    # Calls
+    # ------------------------------------------------------------------
+
+    def call(
+        self,
+        model,
+        prompt,
+        priority: Priority,
+        user_id: str = "",
+        cancel: Optional[threading.Event] = None
+    ):
+        """Run model.invoke(prompt) under the scheduler, retrying rate limits"""
+        label = priority.name.lower()
+        deadline_seconds = (
+            settings.LLM_INTERACTIVE_DEADLINE_S if priority == Priority.INTERACTIVE
+            else settings.LLM_BATCH_DEADLINE_S
+        )
+        deadline = time.monotonic() + deadline_seconds
+
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            self.acquire(priority, deadline, user_id, cancel)
+            start = time.monotonic()
+            try:
+                response = model.invoke(prompt)
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e)
+                self.release(time.monotonic() - start, rate_limited=rate_limited)
+                LLM_CALLS.inc(label, "rate_limited" if rate_limited else "error")
+                if not rate_limited or attempt == settings.LLM_MAX_RETRIES:
+                    raise
+                # Back off before re-queueing; don't sleep past the deadline
+                backoff = min(2 ** attempt, max(0.0, deadline - time.monotonic()))
+                time.sleep(backoff)
+                continue
+            self.release(time.monotonic() - start)
+            LLM_CALLS.inc(label, "ok")
+            return response
+
+
+class ScheduledChatModel:
+    """
+    Chat model wrapper that routes invoke/batch through the scheduler
+    Exposes the same invoke/batch interface the services already use
+    """
+
+    def __init__(self, model, scheduler: LLMScheduler, priority: Priority):
+        self.model = model
+        self.scheduler = scheduler
+        self.priority = priority
+
+    def invoke(self, prompt):
+        return self.scheduler.call(self.model, prompt, self.priority, _current_user.get(), _current_cancel.get())
+
+    def batch(self, prompts: List, config: Optional[dict] = None, return_exceptions: bool = False):
+        max_workers = (config or {}).get("max_concurrency") or len(prompts) or 1
+        user_id, cancel = _current_user.get(), _current_cancel.get()
+
+        def call(prompt):
+            try:
+                return self.scheduler.call(self.model, prompt, self.priority, user_id, cancel)
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(call, prompts))
+
+
+# Scheduler shared by every chat model client in this process
+scheduler = LLMScheduler()
@@ -2,46 +2,86 @@
 Velosify Study Copilot - FastAPI Backend
 Main application with all API endpoints
 """
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from typing import Optional, List
-import uvicorn
 from pathlib import Path
+import time
+import secrets
+import asyncio
+import threading
 
 from config import settings
 from models import (
-    ChatRequest, ChatResponse,
+    ChatRequest, ChatResponse, ChatSessionRequest,
+    BatchChatRequest, BatchChatResponse,
     NotesRequest, NotesResponse,
     QuizRequest, QuizResponse,
     StudyPlanRequest, StudyPlanResponse,
     DocumentListResponse, DocumentMetadata,
-    DeleteDocumentRequest, UploadResponse,
-    ErrorResponse
+    DeleteDocumentRequest, UploadResponse, ReplaceDocumentResponse,
+    ErrorResponse, IngestStatus,
+    LibraryDocumentRequest, LibraryListResponse,
+    ProfileStartRequest
 )
 from pdf_processor import PDFProcessor
-from vector_store import VectorStore
+from vector_store import create_vector_store
 from rag_engine import RAGEngine
 from ai_services import AIServices
+from content_store import ContentStore
+from metadata_store import create_metadata_store
+from startup import LazyService, service_timings
+import metrics
+from profiling import profiler, ProfilingMiddleware
+from coalescing import SingleFlight, GENERATION_REQUESTS
+from artifact_cache import ArtifactCache, make_cache_key
+from library import DocumentLibrary, LibraryVectorStore
+from chat_sessions import ChatSessionStore
+from llm_scheduler import llm_cancel_event, scheduler
+from starlette.concurrency import run_in_threadpool
+from datetime import date
 from contextlib import asynccontextmanager
 
-# Initialize service placeholders
-pdf_processor = None
-vector_store = None
-rag_engine = None
-ai_services = None
+# Services are constructed on first use so importing this module stays cheap
+pdf_processor = LazyService("pdf_processor", PDFProcessor)
+vector_store = LazyService("vector_store", create_vector_store)
+content_store = LazyService("content_store", ContentStore)
+metadata_store = LazyService("metadata_store", create_metadata_store)
+artifact_cache = LazyService("artifact_cache", ArtifactCache)
+library = LazyService("library", lambda: DocumentLibrary(
+    vector_store.get_instance(), metadata_store.get_instance(), pdf_processor.get_instance()
+))
+# Conversation state for follow-up questions, shared by all workers
+chat_sessions = LazyService("chat_sessions", ChatSessionStore)
+# Retrieval sees the user's private index plus attached library documents
+rag_engine = LazyService("rag_engine", lambda: RAGEngine(
+    vector_store=LibraryVectorStore(vector_store.get_instance(), library.get_instance()),
+    sessions=chat_sessions.get_instance()
+))
+ai_services = LazyService("ai_services", lambda: AIServices(rag_engine=rag_engine.get_instance()))
+services = [
+    pdf_processor, vector_store, rag_engine, ai_services,
+    content_store, metadata_store, artifact_cache, library, chat_sessions
+]
+
+# Identical concurrent generations share one LLM call
+generations = SingleFlight()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Initialize services
-    global pdf_processor, vector_store, rag_engine, ai_services
+    # Startup: validate settings, optionally warm up services
     try:
         settings.validate()
-        pdf_processor = PDFProcessor()
-        vector_store = VectorStore()
-        rag_engine = RAGEngine()
-        ai_services = AIServices()
-        print("[SUCCESS] Velosify Study Copilot API services initialized")
+        if settings.VECTOR_STORE_ENGINE == "per_user":
+            # Finish index swaps a crashed maintenance run left behind
+            from maintenance import recover_swaps
+            for user_id in recover_swaps(vector_store):
+                print(f"[INFO] Recovered interrupted index swap for {user_id}")
+        if settings.WARMUP_SERVICES:
+            for service in services:
+                service.get_instance()
+        print("[SUCCESS] Velosify Study Copilot API ready")
         print(f"[INFO] Upload directory: {settings.UPLOAD_DIR}")
         print(f"[INFO] Vector store directory: {settings.VECTOR_STORE_DIR}")
     except Exception as e:
@@ -68,15 +108,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize services
-pdf_processor = PDFProcessor()
-vector_store = VectorStore()
-rag_engine = RAGEngine()
-ai_services = AIServices()
 
-# In-memory document metadata storage (in production, use Supabase)
-# Format: {user_id: {document_id: DocumentMetadata}}
-document_store = {}
+# Profiler request hooks (one attribute check per request when idle)
+app.add_middleware(ProfilingMiddleware)
+
+if settings.METRICS_ENABLED:
+    @app.middleware("http")
+    async def record_request_metrics(request, call_next):
+        """Record request latency and return the stage breakdown as Server-Timing"""
+        timings = metrics.start_request()
+        start = time.perf_counter()
+        response = await call_next(request)
+        elapsed = time.perf_counter() - start
+        
+        # Label by route template, not the raw path, to keep cardinality bounded
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        metrics.REQUEST_DURATION.observe(elapsed, request.method, route_path)
+        metrics.REQUESTS.inc(request.method, route_path, str(response.status_code))
+        response.headers["Server-Timing"] = metrics.server_timing_header(timings, elapsed)
+        return response
 
 
 # Health check moved to regular endpoint
@@ -103,10 +154,37 @@ async def health_check():
     }
 
 
+@app.get("/health/startup")
+async def startup_report():
+    """Construction time of services built so far in this worker"""
+    return {
+        "initialized": [service.service_name for service in services if service.is_initialized],
+        "construction_ms": {
+            name: round(seconds * 1000, 1)
+            for name, seconds in service_timings.items()
+        }
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Stage and request metrics in Prometheus text format"""
+    return PlainTextResponse(
+        metrics.render_metrics(),
+        media_type="text/plain; version=0.0.4"
+    )
+
+
 # ============================================================================
 # DOCUMENT UPLOAD & MANAGEMENT
 # ============================================================================
 
+def release_content(content_hash: Optional[str]):
+    """Drop a content store entry once no document references its hash"""
+    if content_hash and metadata_store.count_by_content_hash(content_hash) == 0:
+        content_store.delete(content_hash)
+
+
 @app.post("/api/upload", response_model=UploadResponse)
 async def upload_document(
     user_id: str = Form(...),
@@ -115,8 +193,10 @@ async def upload_document(
     topic: Optional[str] = Form(None)
 ):
     """
-    Upload and process a PDF document
+    Upload and process a document (PDF, DOCX, PPTX, Markdown or text)
     """
+    document_id = None
+    streaming = False
     try:
         # Read file content
         file_content = await file.read()
@@ -127,32 +207,106 @@ async def upload_document(
         if not is_valid:
             raise HTTPException(status_code=400, detail=error_msg)
         
+        # Identify document by content
+        content_hash = pdf_processor.compute_content_hash(file_content)
+        document_id = pdf_processor.generate_document_id(user_id, content_hash)
+        cached = content_store.get(content_hash, vector_store.embedder.signature)
+        
+        # Same bytes already uploaded by this user
+        existing = metadata_store.get_document(user_id, document_id)
+        if existing and existing.status == IngestStatus.READY:
+            return UploadResponse(
+                success=True,
+                message="Document already uploaded",
+                document_id=existing.document_id,
+                filename=existing.filename,
+                total_pages=existing.total_pages,
+                chunks_created=existing.chunk_count
+            )
+        if existing and existing.status == IngestStatus.PROCESSING:
+            # Another request is ingesting these bytes; its vectors aren't ours to drop
+            raise HTTPException(status_code=409, detail="Document is still being processed")
+        
+        # Same bytes published to the shared library: attach instead of copying
+        published = library.find_published(content_hash) if settings.LIBRARY_AUTO_ATTACH else None
+        if published:
+            if existing:
+                vector_store.delete_document(user_id, document_id)
+                metadata_store.delete_document(user_id, document_id)
+            library.attach(user_id, published.document_id)
+            chat_sessions.document_added(user_id, published.document_id)
+            return UploadResponse(
+                success=True,
+                message="Document attached from shared library",
+                document_id=published.document_id,
+                filename=published.filename,
+                total_pages=published.total_pages,
+                chunks_created=published.chunk_count
+            )
+        
+        if existing:
+            # Previous ingest failed: drop partial vectors
+            vector_store.delete_document(user_id, document_id)
+        
+        # Artifacts built from an earlier version of this document are stale
+        if settings.ARTIFACT_CACHE_ENABLED:
+            artifact_cache.invalidate_document(user_id, document_id)
+        
         # Save file
         file_path = pdf_processor.save_uploaded_file(
             file_content=file_content,
             user_id=user_id,
-            filename=file.filename
-        )
-        
-        # Process PDF
-        metadata, chunks = pdf_processor.process_pdf(
-            file_path=file_path,
-            user_id=user_id,
             filename=file.filename,
-            subject=subject,
-            topic=topic
+            document_id=document_id
         )
         
-        # Add to vector store
-        chunks_added = vector_store.add_documents(
-            user_id=user_id,
-            chunks=chunks
-        )
+        if cached:
+            # Same bytes processed for another user: reuse chunks and embeddings
+            metadata = pdf_processor.create_metadata(
+                document_id=document_id,
+                filename=file.filename,
+                total_pages=cached["total_pages"],
+                file_size_bytes=file_size,
+                content_hash=content_hash,
+                subject=subject,
+                topic=topic
+            )
+            chunks = content_store.materialize_chunks(
+                cached, document_id, file.filename, content_hash
+            )
+            metadata_store.add_document(user_id, metadata.copy(update={"status": IngestStatus.PROCESSING}))
+            
+            # Add to vector store
+            chunks_added = vector_store.add_documents(
+                user_id=user_id,
+                chunks=chunks,
+                embeddings=cached["embeddings"]
+            )
+        else:
+            # Stream pages -> chunks -> embedding batches -> index appends,
+            # sharing the result through the content store on the way
+            metadata, chunks = pdf_processor.stream_document(
+                file_path=file_path,
+                user_id=user_id,
+                filename=file.filename,
+                subject=subject,
+                topic=topic,
+                content_hash=content_hash
+            )
+            metadata_store.add_document(user_id, metadata.copy(update={"status": IngestStatus.PROCESSING}))
+            streaming = True
+            chunks_added = content_store.put_stream(
+                content_hash,
+                metadata.total_pages,
+                vector_store.add_documents_stream(user_id, chunks),
+                vector_store.embedder.signature
+            )
         
-        # Store metadata
-        if user_id not in document_store:
-            document_store[user_id] = {}
-        document_store[user_id][metadata.document_id] = metadata
+        # Mark document as ready
+        metadata_store.update_status(
+            user_id, metadata.document_id, IngestStatus.READY, chunk_count=chunks_added
+        )
+        chat_sessions.document_added(user_id, metadata.document_id)
         
         return UploadResponse(
             success=True,
@@ -166,22 +320,137 @@ async def upload_document(
     except HTTPException:
         raise
     except Exception as e:
+        if streaming:
+            # Vectors committed before a later failure would otherwise stay searchable
+            vector_store.delete_document(user_id, document_id)
+        if document_id and metadata_store.get_document(user_id, document_id):
+            metadata_store.update_status(user_id, document_id, IngestStatus.FAILED)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
+@app.post("/api/documents/replace", response_model=ReplaceDocumentResponse)
+async def replace_document(
+    user_id: str = Form(...),
+    document_id: str = Form(...),
+    file: UploadFile = File(...)
+):
+    """
+    Replace a document with a revised version, keeping its document_id
+    Only pages whose text changed are re-chunked and re-embedded; vectors
+    of unchanged pages are reused and those of removed pages dropped
+    """
+    try:
+        file_content = await file.read()
+        is_valid, error_msg = pdf_processor.validate_file(file.filename, len(file_content))
+        if not is_valid:
+            raise HTTPException(status_code=400, detail=error_msg)
+        
+        existing = metadata_store.get_document(user_id, document_id)
+        if existing is None:
+            raise HTTPException(status_code=404, detail="Document not found")
+        if existing.status == IngestStatus.PROCESSING:
+            raise HTTPException(status_code=409, detail="Document is still being processed")
+        
+        content_hash = pdf_processor.compute_content_hash(file_content)
+        if content_hash == existing.content_hash and existing.status == IngestStatus.READY:
+            return ReplaceDocumentResponse(
+                success=True,
+                message="Document unchanged",
+                document_id=document_id,
+                filename=existing.filename,
+                total_pages=existing.total_pages,
+                chunks_created=existing.chunk_count,
+                chunks_reused=existing.chunk_count
+            )
+        
+        metadata_store.update_status(user_id, document_id, IngestStatus.PROCESSING)
+        pdf_processor.delete_document_files(user_id, document_id)
+        file_path = pdf_processor.save_uploaded_file(
+            file_content=file_content,
+            user_id=user_id,
+            filename=file.filename,
+            document_id=document_id
+        )
+        
+        # Diff pages against the stored version by text hash
+        page_texts = pdf_processor.extract_text(file_path, content_hash)
+        previous_chunks = vector_store.document_chunks(user_id, document_id)
+        chunks, sources = pdf_processor.rechunk_changed_pages(
+            page_texts, previous_chunks, document_id, file.filename, content_hash
+        )
+        embeddings = vector_store.replace_document(user_id, document_id, chunks, sources)
+        if chunks:
+            content_store.put(
+                content_hash, len(page_texts), chunks, embeddings,
+                vector_store.embedder.signature
+            )
+        
+        metadata_store.add_document(user_id, existing.copy(update={
+            "filename": file.filename,
+            "total_pages": len(page_texts),
+            "file_size_bytes": len(file_content),
+            "content_hash": content_hash,
+            "chunk_count": len(chunks),
+            "status": IngestStatus.READY
+        }))
+        if existing.content_hash != content_hash:
+            release_content(existing.content_hash)
+        
+        if settings.ARTIFACT_CACHE_ENABLED:
+            artifact_cache.invalidate_document(user_id, document_id)
+        chat_sessions.forget_document(user_id, document_id)
+        
+        reused = sum(source is not None for source in sources)
+        return ReplaceDocumentResponse(
+            success=True,
+            message="Document replaced successfully",
+            document_id=document_id,
+            filename=file.filename,
+            total_pages=len(page_texts),
+            chunks_created=len(chunks),
+            chunks_embedded=len(chunks) - reused,
+            chunks_reused=reused,
+            pages_changed=sorted({
+                chunk["page_number"] for chunk, source in zip(chunks, sources) if source is None
+            }),
+            pages_removed=len(
+                {chunk.get("page_hash") for chunk in previous_chunks}
+                - {chunk.get("page_hash") for chunk in chunks}
+            )
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        if metadata_store.get_document(user_id, document_id):
+            metadata_store.update_status(user_id, document_id, IngestStatus.FAILED)
+        raise HTTPException(status_code=500, detail=f"Replace failed: {str(e)}")
+
+
 @app.get("/api/documents/{user_id}", response_model=DocumentListResponse)
-async def list_documents(user_id: str):
+async def list_documents(
+    user_id: str,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=200)
+):
     """
-    Get list of all documents for a user
+    Get a page of documents for a user: uploads newest first, then
+    attached library documents
     """
     try:
-        user_docs = document_store.get(user_id, {})
-        documents = list(user_docs.values())
+        documents = metadata_store.list_documents(user_id, offset=offset, limit=limit)
+        private_count = metadata_store.count_documents(user_id)
+        if len(documents) < limit:
+            documents += library.list_attached(
+                user_id, offset=max(0, offset - private_count), limit=limit - len(documents)
+            )
+        total_count = private_count + library.count_attached(user_id)
         
         return DocumentListResponse(
             success=True,
             documents=documents,
-            total_count=len(documents)
+            total_count=total_count,
+            has_more=offset + len(documents) < total_count
         )
         
     except Exception as e:
@@ -198,18 +467,31 @@ async def delete_document(request: DeleteDocumentRequest):
         document_id = request.document_id
         
         # Check if document exists
-        if user_id not in document_store or document_id not in document_store[user_id]:
-            raise HTTPException(status_code=404, detail="Document not found")
+        existing = metadata_store.get_document(user_id, document_id)
+        if not existing:
+            # Attached library documents are detached; storage is freed with the last reference
+            if not library.detach(user_id, document_id):
+                raise HTTPException(status_code=404, detail="Document not found")
+            if settings.ARTIFACT_CACHE_ENABLED:
+                artifact_cache.invalidate_document(user_id, document_id)
+            chat_sessions.forget_document(user_id, document_id)
+            return {"success": True, "message": "Document detached successfully"}
         
         # Delete from vector store
         vector_store.delete_document(user_id, document_id)
         
-        # Delete from metadata store
-        del document_store[user_id][document_id]
+        # Delete from metadata store, then shared chunks/embeddings nobody else uses
+        metadata_store.delete_document(user_id, document_id)
+        release_content(existing.content_hash)
         
         # Delete physical files
         pdf_processor.delete_document_files(user_id, document_id)
         
+        # Drop generated notes/quizzes/plans that used the document
+        if settings.ARTIFACT_CACHE_ENABLED:
+            artifact_cache.invalidate_document(user_id, document_id)
+        chat_sessions.forget_document(user_id, document_id)
+        
         return {"success": True, "message": "Document deleted successfully"}
         
     except HTTPException:
@@ -218,21 +500,153 @@ async def delete_document(request: DeleteDocumentRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# ============================================================================
+# SHARED LIBRARY
+# ============================================================================
+
+@app.get("/api/library", response_model=LibraryListResponse)
+async def list_library():
+    """
+    Published documents with their attachment counts
+    """
+    try:
+        return LibraryListResponse(
+            success=True,
+            documents=library.list_published(),
+            storage=library.storage_stats()
+        )
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/library/publish")
+async def publish_document(
+    request: LibraryDocumentRequest,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Move a user's document into the shared library
+    The uploader gets it back as an attachment under the library document ID
+    """
+    require_admin(x_admin_token)
+    try:
+        document = await run_in_threadpool(library.publish, request.user_id, request.document_id)
+        if document is None:
+            raise HTTPException(status_code=404, detail="Document not found or not ready")
+        
+        if settings.ARTIFACT_CACHE_ENABLED:
+            artifact_cache.invalidate_document(request.user_id, request.document_id)
+        chat_sessions.forget_document(request.user_id, request.document_id)
+        
+        return {"success": True, "document": document}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Publish failed: {str(e)}")
+
+
+@app.delete("/api/library/{document_id}")
+async def unpublish_document(document_id: str, x_admin_token: Optional[str] = Header(None)):
+    """
+    Remove a document from the catalog
+    Attached copies keep working until their users detach them
+    """
+    require_admin(x_admin_token)
+    try:
+        if not library.unpublish(document_id):
+            raise HTTPException(status_code=404, detail="Document not published")
+        return {"success": True, "references": library.references(document_id)}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/library/attach")
+async def attach_document(request: LibraryDocumentRequest):
+    """
+    Add a published document to a user's workspace
+    """
+    try:
+        document = library.attach(request.user_id, request.document_id)
+        if document is None:
+            raise HTTPException(status_code=404, detail="Document not published")
+        chat_sessions.document_added(request.user_id, request.document_id)
+        return {"success": True, "document": document}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/library/detach")
+async def detach_document(request: LibraryDocumentRequest):
+    """
+    Remove a library document from a user's workspace
+    """
+    try:
+        if not library.detach(request.user_id, request.document_id):
+            raise HTTPException(status_code=404, detail="Document not attached")
+        
+        if settings.ARTIFACT_CACHE_ENABLED:
+            artifact_cache.invalidate_document(request.user_id, request.document_id)
+        chat_sessions.forget_document(request.user_id, request.document_id)
+        
+        return {"success": True, "message": "Document detached successfully"}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ============================================================================
 # RAG CHAT
 # ============================================================================
 
+async def run_until_disconnect(http_request: Request, func, **kwargs):
+    """
+    Run a blocking call off the event loop; if the client disconnects
+    first, the call's LLM requests still queued in the scheduler are shed
+    """
+    cancelled = threading.Event()
+    
+    async def watch():
+        # The body was read before the endpoint ran, so the next message is the disconnect
+        while (await http_request.receive())["type"] != "http.disconnect":
+            pass
+        cancelled.set()
+        scheduler.cancel(cancelled)
+    
+    watcher = asyncio.ensure_future(watch())
+    try:
+        # The worker thread inherits this context, and with it the event
+        with llm_cancel_event(cancelled):
+            return await run_in_threadpool(func, **kwargs)
+    finally:
+        watcher.cancel()
+
+
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request):
     """
     Chat with documents using RAG
     """
     try:
-        response = rag_engine.chat(
+        # Off the event loop: the call may wait for an LLM slot
+        response = await run_until_disconnect(
+            http_request,
+            rag_engine.chat,
             user_id=request.user_id,
             query=request.query,
             document_ids=request.document_ids,
-            max_results=request.max_results
+            max_results=request.max_results,
+            session_id=request.session_id,
+            start_session=request.start_session
         )
         
         return response
@@ -241,6 +655,100 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
 
+@app.post("/api/chat/session/end")
+async def end_chat_session(request: ChatSessionRequest):
+    """
+    Drop a chat session and its cached chunks
+    """
+    if not chat_sessions.end(request.user_id, request.session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"success": True, "message": "Session ended"}
+
+
+@app.post("/api/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(request: BatchChatRequest, http_request: Request):
+    """
+    Answer several questions in one request
+    """
+    try:
+        responses = await run_until_disconnect(
+            http_request,
+            rag_engine.chat_batch,
+            user_id=request.user_id,
+            queries=request.queries,
+            document_ids=request.document_ids,
+            max_results=request.max_results
+        )
+        
+        return BatchChatResponse(success=True, responses=responses)
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch chat failed: {str(e)}")
+
+
+# ============================================================================
+# GENERATION COALESCING
+# ============================================================================
+
+def user_documents(user_id: str) -> List[DocumentMetadata]:
+    """Every document an unscoped search covers: uploads and attached library documents"""
+    attached = [library.get_attached(user_id, document_id) for document_id in library.attached_ids(user_id)]
+    return metadata_store.list_documents(user_id) + [metadata for metadata in attached if metadata]
+
+
+def document_fingerprint(user_id: str, document_ids: Optional[List[str]]) -> tuple:
+    """
+    Identify a document set by content, so students who uploaded the same
+    shared file produce the same key. Unknown IDs fall back to a per-user key.
+    No document IDs means the user's whole index, so the key is per user and
+    changes with every document added or removed.
+    """
+    if not document_ids:
+        return ("user", user_id, tuple(sorted(
+            (metadata.content_hash or metadata.document_id, metadata.filename)
+            for metadata in user_documents(user_id)
+        )))
+    fingerprint = []
+    for document_id in sorted(set(document_ids or [])):
+        metadata = metadata_store.get_document(user_id, document_id) or library.get_attached(user_id, document_id)
+        if metadata is None or not metadata.content_hash:
+            return ("user", user_id, tuple(sorted(set(document_ids))))
+        fingerprint.append((metadata.content_hash, metadata.filename))
+    return tuple(fingerprint)
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Case- and whitespace-insensitive form of free-text inputs"""
+    return " ".join((text or "").lower().split())
+
+
+async def run_generation(kind: str, key: tuple, request, response_model, func, **kwargs):
+    """
+    Serve a generation from the artifact cache, or run it off the event loop,
+    coalescing identical requests and storing successful results
+    """
+    cache_key = make_cache_key(kind, key)
+    if settings.ARTIFACT_CACHE_ENABLED and not request.force_refresh:
+        payload = artifact_cache.get(cache_key)
+        if payload is not None:
+            GENERATION_REQUESTS.inc(kind, "artifact_cache")
+            return response_model.parse_raw(payload)
+    
+    def generate():
+        response = func(**kwargs)
+        if settings.ARTIFACT_CACHE_ENABLED and response.success:
+            # Unscoped generations drew on the whole index; any of its documents invalidates them
+            document_ids = request.document_ids or [
+                metadata.document_id for metadata in user_documents(request.user_id)
+            ]
+            artifact_cache.put(cache_key, kind, response.json(), request.user_id, document_ids)
+        return response
+    
+    if not settings.COALESCE_GENERATIONS:
+        return await run_in_threadpool(generate)
+    return await generations.run(kind, key, generate, refresh=request.force_refresh)
+
+
 # ============================================================================
 # NOTES GENERATION
 # ============================================================================
@@ -251,7 +759,14 @@ async def generate_notes(request: NotesRequest):
     Generate structured study notes from documents
     """
     try:
-        response = ai_services.generate_notes(
+        key = (
+            document_fingerprint(request.user_id, request.document_ids),
+            normalize_text(request.topic),
+            request.include_examples,
+            request.include_highlights
+        )
+        response = await run_generation(
+            "notes", key, request, NotesResponse, ai_services.generate_notes,
             user_id=request.user_id,
             document_ids=request.document_ids,
             topic=request.topic,
@@ -275,7 +790,14 @@ async def generate_quiz(request: QuizRequest):
     Generate MCQ quiz from documents
     """
     try:
-        response = ai_services.generate_quiz(
+        key = (
+            document_fingerprint(request.user_id, request.document_ids),
+            normalize_text(request.topic),
+            request.difficulty,
+            request.num_questions
+        )
+        response = await run_generation(
+            "quiz", key, request, QuizResponse, ai_services.generate_quiz,
             user_id=request.user_id,
             document_ids=request.document_ids,
             num_questions=request.num_questions,
@@ -299,7 +821,16 @@ async def generate_study_plan(request: StudyPlanRequest):
     Generate personalized study plan
     """
     try:
-        response = ai_services.generate_study_plan(
+        # The plan depends on days remaining, so today's date is part of the key
+        key = (
+            document_fingerprint(request.user_id, request.document_ids),
+            request.exam_date,
+            request.available_hours_per_day,
+            tuple(sorted(normalize_text(t) for t in request.weak_topics or [])),
+            date.today().isoformat()
+        )
+        response = await run_generation(
+            "planner", key, request, StudyPlanResponse, ai_services.generate_study_plan,
             user_id=request.user_id,
             exam_date=request.exam_date,
             available_hours_per_day=request.available_hours_per_day,
@@ -313,6 +844,55 @@ async def generate_study_plan(request: StudyPlanRequest):
         raise HTTPException(status_code=500, detail=f"Study plan generation failed: {str(e)}")
 
 
+# ============================================================================
+# ADMIN: PROFILING
+# ============================================================================
+
+def require_admin(token: Optional[str]):
+    """Reject requests without the configured admin token"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not token or not secrets.compare_digest(token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.post("/admin/profile/start")
+async def start_profile(
+    request: ProfileStartRequest,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Start sampling CPU stacks (and allocations) in this worker
+    Runs for duration_seconds, for the next max_requests requests under
+    route, or until /admin/profile/stop
+    """
+    require_admin(x_admin_token)
+    try:
+        session = profiler.start(**request.dict())
+        return {"success": True, **session.status()}
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/admin/profile/stop")
+async def stop_profile(x_admin_token: Optional[str] = Header(None)):
+    """Stop the current session and write its output files"""
+    require_admin(x_admin_token)
+    session = profiler.stop()
+    if session is None:
+        raise HTTPException(status_code=404, detail="No profiling session")
+    return {"success": True, **session.status()}
+
+
+@app.get("/admin/profile/status")
+async def profile_status(x_admin_token: Optional[str] = Header(None)):
+    """State of the current or most recent session"""
+    require_admin(x_admin_token)
+    if profiler.session is None:
+        return {"active": False}
+    return profiler.session.status()
+
+
 # ============================================================================
 # ERROR HANDLERS
 # ============================================================================
@@ -346,6 +926,8 @@ async def general_exception_handler(request, exc):
 # ============================================================================
 
 if __name__ == "__main__":
+    import uvicorn
+    
     uvicorn.run(
         "main:app",
         host=settings.HOST,
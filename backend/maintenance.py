@@ -0,0 +1,394 @@
+"""
+Index Maintenance Module
+Offline bulk rebuild of per-user indexes after settings changes
+
+`rebuild` walks VECTOR_STORE_DIR and rebuilds every user's index for the
+current embedding provider, VECTOR_METRIC and quantization mode, one
+user per worker process:
+- Stored vectors are reused while the embedding signature is unchanged;
+  otherwise chunks are re-embedded in batches
+- With --rechunk, documents are split again under the current
+  CHUNK_SIZE/CHUNK_OVERLAP from the text cache (or the uploaded file).
+  Pages whose chunks already match keep their vectors
+- The new index is written to a staging directory, reloaded and checked
+  (row and per-document chunk counts) and then swapped in file by file
+  under the user's index writer lock, index_info.json last. A swap is
+  abandoned if the live index changed during the rebuild (the user is
+  picked up again by the next run)
+- Finished users are appended to a state file, so an interrupted run
+  resumes where it stopped; indexes already up to date are skipped
+
+Staged files are first moved next to the live ones as *.swap, and
+index_info.json.swap last, so a swap cut short by a crash can always be
+finished (or, if not every file was moved, dropped). rebuild, status and
+API startup run that recovery first. The API can keep serving meanwhile;
+requests see the old index until index_info.json is replaced.
+
+The shared engine (VECTOR_STORE_ENGINE=shared) is migrated with
+shared_index.py instead.
+
+Usage:
+    python maintenance.py rebuild [--rechunk] [--workers 4] [--user USER_ID] [--force] [--restart]
+    python maintenance.py status
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+import numpy as np
+from config import settings
+from models import IngestStatus
+from quantization import codec_for
+
+# Staging and state live here, next to the user directories
+MAINTENANCE_DIR = ".maintenance"
+
+# Index files in swap order; readers switch over when index_info.json is replaced
+INDEX_FILES = ["vectors.f32", "metadata.pkl", "vectors.codes", "index_info.json"]
+SWAP_SUFFIX = ".swap"
+
+# Per-process services, created on first use in each worker
+_services = {}
+
+
+def _get_services():
+    if not _services:
+        from metadata_store import create_metadata_store
+        from pdf_processor import PDFProcessor
+        from vector_store import VectorStore
+
+        _services["vector_store"] = VectorStore()
+        _services["pdf_processor"] = PDFProcessor()
+        _services["metadata_store"] = create_metadata_store()
+    return _services
+
+
+def user_ids() -> List[str]:
+    """User index directories under VECTOR_STORE_DIR"""
+    if not settings.VECTOR_STORE_DIR.exists():
+        return []
+    return sorted(
+        p.name for p in settings.VECTOR_STORE_DIR.iterdir()
+        if p.is_dir() and not p.name.startswith(".")
+    )
+
+
+def _finish_swap(user_dir: Path) -> bool:
+    """
+    Complete an interrupted swap in a user directory, or drop it if not
+    every staged file had been moved in yet
+    Returns: whether a swap was left over
+    """
+    staged = {name: user_dir / (name + SWAP_SUFFIX) for name in INDEX_FILES}
+    if not any(path.exists() for path in staged.values()):
+        return False
+    if not staged["index_info.json"].exists():
+        for path in staged.values():
+            path.unlink(missing_ok=True)
+        return True
+
+    for name in INDEX_FILES:
+        if staged[name].exists():
+            os.replace(staged[name], user_dir / name)
+    with open(user_dir / "index_info.json") as f:
+        if not json.load(f).get("codec"):
+            (user_dir / "vectors.codes").unlink(missing_ok=True)
+    return True
+
+
+def _swap_in(staging_dir: Path, user_dir: Path):
+    """Move a verified staged index over the live one (writer lock held)"""
+    for name in INDEX_FILES:
+        if (staging_dir / name).exists():
+            os.replace(staging_dir / name, user_dir / (name + SWAP_SUFFIX))
+    _finish_swap(user_dir)
+    shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+def recover_swaps(vector_store=None) -> List[str]:
+    """
+    Finish swaps a crash interrupted, and restore any user directory an
+    older version of this tool left moved aside as .maintenance/<user>.old
+    Returns: recovered user IDs
+    """
+    maintenance_dir = settings.VECTOR_STORE_DIR / MAINTENANCE_DIR
+    recovered = []
+    if maintenance_dir.exists():
+        for old_dir in maintenance_dir.glob("*.old"):
+            user_dir = settings.VECTOR_STORE_DIR / old_dir.name[:-len(".old")]
+            if not user_dir.exists():
+                os.rename(old_dir, user_dir)
+                recovered.append(user_dir.name)
+            else:
+                shutil.rmtree(old_dir, ignore_errors=True)
+    for user_id in user_ids():
+        user_dir = settings.VECTOR_STORE_DIR / user_id
+        if not any((user_dir / (name + SWAP_SUFFIX)).exists() for name in INDEX_FILES):
+            continue
+        vector_store = vector_store or _get_services()["vector_store"]
+        with vector_store._writer(user_id):
+            if _finish_swap(settings.VECTOR_STORE_DIR / user_id):
+                recovered.append(user_id)
+    return recovered
+
+
+def plan_key(rechunk: bool) -> str:
+    """Identity of the target configuration; state entries only count for the same plan"""
+    from embeddings import get_embedding_provider
+
+    material = [
+        get_embedding_provider().signature,
+        settings.VECTOR_METRIC,
+        settings.VECTOR_QUANTIZATION,
+        [settings.CHUNK_SIZE, settings.CHUNK_OVERLAP] if rechunk else None,
+    ]
+    return hashlib.sha256(json.dumps(material).encode()).hexdigest()[:16]
+
+
+def _state_path() -> Path:
+    return settings.VECTOR_STORE_DIR / MAINTENANCE_DIR / "state.jsonl"
+
+
+def read_state(plan: str) -> Dict[str, Dict]:
+    """Reports of users finished under this plan: {user_id: report}"""
+    path = _state_path()
+    if not path.exists():
+        return {}
+    done = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                if entry.get("plan") == plan:
+                    done[entry["user_id"]] = entry
+    return done
+
+
+def _append_state(entry: Dict):
+    path = _state_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _page_texts(pdf_processor, user_id: str, document_id: str, chunk: Dict) -> Optional[Dict[int, str]]:
+    """A document's page texts from the text cache or its uploaded file"""
+    content_hash = chunk.get("content_hash")
+    file_path = next((settings.UPLOAD_DIR / user_id).glob(f"{document_id}_*"), None)
+    if file_path is not None:
+        return pdf_processor.extract_text(file_path, content_hash)
+    cache_key = pdf_processor.text_cache_key(chunk.get("filename", ""), content_hash)
+    return pdf_processor.text_cache.get_pages(cache_key) if cache_key else None
+
+
+def rebuild_user(user_id: str, rechunk: bool = False, force: bool = False) -> Dict:
+    """
+    Rebuild one user's index in a staging directory and swap it in
+    Returns: report with chunk counts and timing
+    """
+    start = time.perf_counter()
+    services = _get_services()
+    vector_store = services["vector_store"]
+    vector_store._ensure_migrated(user_id)
+    info = vector_store._read_info(user_id)
+    mode = vector_store._mode(info)
+    same_model = info["embedding"] == vector_store.embedder.signature and info["dimension"] == vector_store.dimension
+    report = {"user_id": user_id, "rows_before": info["rows"]}
+    metadata_path = vector_store._get_user_metadata_path(user_id)
+    metadata_mtime = metadata_path.stat().st_mtime_ns if metadata_path.exists() else None
+
+    up_to_date = (
+        same_model
+        and info["metric"] == settings.VECTOR_METRIC
+        and info.get("codec") == (None if mode == "none" else codec_for(mode, info["rows"], info["dimension"]))
+    )
+    if up_to_date and not rechunk and not force:
+        return {**report, "status": "skipped", "rows_after": info["rows"], "seconds": 0.0}
+
+    # Read the live index as stored; it is left untouched until the swap
+    if info["rows"]:
+        vectors = np.memmap(
+            vector_store._get_user_vectors_path(user_id), dtype=np.float32, mode='r',
+            shape=(info["rows"], info["dimension"])
+        )
+    else:
+        vectors = np.empty((0, info["dimension"]), dtype=np.float32)
+    metadata = vector_store._load_metadata(user_id)[:info["rows"]]
+    documents: "OrderedDict[str, List[int]]" = OrderedDict()
+    for row, chunk in enumerate(metadata):
+        documents.setdefault(chunk["document_id"], []).append(row)
+
+    # New chunk list; source row of each reused vector, or None to embed
+    chunks, source_rows, unreadable = [], [], []
+    for document_id, rows in documents.items():
+        document_chunks = [metadata[row] for row in rows]
+        sources = list(range(len(rows)))
+        if rechunk:
+            page_texts = _page_texts(services["pdf_processor"], user_id, document_id, document_chunks[0])
+            if page_texts is None:
+                unreadable.append(document_id)
+            else:
+                document_chunks, sources = services["pdf_processor"].rechunk_changed_pages(
+                    page_texts, document_chunks, document_id,
+                    document_chunks[0].get("filename", ""), document_chunks[0].get("content_hash")
+                )
+        chunks.extend(document_chunks)
+        source_rows.extend(
+            rows[source] if source is not None and same_model else None for source in sources
+        )
+
+    embeddings = np.empty((len(chunks), vector_store.dimension), dtype=np.float32)
+    reused = [i for i, row in enumerate(source_rows) if row is not None]
+    missing = [i for i, row in enumerate(source_rows) if row is None]
+    if reused:
+        embeddings[reused] = vectors[[source_rows[i] for i in reused]]
+    for batch_start in range(0, len(missing), settings.EMBEDDING_BATCH_SIZE * 8):
+        batch = missing[batch_start:batch_start + settings.EMBEDDING_BATCH_SIZE * 8]
+        embeddings[batch] = vector_store.create_embeddings([chunks[i]["text"] for i in batch])
+
+    # Write into staging, keeping the user's quantization override
+    staging_id = f"{MAINTENANCE_DIR}/{user_id}"
+    staging_dir = settings.VECTOR_STORE_DIR / staging_id
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    staged_info = {"rows": 0, "dimension": vector_store.dimension, "embedding": vector_store.embedder.signature}
+    if info.get("quantization"):
+        staged_info["quantization"] = info["quantization"]
+    vector_store._write_info(staging_id, staged_info)
+    vector_store.save_index(staging_id, embeddings, chunks, metric=settings.VECTOR_METRIC)
+
+    # Verify before swapping
+    staged_vectors, staged_metadata = vector_store.load_index(staging_id)
+    expected = Counter(chunk["document_id"] for chunk in chunks)
+    if len(staged_vectors) != len(chunks) or len(staged_metadata) != len(chunks) \
+            or Counter(chunk["document_id"] for chunk in staged_metadata) != expected \
+            or (not rechunk and len(chunks) != len(metadata)):
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise RuntimeError(
+            f"Verification failed for '{user_id}': staged {len(staged_vectors)} rows, expected {len(chunks)}"
+        )
+    del staged_vectors, vectors
+
+    with vector_store._writer(user_id):
+        # Uploads or deletes since the snapshot would be lost by the swap
+        current_mtime = metadata_path.stat().st_mtime_ns if metadata_path.exists() else None
+        if vector_store._read_info(user_id) != info or current_mtime != metadata_mtime:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise RuntimeError(f"Index for '{user_id}' changed during the rebuild; run again")
+        _swap_in(staging_dir, settings.VECTOR_STORE_DIR / user_id)
+
+    if rechunk:
+        for document_id, count in expected.items():
+            if count != len(documents[document_id]):
+                services["metadata_store"].update_status(
+                    user_id, document_id, IngestStatus.READY, chunk_count=count
+                )
+
+    return {
+        **report,
+        "status": "rebuilt",
+        "rows_after": len(chunks),
+        "reused": len(reused),
+        "embedded": len(missing),
+        "unreadable_documents": unreadable,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def rebuild_all(
+    users: List[str],
+    rechunk: bool = False,
+    force: bool = False,
+    workers: int = 1,
+    restart: bool = False
+) -> Dict:
+    """Rebuild users in parallel, resuming from the state file"""
+    for user_id in recover_swaps():
+        print(f"Recovered interrupted swap for {user_id}", file=sys.stderr)
+    plan = plan_key(rechunk)
+    if restart and _state_path().exists():
+        _state_path().unlink()
+    done: Set[str] = set(read_state(plan))
+    pending = [user_id for user_id in users if user_id not in done]
+
+    start = time.perf_counter()
+    totals = Counter()
+    failures = {}
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(rebuild_user, user_id, rechunk, force): user_id for user_id in pending}
+        for finished, future in enumerate(as_completed(futures), start=1):
+            user_id = futures[future]
+            try:
+                report = future.result()
+            except Exception as e:
+                failures[user_id] = str(e)
+                print(f"[{finished}/{len(pending)}] {user_id}: FAILED {e}", file=sys.stderr)
+                continue
+            _append_state({"plan": plan, **report})
+            totals[report["status"]] += 1
+            totals["chunks"] += report["rows_after"]
+            totals["reused"] += report.get("reused", 0)
+            totals["embedded"] += report.get("embedded", 0)
+            print(
+                f"[{finished}/{len(pending)}] {user_id}: {report['status']} "
+                f"{report['rows_before']} -> {report['rows_after']} rows "
+                f"(reused {report.get('reused', 0)}, embedded {report.get('embedded', 0)}) "
+                f"in {report['seconds']}s",
+                file=sys.stderr
+            )
+
+    elapsed = time.perf_counter() - start
+    return {
+        "plan": plan,
+        "users": len(users),
+        "resumed_done": len(done & set(users)),
+        "rebuilt": totals["rebuilt"],
+        "skipped": totals["skipped"],
+        "failed": failures,
+        "chunks": totals["chunks"],
+        "vectors_reused": totals["reused"],
+        "chunks_embedded": totals["embedded"],
+        "elapsed_s": round(elapsed, 2),
+        "chunks_per_s": round(totals["chunks"] / elapsed, 1) if elapsed else None,
+        "users_per_s": round(len(pending) / elapsed, 2) if elapsed else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline vector index maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild_parser = commands.add_parser("rebuild", help="Rebuild every user's index for the current settings")
+    rebuild_parser.add_argument("--user", action="append", help="Only these users (repeatable)")
+    rebuild_parser.add_argument("--rechunk", action="store_true", help="Re-chunk under CHUNK_SIZE/CHUNK_OVERLAP")
+    rebuild_parser.add_argument("--force", action="store_true", help="Rebuild indexes that are already up to date")
+    rebuild_parser.add_argument("--restart", action="store_true", help="Ignore the state of earlier runs")
+    rebuild_parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+
+    status_parser = commands.add_parser("status", help="Progress of the current plan")
+    status_parser.add_argument("--rechunk", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "rebuild":
+        report = rebuild_all(args.user or user_ids(), args.rechunk, args.force, args.workers, args.restart)
+        print(json.dumps(report, indent=2))
+        sys.exit(1 if report["failed"] else 0)
+    else:
+        recover_swaps()
+        plan = plan_key(args.rechunk)
+        done = read_state(plan)
+        users = user_ids()
+        print(json.dumps({
+            "plan": plan,
+            "users": len(users),
+            "done": len(set(done) & set(users)),
+            "pending": [user_id for user_id in users if user_id not in done],
+        }, indent=2))
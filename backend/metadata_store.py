@@ -0,0 +1,225 @@
+"""
+Metadata Store Module
+Durable storage for document metadata and ingest status
+"""
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+from config import settings
+from models import DocumentMetadata, IngestStatus
+
+class MetadataStore(ABC):
+    """
+    Interface for document metadata backends
+
+    The SQLite implementation below is the default; a Postgres/Supabase
+    backend only needs to implement these methods.
+    """
+
+    @abstractmethod
+    def add_document(self, user_id: str, metadata: DocumentMetadata):
+        """Insert or replace a document's metadata"""
+
+    @abstractmethod
+    def update_status(
+        self,
+        user_id: str,
+        document_id: str,
+        status: IngestStatus,
+        chunk_count: Optional[int] = None
+    ):
+        """Update ingest status (and optionally chunk count) of a document"""
+
+    @abstractmethod
+    def get_document(self, user_id: str, document_id: str) -> Optional[DocumentMetadata]:
+        """Get a single document's metadata"""
+
+    @abstractmethod
+    def count_by_content_hash(self, content_hash: str) -> int:
+        """Count documents with the given content hash across all users"""
+
+    @abstractmethod
+    def list_documents(
+        self,
+        user_id: str,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> List[DocumentMetadata]:
+        """List a user's documents, newest first"""
+
+    @abstractmethod
+    def count_documents(self, user_id: str) -> int:
+        """Count a user's documents"""
+
+    @abstractmethod
+    def delete_document(self, user_id: str, document_id: str) -> bool:
+        """Delete a document's metadata. Returns False if it did not exist"""
+
+
+class SQLiteMetadataStore(MetadataStore):
+    """Metadata store backed by an embedded SQLite database in WAL mode"""
+
+    _COLUMNS = (
+        "document_id, filename, subject, topic, total_pages, upload_timestamp, "
+        "file_size_bytes, content_hash, chunk_count, status"
+    )
+
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = db_path or settings.METADATA_DB_PATH
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # One connection per thread; sqlite3 connections are not thread-safe
+        self._local = threading.local()
+        self._create_schema()
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Get this thread's database connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _create_schema(self):
+        """Create tables and indexes if they don't exist"""
+        conn = self._get_connection()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    user_id TEXT NOT NULL,
+                    document_id TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    subject TEXT,
+                    topic TEXT,
+                    total_pages INTEGER NOT NULL,
+                    upload_timestamp TEXT NOT NULL,
+                    file_size_bytes INTEGER NOT NULL,
+                    content_hash TEXT,
+                    chunk_count INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL,
+                    PRIMARY KEY (user_id, document_id)
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_documents_user_time
+                ON documents (user_id, upload_timestamp)
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_documents_user_hash
+                ON documents (user_id, content_hash)
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_documents_hash
+                ON documents (content_hash)
+            """)
+
+    def _row_to_metadata(self, row: tuple) -> DocumentMetadata:
+        """Convert a database row to DocumentMetadata"""
+        return DocumentMetadata(
+            document_id=row[0],
+            filename=row[1],
+            subject=row[2],
+            topic=row[3],
+            total_pages=row[4],
+            upload_timestamp=datetime.fromisoformat(row[5]),
+            file_size_bytes=row[6],
+            content_hash=row[7],
+            chunk_count=row[8],
+            status=IngestStatus(row[9])
+        )
+
+    def add_document(self, user_id: str, metadata: DocumentMetadata):
+        conn = self._get_connection()
+        with conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO documents (user_id, {self._COLUMNS}) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    user_id,
+                    metadata.document_id,
+                    metadata.filename,
+                    metadata.subject,
+                    metadata.topic,
+                    metadata.total_pages,
+                    metadata.upload_timestamp.isoformat(),
+                    metadata.file_size_bytes,
+                    metadata.content_hash,
+                    metadata.chunk_count,
+                    metadata.status.value
+                )
+            )
+
+    def update_status(
+        self,
+        user_id: str,
+        document_id: str,
+        status: IngestStatus,
+        chunk_count: Optional[int] = None
+    ):
+        conn = self._get_connection()
+        with conn:
+            if chunk_count is None:
+                conn.execute(
+                    "UPDATE documents SET status = ? WHERE user_id = ? AND document_id = ?",
+                    (status.value, user_id, document_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE documents SET status = ?, chunk_count = ? "
+                    "WHERE user_id = ? AND document_id = ?",
+                    (status.value, chunk_count, user_id, document_id)
+                )
+
+    def get_document(self, user_id: str, document_id: str) -> Optional[DocumentMetadata]:
+        row = self._get_connection().execute(
+            f"SELECT {self._COLUMNS} FROM documents WHERE user_id = ? AND document_id = ?",
+            (user_id, document_id)
+        ).fetchone()
+        return self._row_to_metadata(row) if row else None
+
+    def count_by_content_hash(self, content_hash: str) -> int:
+        row = self._get_connection().execute(
+            "SELECT COUNT(*) FROM documents WHERE content_hash = ?",
+            (content_hash,)
+        ).fetchone()
+        return row[0]
+
+    def list_documents(
+        self,
+        user_id: str,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> List[DocumentMetadata]:
+        rows = self._get_connection().execute(
+            f"SELECT {self._COLUMNS} FROM documents WHERE user_id = ? "
+            "ORDER BY upload_timestamp DESC LIMIT ? OFFSET ?",
+            (user_id, -1 if limit is None else limit, offset)
+        ).fetchall()
+        return [self._row_to_metadata(row) for row in rows]
+
+    def count_documents(self, user_id: str) -> int:
+        row = self._get_connection().execute(
+            "SELECT COUNT(*) FROM documents WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+        return row[0]
+
+    def delete_document(self, user_id: str, document_id: str) -> bool:
+        conn = self._get_connection()
+        with conn:
+            cursor = conn.execute(
+                "DELETE FROM documents WHERE user_id = ? AND document_id = ?",
+                (user_id, document_id)
+            )
+        return cursor.rowcount > 0
+
+
+def create_metadata_store() -> MetadataStore:
+    """Create the configured metadata store backend"""
+    if settings.METADATA_BACKEND == "sqlite":
+        return SQLiteMetadataStore()
+    raise ValueError(f"Unsupported metadata backend: {settings.METADATA_BACKEND}")
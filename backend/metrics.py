@@ -0,0 +1,195 @@
+"""
+Metrics Module
+Per-stage latency histograms, counters and Prometheus text exposition
+
+Hot paths wrap their stages in `stage(name)`. Each stage is observed in
+the `velosify_stage_duration_seconds` histogram and added to the current
+request's timing breakdown, which the HTTP middleware returns as a
+Server-Timing header. With METRICS_ENABLED=false `stage` returns a shared
+no-op context manager.
+"""
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Dict, Iterable, Optional, Tuple
+from config import settings
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return "\n".join(lines)
+
+
+class Gauge:
+    """Value that can go up and down, with optional labels"""
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *label_values: str):
+        with self._lock:
+            self._values[label_values] = value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {value}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Iterable[str] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # {label_values: [bucket counts..., sum, count]}
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(self.label_names, label_values, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.label_names, label_values, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                labels = _format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {series[-2]}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return "\n".join(lines)
+
+
+# Registered metrics, rendered in this order
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+STAGE_DURATION = register(Histogram(
+    "velosify_stage_duration_seconds", "Time spent in each processing stage", ["stage"]
+))
+STAGE_ERRORS = register(Counter(
+    "velosify_stage_errors_total", "Stages that raised an exception", ["stage"]
+))
+REQUEST_DURATION = register(Histogram(
+    "velosify_http_request_duration_seconds", "HTTP request latency", ["method", "route"]
+))
+REQUESTS = register(Counter(
+    "velosify_http_requests_total", "HTTP requests by status code", ["method", "route", "status"]
+))
+
+# Stage timings for the request being handled: {stage: seconds}
+_request_stages: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_stages", default=None)
+
+_NOOP = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        STAGE_DURATION.observe(elapsed, self.name)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(self.name)
+        timings = _request_stages.get()
+        if timings is not None:
+            timings[self.name] = timings.get(self.name, 0.0) + elapsed
+        return False
+
+
+def stage(name: str):
+    """Time the wrapped block as a named stage"""
+    if not settings.METRICS_ENABLED:
+        return _NOOP
+    return _Stage(name)
+
+
+def start_request() -> Dict[str, float]:
+    """Begin collecting a stage breakdown for the current request"""
+    timings: Dict[str, float] = {}
+    _request_stages.set(timings)
+    return timings
+
+
+def server_timing_header(timings: Dict[str, float], total: float) -> str:
+    """Format a stage breakdown as a Server-Timing header value"""
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def render_metrics() -> str:
+    """All registered metrics in Prometheus text format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
@@ -0,0 +1,128 @@
+"""
+Mock Services Module
+Local stand-ins for Gemini with configurable latency, jitter and failures
+"""
+import json
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from config import settings
+
+class MockServiceError(Exception):
+    """Simulated provider failure"""
+
+
+class LatencyModel:
+    """
+    Samples simulated call latency and failures
+
+    distribution:
+        normal      mean_ms +/- jitter_ms (clamped at 0)
+        lognormal   right-skewed around mean_ms, spread set by jitter_ms
+        exponential mean_ms on average, jitter_ms ignored
+    """
+
+    def __init__(
+        self,
+        mean_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        failure_rate: float = 0.0,
+        distribution: str = "normal",
+        seed: Optional[int] = None
+    ):
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.distribution = distribution
+        self._rng = random.Random(seed)
+
+    def sample_ms(self) -> float:
+        """Draw one latency in milliseconds"""
+        if self.mean_ms <= 0:
+            return 0.0
+        if self.distribution == "lognormal":
+            sigma = self.jitter_ms / self.mean_ms if self.jitter_ms else 0.0
+            return self.mean_ms * self._rng.lognormvariate(-sigma * sigma / 2, sigma)
+        if self.distribution == "exponential":
+            return self._rng.expovariate(1.0 / self.mean_ms)
+        return max(0.0, self._rng.gauss(self.mean_ms, self.jitter_ms))
+
+    def simulate(self):
+        """Sleep for a sampled latency, then maybe fail"""
+        delay_ms = self.sample_ms()
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            raise MockServiceError("429 Resource has been exhausted (simulated)")
+
+
+class MockResponse:
+    """Minimal stand-in for a LangChain message"""
+
+    def __init__(self, content: str):
+        self.content = content
+
+
+class MockChatModel:
+    """
+    Chat model stand-in with the invoke/batch interface used by the services
+
+    Returns well-formed JSON for notes, quiz and study plan prompts so the
+    parsing paths run as they would against the real model.
+    """
+
+    def __init__(self, latency: Optional[LatencyModel] = None):
+        self.latency = latency or LatencyModel(
+            settings.MOCK_LLM_LATENCY_MS,
+            settings.MOCK_LLM_JITTER_MS,
+            settings.MOCK_LLM_FAILURE_RATE,
+            settings.MOCK_LATENCY_DISTRIBUTION
+        )
+
+    def invoke(self, prompt: str) -> MockResponse:
+        self.latency.simulate()
+        return MockResponse(self._respond(prompt))
+
+    def batch(self, prompts: List[str], config: Optional[dict] = None, return_exceptions: bool = False):
+        max_workers = (config or {}).get("max_concurrency") or len(prompts) or 1
+
+        def call(prompt):
+            try:
+                return self.invoke(prompt)
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(call, prompts))
+
+    def _respond(self, prompt: str) -> str:
+        """Produce a plausible response for the prompt type"""
+        if "GENERATE NOTES" in prompt:
+            return json.dumps({"sections": [{
+                "title": "Key Concepts",
+                "content": ["Mock point one", "Mock point two"],
+                "examples": ["Mock example"],
+                "highlights": ["Mock highlight"]
+            }]})
+
+        match = re.search(r"GENERATE (\d+) QUESTIONS", prompt)
+        if match:
+            return json.dumps({"questions": [{
+                "question": f"Mock question {i + 1}?",
+                "options": ["A", "B", "C", "D"],
+                "correct_answer": i % 4,
+                "explanation": "Mock explanation",
+                "difficulty": "medium",
+                "source_page": 1,
+                "source_document": "mock.pdf"
+            } for i in range(int(match.group(1)))]})
+
+        match = re.search(r"NAME (\d+) TOPICS", prompt)
+        if match:
+            return json.dumps({"topics": [f"Mock topic {i + 1}" for i in range(int(match.group(1)))]})
+
+        return "- Mock answer based on the provided context (Page 1)"
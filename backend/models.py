@@ -12,6 +12,12 @@ class DifficultyLevel(str, Enum):
     MEDIUM = "medium"
     HARD = "hard"
 
+class IngestStatus(str, Enum):
+    """Document ingest status"""
+    PROCESSING = "processing"
+    READY = "ready"
+    FAILED = "failed"
+
 class DocumentMetadata(BaseModel):
     """Metadata for uploaded documents"""
     document_id: str
@@ -21,6 +27,10 @@ class DocumentMetadata(BaseModel):
     total_pages: int
     upload_timestamp: datetime
     file_size_bytes: int
+    content_hash: Optional[str] = None
+    chunk_count: int = 0
+    status: IngestStatus = IngestStatus.READY
+    shared: bool = False  # Attached from the shared library
 
 class UploadResponse(BaseModel):
     """Response after successful document upload"""
@@ -31,12 +41,26 @@ class UploadResponse(BaseModel):
     total_pages: int
     chunks_created: int
 
+class ReplaceDocumentResponse(UploadResponse):
+    """Response after replacing a document with a revised version"""
+    chunks_embedded: int = 0
+    chunks_reused: int = 0
+    pages_changed: List[int] = []  # Re-chunked and re-embedded
+    pages_removed: int = 0
+
 class ChatRequest(BaseModel):
     """Request for RAG-based chat"""
     user_id: str
     query: str
     document_ids: Optional[List[str]] = None  # If None, search all user's documents
     max_results: int = Field(default=5, ge=1, le=10)
+    session_id: Optional[str] = None  # Continue a conversation from an earlier response
+    start_session: bool = False  # Open a conversation; the response carries its session_id
+
+class ChatSessionRequest(BaseModel):
+    """Request identifying a user's chat session"""
+    user_id: str
+    session_id: str
 
 class SourceReference(BaseModel):
     """Source reference for RAG answers"""
@@ -51,6 +75,19 @@ class ChatResponse(BaseModel):
     sources: List[SourceReference]
     found_in_documents: bool
     query: str
+    session_id: Optional[str] = None  # Pass back to ask follow-up questions
+
+class BatchChatRequest(BaseModel):
+    """Request for answering several questions in one call"""
+    user_id: str
+    queries: List[str] = Field(min_length=1, max_length=20)
+    document_ids: Optional[List[str]] = None
+    max_results: int = Field(default=5, ge=1, le=10)
+
+class BatchChatResponse(BaseModel):
+    """Responses for a batch chat request, in query order"""
+    success: bool
+    responses: List[ChatResponse]
 
 class NotesRequest(BaseModel):
     """Request for generating study notes"""
@@ -59,6 +96,7 @@ class NotesRequest(BaseModel):
     topic: Optional[str] = None
     include_examples: bool = True
     include_highlights: bool = True
+    force_refresh: bool = False  # Bypass cached results
 
 class NotesSection(BaseModel):
     """A section in generated notes"""
@@ -91,6 +129,7 @@ class QuizRequest(BaseModel):
     num_questions: int = Field(default=10, ge=1, le=50)
     difficulty: Optional[DifficultyLevel] = None
     topic: Optional[str] = None
+    force_refresh: bool = False  # Bypass cached results
 
 class QuizResponse(BaseModel):
     """Response with generated quiz"""
@@ -105,6 +144,7 @@ class StudyPlanRequest(BaseModel):
     available_hours_per_day: float
     weak_topics: Optional[List[str]] = None
     document_ids: Optional[List[str]] = None
+    force_refresh: bool = False  # Bypass cached results
 
 class DailyTask(BaseModel):
     """A task in the study plan"""
@@ -128,12 +168,36 @@ class DocumentListResponse(BaseModel):
     success: bool
     documents: List[DocumentMetadata]
     total_count: int
+    has_more: bool = False
 
 class DeleteDocumentRequest(BaseModel):
     """Request to delete a document"""
     user_id: str
     document_id: str
 
+class LibraryDocumentRequest(BaseModel):
+    """Request to publish, attach or detach a library document"""
+    user_id: str
+    document_id: str
+
+class LibraryDocument(DocumentMetadata):
+    """Published library document"""
+    attachments: int = 0
+
+class LibraryListResponse(BaseModel):
+    """Shared library catalog and storage totals"""
+    success: bool
+    documents: List[LibraryDocument]
+    storage: Dict[str, int]
+
+class ProfileStartRequest(BaseModel):
+    """Start an on-demand profiling session"""
+    duration_seconds: Optional[float] = Field(default=None, gt=0, le=600)
+    max_requests: Optional[int] = Field(default=None, ge=1, le=10000)
+    route: Optional[str] = None  # Path prefix, e.g. "/api/upload"
+    interval_ms: float = Field(default=10.0, ge=1, le=1000)
+    memory: bool = True
+
 class ErrorResponse(BaseModel):
     """Standard error response"""
     success: bool = False
@@ -1,36 +1,332 @@
 """
 PDF Processing Module
-Handles PDF upload, text extraction, and chunking
+Handles document upload, text extraction, and chunking
+
+Text comes from extractor plugins registered per file extension. For
+each file the enabled extractors (EXTRACTORS, in preference order) that
+are installed are tried in turn: native-backed PDF libraries first
+(PyMuPDF, pypdfium2), pure-Python PyPDF2 last, plus DOCX, PPTX, Markdown
+and plain text. A page that fails or runs past EXTRACT_PAGE_TIMEOUT_S is
+retried with the next extractor, so one pathological page can't stall
+an upload. Formats without pages are split into virtual pages of
+EXTRACT_VIRTUAL_PAGE_CHARS characters.
 """
 import os
 import hashlib
+import importlib.util
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from functools import partial
 from pathlib import Path
-from typing import List, Dict, Tuple
+from typing import Any, Callable, List, Dict, Iterable, Iterator, Optional, Tuple
 from datetime import datetime
-import PyPDF2
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from config import settings
 from models import DocumentMetadata
+from metrics import Counter, Histogram, register, stage
+from text_cache import TextCache
+
+EXTRACTED_PAGES = register(Counter(
+    "velosify_extract_pages_total", "Pages extracted by extractor and outcome (ok, error, timeout)",
+    ["extractor", "outcome"]
+))
+PAGE_DURATION = register(Histogram(
+    "velosify_extract_page_seconds", "Time to extract one page", ["extractor"]
+))
+
+
+class PageTimeout(Exception):
+    """Raised when extracting a page takes longer than EXTRACT_PAGE_TIMEOUT_S"""
+
+
+class _PageWorker:
+    """
+    One document's page extractions on a single reused daemon thread
+
+    A call that runs past its timeout is abandoned along with its thread
+    (the thread exits once the call returns) and later calls get a fresh
+    thread. on_abandon runs when the abandoned call finally finishes, so
+    resources it still uses can be released then.
+    """
+
+    def __init__(self):
+        self._tasks: Optional[queue.SimpleQueue] = None
+
+    def _start(self) -> queue.SimpleQueue:
+        tasks = queue.SimpleQueue()
+
+        def loop():
+            while True:
+                item = tasks.get()
+                if item is None:
+                    return
+                future, func = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(func())
+                except BaseException as e:
+                    future.set_exception(e)
+
+        threading.Thread(target=loop, name="page-extract", daemon=True).start()
+        return tasks
+
+    def run(self, func: Callable[[], Any], timeout: float, on_abandon: Optional[Callable[[], None]] = None) -> Any:
+        """Run func and wait up to timeout seconds for it"""
+        if timeout <= 0:
+            return func()
+        if self._tasks is None:
+            self._tasks = self._start()
+        future = Future()
+        self._tasks.put((future, func))
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            # The thread is stuck in func; let it exit afterwards
+            self._tasks.put(None)
+            self._tasks = None
+            if on_abandon is not None:
+                future.add_done_callback(lambda _: on_abandon())
+            raise PageTimeout(f"Page extraction exceeded {timeout}s")
+
+    def close(self):
+        """Let the thread exit once it is idle"""
+        if self._tasks is not None:
+            self._tasks.put(None)
+            self._tasks = None
+
+
+def _virtual_pages(paragraphs: List[str]) -> List[str]:
+    """Group paragraphs into pages of about EXTRACT_VIRTUAL_PAGE_CHARS characters"""
+    pages, current, size = [], [], 0
+    for paragraph in paragraphs:
+        if current and size + len(paragraph) > settings.EXTRACT_VIRTUAL_PAGE_CHARS:
+            pages.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(paragraph)
+        size += len(paragraph)
+    if current:
+        pages.append("\n\n".join(current))
+    return pages
+
+
+class TextExtractor:
+    """
+    Extractor plugin: opens a file and returns the text of one page at a time
+    Subclasses set the name, the extensions they read and the module they need
+    """
+    name = ""
+    extensions: Tuple[str, ...] = ()
+    requires: Optional[str] = None
+    
+    @property
+    def version(self) -> str:
+        """Extractor name plus the installed library version"""
+        if not self.requires:
+            return self.name
+        module = __import__(self.requires)
+        return f"{self.name}:{getattr(module, '__version__', getattr(module, 'VERSION', ''))}"
+    
+    def available(self) -> bool:
+        """Whether the required library is installed"""
+        return self.requires is None or importlib.util.find_spec(self.requires) is not None
+    
+    def open(self, path: Path) -> Any:
+        """Open the file; the handle is passed to page_count/page_text"""
+        raise NotImplementedError
+    
+    def page_count(self, handle: Any) -> int:
+        return len(handle)
+    
+    def page_text(self, handle: Any, index: int) -> str:
+        return handle[index]
+    
+    def close(self, handle: Any):
+        pass
+
+
+class PyMuPDFExtractor(TextExtractor):
+    """MuPDF (C) through PyMuPDF"""
+    name = "pymupdf"
+    extensions = (".pdf",)
+    requires = "fitz"
+    
+    def open(self, path: Path):
+        import fitz
+        return fitz.open(str(path))
+    
+    def page_text(self, handle, index: int) -> str:
+        return handle[index].get_text()
+    
+    def close(self, handle):
+        handle.close()
+
+
+class PdfiumExtractor(TextExtractor):
+    """PDFium (C++) through pypdfium2"""
+    name = "pdfium"
+    extensions = (".pdf",)
+    requires = "pypdfium2"
+    
+    def open(self, path: Path):
+        import pypdfium2
+        return pypdfium2.PdfDocument(str(path))
+    
+    def page_text(self, handle, index: int) -> str:
+        return handle[index].get_textpage().get_text_range()
+    
+    def close(self, handle):
+        handle.close()
+
+
+class PyPDF2Extractor(TextExtractor):
+    """Pure-Python fallback"""
+    name = "pypdf2"
+    extensions = (".pdf",)
+    requires = "PyPDF2"
+    
+    def open(self, path: Path):
+        import PyPDF2
+        file = open(path, 'rb')
+        return file, PyPDF2.PdfReader(file)
+    
+    def page_count(self, handle) -> int:
+        return len(handle[1].pages)
+    
+    def page_text(self, handle, index: int) -> str:
+        return handle[1].pages[index].extract_text()
+    
+    def close(self, handle):
+        handle[0].close()
+
+
+class DocxExtractor(TextExtractor):
+    """Word documents through python-docx; paragraphs and table cells"""
+    name = "docx"
+    extensions = (".docx",)
+    requires = "docx"
+    
+    def open(self, path: Path) -> List[str]:
+        import docx
+        document = docx.Document(str(path))
+        paragraphs = [p.text for p in document.paragraphs if p.text.strip()]
+        for table in document.tables:
+            for row in table.rows:
+                paragraphs.append(" | ".join(cell.text for cell in row.cells))
+        return _virtual_pages(paragraphs)
+
+
+class PptxExtractor(TextExtractor):
+    """PowerPoint through python-pptx; one page per slide"""
+    name = "pptx"
+    extensions = (".pptx",)
+    requires = "pptx"
+    
+    def open(self, path: Path) -> List[str]:
+        import pptx
+        presentation = pptx.Presentation(str(path))
+        return [
+            "\n".join(
+                shape.text_frame.text for shape in slide.shapes
+                if shape.has_text_frame and shape.text_frame.text.strip()
+            )
+            for slide in presentation.slides
+        ]
+
+
+class PlainTextExtractor(TextExtractor):
+    """UTF-8 text, split into virtual pages on blank lines"""
+    name = "text"
+    extensions = (".txt",)
+    
+    def open(self, path: Path) -> List[str]:
+        text = path.read_text(encoding="utf-8", errors="replace")
+        return _virtual_pages([p for p in text.split("\n\n") if p.strip()])
+
+
+class MarkdownExtractor(PlainTextExtractor):
+    """Markdown as plain text; pages break at headings when possible"""
+    name = "markdown"
+    extensions = (".md", ".markdown")
+    
+    def open(self, path: Path) -> List[str]:
+        text = path.read_text(encoding="utf-8", errors="replace")
+        blocks, current = [], []
+        for line in text.splitlines():
+            if line.lstrip().startswith("#") and current:
+                blocks.append("\n".join(current))
+                current = []
+            current.append(line)
+        blocks.append("\n".join(current))
+        return _virtual_pages([block for block in blocks if block.strip()])
+
+
+# Registered extractors by name
+EXTRACTORS: Dict[str, TextExtractor] = {}
+
+
+def register_extractor(extractor: TextExtractor) -> TextExtractor:
+    """Make an extractor available; enable it by listing its name in EXTRACTORS"""
+    EXTRACTORS[extractor.name] = extractor
+    return extractor
+
+
+for _extractor in (
+    PyMuPDFExtractor(), PdfiumExtractor(), PyPDF2Extractor(),
+    DocxExtractor(), PptxExtractor(), MarkdownExtractor(), PlainTextExtractor()
+):
+    register_extractor(_extractor)
+
+
+def extractors_for(filename: str) -> List[TextExtractor]:
+    """Enabled, installed extractors for a file, in preference order"""
+    extension = Path(filename).suffix.lower()
+    return [
+        EXTRACTORS[name] for name in settings.EXTRACTORS
+        if name in EXTRACTORS and extension in EXTRACTORS[name].extensions and EXTRACTORS[name].available()
+    ]
+
+
+def supported_extensions() -> List[str]:
+    """Extensions at least one enabled, installed extractor can read"""
+    return sorted({
+        extension
+        for name in settings.EXTRACTORS if name in EXTRACTORS and EXTRACTORS[name].available()
+        for extension in EXTRACTORS[name].extensions
+    })
+
 
 class PDFProcessor:
-    """Handles PDF document processing"""
+    """Handles document processing"""
     
     def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=settings.CHUNK_SIZE,
-            chunk_overlap=settings.CHUNK_OVERLAP,
-            separators=["\n\n", "\n", ". ", " ", ""],
-            length_function=len,
-        )
+        self._text_splitter = None
+        self.text_cache = TextCache() if settings.TEXT_CACHE_ENABLED else None
+    
+    @property
+    def text_splitter(self):
+        """Text splitter, created on first use to keep imports lazy"""
+        if self._text_splitter is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            self._text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=settings.CHUNK_SIZE,
+                chunk_overlap=settings.CHUNK_OVERLAP,
+                separators=["\n\n", "\n", ". ", " ", ""],
+                length_function=len,
+            )
+        return self._text_splitter
     
     def validate_file(self, filename: str, file_size: int) -> Tuple[bool, str]:
         """
         Validate uploaded file
         Returns: (is_valid, error_message)
         """
-        # Check extension
-        if not filename.lower().endswith('.pdf'):
-            return False, "Only PDF files are allowed"
+        # Check extension against the installed extractors
+        allowed = supported_extensions()
+        if Path(filename).suffix.lower() not in allowed:
+            return False, f"Unsupported file type. Allowed: {', '.join(allowed)}"
         
         # Check file size
         if file_size > settings.MAX_FILE_SIZE_BYTES:
@@ -38,36 +334,171 @@ class PDFProcessor:
         
         return True, ""
     
-    def generate_document_id(self, user_id: str, filename: str) -> str:
-        """Generate unique document ID"""
-        timestamp = datetime.utcnow().isoformat()
-        unique_string = f"{user_id}_{filename}_{timestamp}"
+    def compute_content_hash(self, file_content: bytes) -> str:
+        """Compute SHA-256 of the uploaded bytes"""
+        return hashlib.sha256(file_content).hexdigest()
+    
+    def generate_document_id(self, user_id: str, content_hash: str) -> str:
+        """
+        Generate document ID from the user and file content
+        Identical bytes uploaded by the same user map to the same ID
+        """
+        unique_string = f"{user_id}_{content_hash}"
         return hashlib.sha256(unique_string.encode()).hexdigest()[:16]
     
-    def extract_text_from_pdf(self, pdf_path: Path) -> Dict[int, str]:
+    def text_cache_key(self, filename: str, content_hash: Optional[str]) -> Optional[str]:
+        """Text cache key for a file's bytes, or None when caching is off"""
+        if self.text_cache is None or not content_hash:
+            return None
+        return self.text_cache.cache_key(content_hash, [e.version for e in extractors_for(filename)])
+    
+    def extract_text(self, file_path: Path, content_hash: Optional[str] = None) -> Dict[int, str]:
         """
-        Extract text from PDF, page by page
+        Extract text page by page with the preferred extractor for the format
+        With the file's content hash, pages come from the text cache when
+        this file was extracted before
         Returns: {page_number: text_content}
         """
-        page_texts = {}
+        cache_key = self.text_cache_key(file_path.name, content_hash)
+        if cache_key:
+            page_texts = self.text_cache.get_pages(cache_key)
+            if page_texts is not None:
+                return page_texts
         
+        page_texts, complete = self._extract(file_path)
+        if cache_key and complete:
+            self.text_cache.put_pages(cache_key, page_texts)
+        return page_texts
+    
+    def _extract(self, file_path: Path) -> Tuple[Dict[int, str], bool]:
+        """
+        Run the extractor chain over every page
+        Returns: ({page_number: text_content}, whether every page was read)
+        """
         try:
-            with open(pdf_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                total_pages = len(pdf_reader.pages)
-                
-                for page_num in range(total_pages):
-                    page = pdf_reader.pages[page_num]
-                    text = page.extract_text()
-                    
-                    # Clean and normalize text
-                    text = self._clean_text(text)
-                    page_texts[page_num + 1] = text  # 1-indexed pages
-                    
+            with stage("pdf.extract"):
+                chain, handles, page_count = self._open_document(file_path)
+                pages = list(self._iter_extract(file_path, chain, handles, page_count))
         except Exception as e:
-            raise Exception(f"Failed to extract text from PDF: {str(e)}")
+            raise Exception(f"Failed to extract text from {file_path.name}: {str(e)}")
+        return {page_num: text or "" for page_num, text in pages}, all(text is not None for _, text in pages)
+    
+    def _open_document(self, file_path: Path) -> Tuple[List[TextExtractor], Dict[str, Any], int]:
+        """
+        Open the file with the first extractor in the chain that can read it
+        Returns: (extractor chain, open handles by extractor name, page count)
+        """
+        chain = extractors_for(file_path.name)
+        if not chain:
+            raise Exception(f"No extractor installed for '{file_path.suffix}' files")
         
-        return page_texts
+        # Open handles per extractor; None marks one that can't read this file
+        handles: Dict[str, Any] = {}
+        try:
+            for extractor in chain:
+                handle = self._open(extractor, file_path, handles)
+                if handle is not None:
+                    return chain, handles, extractor.page_count(handle)
+            raise Exception(f"No extractor could open {file_path.name}")
+        except Exception:
+            self._close_handles(handles)
+            raise
+    
+    def _iter_extract(
+        self,
+        file_path: Path,
+        chain: List[TextExtractor],
+        handles: Dict[str, Any],
+        page_count: int
+    ) -> Iterator[Tuple[int, Optional[str]]]:
+        """
+        Read and clean pages one at a time, closing the handles when done
+        Yields: (page_number, cleaned text or None if the page was unreadable)
+        """
+        worker = _PageWorker()
+        try:
+            for index in range(page_count):
+                text = self._extract_page(chain, handles, file_path, index, worker)
+                yield index + 1, None if text is None else self._clean_text(text)  # 1-indexed pages
+        finally:
+            worker.close()
+            self._close_handles(handles)
+    
+    def _close_handles(self, handles: Dict[str, Any]):
+        for name, handle in handles.items():
+            if handle is not None:
+                try:
+                    EXTRACTORS[name].close(handle)
+                except Exception:
+                    pass
+    
+    def stream_pages(self, file_path: Path, content_hash: Optional[str] = None) -> Tuple[int, Iterator[Tuple[int, str]]]:
+        """
+        Page count and a generator of cleaned page texts, extracted as they
+        are consumed. With the text cache on, pages are extracted (or
+        replayed) and cached up front instead, so a failure further down the
+        ingest never costs the extraction again; the cache entry holds every
+        page text anyway
+        Returns: (page_count, iterator of (page_number, text_content))
+        """
+        if self.text_cache_key(file_path.name, content_hash):
+            page_texts = self.extract_text(file_path, content_hash)
+            return len(page_texts), iter(page_texts.items())
+        
+        try:
+            chain, handles, page_count = self._open_document(file_path)
+        except Exception as e:
+            raise Exception(f"Failed to extract text from {file_path.name}: {str(e)}")
+        pages = self._iter_extract(file_path, chain, handles, page_count)
+        return page_count, ((page_num, text or "") for page_num, text in pages)
+    
+    def _open(self, extractor: TextExtractor, file_path: Path, handles: Dict[str, Any]) -> Any:
+        """This document's handle for an extractor, opening it on first use"""
+        if extractor.name not in handles:
+            try:
+                handles[extractor.name] = extractor.open(file_path)
+            except Exception as e:
+                print(f"Error opening {file_path.name} with {extractor.name}: {e}")
+                handles[extractor.name] = None
+        return handles[extractor.name]
+    
+    def _extract_page(
+        self,
+        chain: List[TextExtractor],
+        handles: Dict[str, Any],
+        file_path: Path,
+        index: int,
+        worker: _PageWorker
+    ) -> Optional[str]:
+        """
+        Text of one page from the first extractor that reads it in time
+        Returns: None if no extractor can read the page
+        """
+        for extractor in chain:
+            handle = self._open(extractor, file_path, handles)
+            if handle is None:
+                continue
+            start = time.perf_counter()
+            try:
+                text = worker.run(
+                    partial(extractor.page_text, handle, index),
+                    settings.EXTRACT_PAGE_TIMEOUT_S,
+                    # The abandoned call still uses this handle; close it once the call returns
+                    on_abandon=partial(self._close_handles, {extractor.name: handle})
+                )
+            except PageTimeout:
+                EXTRACTED_PAGES.inc(extractor.name, "timeout")
+                # Later pages get a fresh handle
+                del handles[extractor.name]
+                continue
+            except Exception as e:
+                EXTRACTED_PAGES.inc(extractor.name, "error")
+                print(f"Error extracting page {index + 1} of {file_path.name} with {extractor.name}: {e}")
+                continue
+            PAGE_DURATION.observe(time.perf_counter() - start, extractor.name)
+            EXTRACTED_PAGES.inc(extractor.name, "ok")
+            return text or ""
+        return None
     
     def _clean_text(self, text: str) -> str:
         """Clean and normalize extracted text"""
@@ -79,36 +510,141 @@ class PDFProcessor:
         
         return text.strip()
     
+    def page_hash(self, text: str) -> str:
+        """Hash of a page's cleaned text and the chunk settings that split it"""
+        material = f"{settings.CHUNK_SIZE}:{settings.CHUNK_OVERLAP}:{text}"
+        return hashlib.sha256(material.encode()).hexdigest()[:16]
+    
     def chunk_document(
         self, 
         page_texts: Dict[int, str],
         document_id: str,
-        filename: str
+        filename: str,
+        content_hash: str = None,
+        cache_key: Optional[str] = None
     ) -> List[Dict]:
         """
         Split document into chunks with metadata
+        With a text cache key, chunk lists for the current chunk settings
+        are read from and written to the text cache
         Returns: List of chunk dictionaries
         """
-        chunks = []
+        if cache_key:
+            templates = self.text_cache.get_chunks(cache_key)
+            if templates is not None:
+                return self._chunks_from_templates(templates, page_texts, document_id, filename, content_hash)
         
-        for page_num, text in page_texts.items():
+        with stage("pdf.chunk"):
+            chunks = list(self.iter_chunks(page_texts.items(), document_id, filename, content_hash))
+        
+        if cache_key:
+            self.text_cache.put_chunks(cache_key, chunks)
+        return chunks
+    
+    def _chunks_from_templates(
+        self,
+        templates: List[Dict],
+        page_texts: Dict[int, str],
+        document_id: str,
+        filename: str,
+        content_hash: str = None
+    ) -> List[Dict]:
+        """Stamp cached chunk templates with this document's fields"""
+        page_hashes = {page_num: self.page_hash(text) for page_num, text in page_texts.items()}
+        return [
+            {
+                "document_id": document_id,
+                "filename": filename,
+                "content_hash": content_hash,
+                "page_number": template["page_number"],
+                "page_hash": page_hashes[template["page_number"]],
+                "chunk_index": template["chunk_index"],
+                "text": template["text"]
+            }
+            for template in templates
+        ]
+    
+    def iter_chunks(
+        self,
+        pages: Iterable[Tuple[int, str]],
+        document_id: str,
+        filename: str,
+        content_hash: str = None
+    ) -> Iterator[Dict]:
+        """
+        Split pages into chunks as they arrive
+        Yields: chunk dictionaries, in page order
+        """
+        for page_num, text in pages:
             if not text.strip():
                 continue
             
             # Split page text into chunks
             page_chunks = self.text_splitter.split_text(text)
+            page_hash = self.page_hash(text)
             
             for chunk_idx, chunk_text in enumerate(page_chunks):
-                chunk_metadata = {
+                yield {
                     "document_id": document_id,
                     "filename": filename,
+                    "content_hash": content_hash,
                     "page_number": page_num,
+                    "page_hash": page_hash,
                     "chunk_index": chunk_idx,
                     "text": chunk_text
                 }
-                chunks.append(chunk_metadata)
+    
+    def rechunk_changed_pages(
+        self,
+        page_texts: Dict[int, str],
+        previous_chunks: List[Dict],
+        document_id: str,
+        filename: str,
+        content_hash: str = None
+    ) -> Tuple[List[Dict], List[Optional[int]]]:
+        """
+        Chunk a revised document, reusing the stored chunks of unchanged pages
+        Pages are matched by text hash, so pages that only moved are reused
+        too; only new or edited pages are split again
+        Returns: (chunks in page order, source position in previous_chunks
+        of each reused chunk or None for new chunks)
+        """
+        previous_pages = defaultdict(list)
+        for position, chunk in enumerate(previous_chunks):
+            if chunk.get("page_hash"):
+                previous_pages[chunk["page_hash"]].append(position)
         
-        return chunks
+        page_hashes = {
+            page_num: self.page_hash(text)
+            for page_num, text in page_texts.items() if text.strip()
+        }
+        changed = self.chunk_document(
+            {
+                page_num: page_texts[page_num]
+                for page_num, page_hash in page_hashes.items() if page_hash not in previous_pages
+            },
+            document_id, filename, content_hash
+        )
+        changed_by_page = defaultdict(list)
+        for chunk in changed:
+            changed_by_page[chunk["page_number"]].append(chunk)
+        
+        chunks, sources = [], []
+        for page_num, page_hash in page_hashes.items():
+            if page_hash not in previous_pages:
+                chunks.extend(changed_by_page[page_num])
+                sources.extend([None] * len(changed_by_page[page_num]))
+                continue
+            for position in previous_pages[page_hash]:
+                chunks.append({
+                    **previous_chunks[position],
+                    "document_id": document_id,
+                    "filename": filename,
+                    "content_hash": content_hash,
+                    "page_number": page_num,
+                })
+                sources.append(position)
+        return chunks, sources
     
     def process_pdf(
         self,
@@ -116,39 +652,105 @@ class PDFProcessor:
         user_id: str,
         filename: str,
         subject: str = None,
-        topic: str = None
+        topic: str = None,
+        content_hash: str = None
     ) -> Tuple[DocumentMetadata, List[Dict]]:
         """
-        Complete PDF processing pipeline
+        Complete processing pipeline for an uploaded document
         Returns: (metadata, chunks)
         """
-        # Generate document ID
-        document_id = self.generate_document_id(user_id, filename)
+        # Generate document ID from file content
+        if content_hash is None:
+            content_hash = self.compute_content_hash(file_path.read_bytes())
+        document_id = self.generate_document_id(user_id, content_hash)
         
-        # Extract text from PDF
-        page_texts = self.extract_text_from_pdf(file_path)
+        # Extract text page by page (or reuse an earlier extraction)
+        cache_key = self.text_cache_key(file_path.name, content_hash)
+        page_texts = self.extract_text(file_path, content_hash)
         
         # Create metadata
-        metadata = DocumentMetadata(
+        metadata = self.create_metadata(
             document_id=document_id,
             filename=filename,
-            subject=subject,
-            topic=topic,
             total_pages=len(page_texts),
-            upload_timestamp=datetime.utcnow(),
-            file_size_bytes=file_path.stat().st_size
+            file_size_bytes=file_path.stat().st_size,
+            content_hash=content_hash,
+            subject=subject,
+            topic=topic
         )
         
         # Chunk the document
-        chunks = self.chunk_document(page_texts, document_id, filename)
+        chunks = self.chunk_document(page_texts, document_id, filename, content_hash, cache_key)
         
         return metadata, chunks
     
+    def stream_document(
+        self,
+        file_path: Path,
+        user_id: str,
+        filename: str,
+        subject: str = None,
+        topic: str = None,
+        content_hash: str = None
+    ) -> Tuple[DocumentMetadata, Iterator[Dict]]:
+        """
+        Streaming variant of process_pdf: pages are extracted and chunked
+        only as the returned chunks are consumed, so memory stays bounded by
+        what the consumer holds rather than by document size. With the text
+        cache on, pages and the chunk list are cached before the first chunk
+        is returned
+        Returns: (metadata, chunk iterator)
+        """
+        if content_hash is None:
+            content_hash = self.compute_content_hash(file_path.read_bytes())
+        document_id = self.generate_document_id(user_id, content_hash)
+        
+        cache_key = self.text_cache_key(file_path.name, content_hash)
+        page_count, pages = self.stream_pages(file_path, content_hash)
+        
+        metadata = self.create_metadata(
+            document_id=document_id,
+            filename=filename,
+            total_pages=page_count,
+            file_size_bytes=file_path.stat().st_size,
+            content_hash=content_hash,
+            subject=subject,
+            topic=topic
+        )
+        
+        if cache_key:
+            # Pages are already in memory here; chunk_document reads or writes the chunk list
+            return metadata, iter(self.chunk_document(dict(pages), document_id, filename, content_hash, cache_key))
+        return metadata, self.iter_chunks(pages, document_id, filename, content_hash)
+    
+    def create_metadata(
+        self,
+        document_id: str,
+        filename: str,
+        total_pages: int,
+        file_size_bytes: int,
+        content_hash: str,
+        subject: str = None,
+        topic: str = None
+    ) -> DocumentMetadata:
+        """Build metadata for a processed document"""
+        return DocumentMetadata(
+            document_id=document_id,
+            filename=filename,
+            subject=subject,
+            topic=topic,
+            total_pages=total_pages,
+            upload_timestamp=datetime.utcnow(),
+            file_size_bytes=file_size_bytes,
+            content_hash=content_hash
+        )
+    
     def save_uploaded_file(
         self,
         file_content: bytes,
         user_id: str,
-        filename: str
+        filename: str,
+        document_id: str
     ) -> Path:
         """
         Save uploaded file to disk
@@ -158,9 +760,8 @@ class PDFProcessor:
         user_dir = settings.UPLOAD_DIR / user_id
         user_dir.mkdir(parents=True, exist_ok=True)
         
-        # Generate unique filename to avoid conflicts
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        safe_filename = f"{timestamp}_{filename}"
+        # Prefix with document ID so files can be found again on delete
+        safe_filename = f"{document_id}_{Path(filename).name}"
         file_path = user_dir / safe_filename
         
         # Write file
@@ -175,10 +776,8 @@ class PDFProcessor:
             user_dir = settings.UPLOAD_DIR / user_id
             if user_dir.exists():
                 # Find and delete files matching document_id
-                for file_path in user_dir.glob(f"*"):
-                    # You might want to store document_id in filename
-                    # For now, this is a placeholder
-                    pass
+                for file_path in user_dir.glob(f"{document_id}_*"):
+                    file_path.unlink()
             return True
         except Exception as e:
             print(f"Error deleting files: {e}")
@@ -0,0 +1,227 @@
+"""
+Profiling Module
+On-demand CPU sampling and allocation profiles for a running worker
+
+A session samples every thread's stack with sys._current_frames() at a
+fixed interval and optionally tracks allocations with tracemalloc. It
+runs for a number of seconds, or for the next N requests whose path
+starts with a given route (sampling only while such a request is in
+flight). Results are written to PROFILE_DIR:
+
+    <session>.folded       folded stacks for flamegraph.pl / speedscope
+    <session>.alloc.txt    top allocation growth by line
+    <session>.tracemalloc  raw snapshot for offline analysis
+"""
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional
+from config import settings
+
+# Frames kept per tracemalloc traceback
+TRACEMALLOC_FRAMES = 10
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+def _fold_stack(frame) -> str:
+    """Root-first, semicolon-separated stack of the given frame"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class ProfileSession:
+    """One profiling run and its collected samples"""
+
+    def __init__(
+        self,
+        duration_seconds: Optional[float] = None,
+        max_requests: Optional[int] = None,
+        route: Optional[str] = None,
+        interval_ms: float = 10.0,
+        memory: bool = True
+    ):
+        self.session_id = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+        self.duration_seconds = duration_seconds
+        self.max_requests = max_requests
+        self.route = route
+        self.interval = interval_ms / 1000
+        self.memory = memory
+        self.started_at = time.time()
+        self.stopped_at: Optional[float] = None
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+        self.requests_seen = 0
+        self.in_flight = 0
+        self.output_files: Dict[str, str] = {}
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._started_tracemalloc = False
+
+    @property
+    def active(self) -> bool:
+        return self.stopped_at is None
+
+    def matches(self, path: str) -> bool:
+        """Whether requests to this path are profiled"""
+        return self.route is None or path.startswith(self.route)
+
+    def _sampling(self) -> bool:
+        # With a route or request count, only sample while a matching request is running
+        if self.route is None and self.max_requests is None:
+            return True
+        return self.in_flight > 0
+
+    def _run(self):
+        own_id = threading.get_ident()
+        names = {}
+        deadline = self.started_at + self.duration_seconds if self.duration_seconds else None
+
+        while not self._stop_event.wait(self.interval):
+            if deadline and time.time() >= deadline:
+                break
+            if not self._sampling():
+                continue
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                thread_name = names.get(thread_id, str(thread_id))
+                self.samples[f"{thread_name};{_fold_stack(frame)}"] += 1
+            self.sample_count += 1
+
+        if deadline and time.time() >= deadline:
+            # Stop from another thread: Profiler.stop joins this one
+            threading.Thread(target=profiler.stop, daemon=True).start()
+
+    def start(self):
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+                self._started_tracemalloc = True
+            self._baseline = tracemalloc.take_snapshot()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self, output_dir: Path):
+        """Stop sampling and write results"""
+        self.stopped_at = time.time()
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+        output_dir.mkdir(parents=True, exist_ok=True)
+        base = output_dir / f"profile-{self.session_id}"
+
+        folded_path = base.with_suffix(".folded")
+        with open(folded_path, "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        self.output_files["cpu"] = str(folded_path)
+
+        if self.memory and self._baseline is not None:
+            snapshot = tracemalloc.take_snapshot()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+            snapshot_path = base.with_suffix(".tracemalloc")
+            snapshot.dump(str(snapshot_path))
+            self.output_files["memory_snapshot"] = str(snapshot_path)
+
+            alloc_path = base.with_suffix(".alloc.txt")
+            with open(alloc_path, "w") as f:
+                for stat in snapshot.compare_to(self._baseline, "lineno")[:50]:
+                    f.write(f"{stat}\n")
+            self.output_files["memory_top"] = str(alloc_path)
+
+    def status(self) -> Dict:
+        return {
+            "session_id": self.session_id,
+            "active": self.active,
+            "route": self.route,
+            "duration_seconds": self.duration_seconds,
+            "max_requests": self.max_requests,
+            "requests_seen": self.requests_seen,
+            "samples": self.sample_count,
+            "elapsed_seconds": round((self.stopped_at or time.time()) - self.started_at, 2),
+            "output_files": self.output_files,
+        }
+
+
+class Profiler:
+    """Holds the worker's current profiling session (one at a time)"""
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+        self._lock = threading.Lock()
+
+    def start(self, **options) -> ProfileSession:
+        with self._lock:
+            if self.session is not None and self.session.active:
+                raise RuntimeError("A profiling session is already running")
+            self.session = ProfileSession(**options)
+            self.session.start()
+            return self.session
+
+    def stop(self) -> Optional[ProfileSession]:
+        with self._lock:
+            session = self.session
+            if session is None or not session.active:
+                return session
+            session.stop(settings.PROFILE_DIR)
+            return session
+
+    def request_started(self, path: str) -> Optional[ProfileSession]:
+        """Called by the middleware; returns the session tracking this request"""
+        session = self.session
+        if session is None or not session.active or not session.matches(path):
+            return None
+        session.in_flight += 1
+        return session
+
+    def request_finished(self, session: ProfileSession):
+        session.in_flight -= 1
+        session.requests_seen += 1
+        if session.max_requests and session.requests_seen >= session.max_requests:
+            self.stop()
+
+
+# Profiler for this worker process
+profiler = Profiler()
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware feeding request boundaries to the profiler
+    Costs one attribute check per request when no session is running
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or profiler.session is None:
+            await self.app(scope, receive, send)
+            return
+
+        session = profiler.request_started(scope["path"])
+        if session is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.request_finished(session)
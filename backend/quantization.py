@@ -0,0 +1,232 @@
+"""
+Vector Quantization Module
+Compressed search codes for user indexes, re-scored exactly from disk
+
+A quantized index keeps a compact FAISS index (`vectors.codes`) next to
+the full-precision `vectors.f32`. Searches scan the codes for a shortlist
+of VECTOR_RESCORE_FACTOR times the usual candidates, then re-score only
+those rows exactly against the memory-mapped float32 matrix, so just the
+shortlisted pages of the full matrix are ever read.
+
+Modes (bytes per 768-dim vector):
+    none   no codes; exact search over vectors.f32       (3072, 1x)
+    fp16   half-precision scalar quantizer               (1536, 2x)
+    int8   8-bit scalar quantizer, trained min/max       (768, 4x)
+    pq     product quantizer, 8 bits per subquantizer    (192, 16x at dimension / 4)
+
+PQ needs 256 training vectors; smaller indexes fall back to int8 and are
+retrained as PQ once they grow past that.
+
+Usage:
+    python quantization.py set <user_id> <mode>
+    python quantization.py migrate [--user USER_ID]
+    python quantization.py report [--user USER_ID] [--mode MODE] [--queries 200] [--top-k 5]
+"""
+import argparse
+import json
+import sys
+from typing import List, Tuple
+import numpy as np
+from config import settings
+
+MODES = ("none", "fp16", "int8", "pq")
+
+# Product quantizers use 8-bit codes, so training needs one vector per centroid
+PQ_MIN_TRAINING_ROWS = 256
+
+
+def pq_subquantizers(dimension: int) -> int:
+    """Largest divisor of the dimension not above the configured subquantizer count"""
+    target = settings.VECTOR_PQ_SUBQUANTIZERS or max(1, dimension // 4)
+    return max(m for m in range(1, min(target, dimension) + 1) if dimension % m == 0)
+
+
+def codec_for(mode: str, rows: int, dimension: int) -> str:
+    """Codec actually used for a mode at this index size, e.g. "pq192" or "int8" """
+    if mode == "pq":
+        if rows < PQ_MIN_TRAINING_ROWS:
+            return "int8"
+        return f"pq{pq_subquantizers(dimension)}"
+    return mode
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length (zero rows stay zero)"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def _faiss_metric(metric: str):
+    import faiss
+
+    return faiss.METRIC_INNER_PRODUCT if metric == "cosine" else faiss.METRIC_L2
+
+
+def build_codes(vectors: np.ndarray, codec: str, metric: str = "l2"):
+    """Train a FAISS index for the codec and encode the vectors"""
+    import faiss
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    dimension = vectors.shape[1]
+    if codec == "fp16":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, _faiss_metric(metric))
+    elif codec == "int8":
+        index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, _faiss_metric(metric))
+    elif codec.startswith("pq"):
+        index = faiss.IndexPQ(dimension, int(codec[2:]), 8, _faiss_metric(metric))
+        # Per-user indexes are small; don't warn about sparse centroids
+        index.pq.cp.min_points_per_centroid = 1
+    else:
+        raise ValueError(f"Unknown vector codec '{codec}'")
+
+    if len(vectors):
+        index.train(vectors)
+        index.add(vectors)
+    return index
+
+
+def codes_bytes(index) -> int:
+    """Memory held by an index's codes"""
+    return index.ntotal * index.sa_code_size()
+
+
+def rescored_search(
+    codes,
+    vectors: np.ndarray,
+    query_embeddings: np.ndarray,
+    k: int,
+    shortlist: int,
+    metric: str = "l2"
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Approximate search over the codes, then exact scoring of the shortlist
+    Returns: (distances, indices) shaped like faiss.knn, padded with -1;
+    for cosine the "distances" are similarities, best first
+    """
+    query_embeddings = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+    shortlist = max(k, min(shortlist, codes.ntotal))
+    _, candidates = codes.search(query_embeddings, shortlist)
+
+    cosine = metric == "cosine"
+    distances = np.full((len(query_embeddings), k), -np.inf if cosine else np.inf, dtype=np.float32)
+    indices = np.full((len(query_embeddings), k), -1, dtype=np.int64)
+    for i, (query, query_candidates) in enumerate(zip(query_embeddings, candidates)):
+        # Sorted row order keeps reads from the mapped matrix sequential
+        rows = np.unique(query_candidates[query_candidates >= 0])
+        if len(rows) == 0:
+            continue
+        candidate_vectors = np.asarray(vectors[rows], dtype=np.float32)
+        if cosine:
+            exact = candidate_vectors @ query
+            best = np.argsort(-exact, kind="stable")[:k]
+        else:
+            exact = ((candidate_vectors - query) ** 2).sum(axis=1)
+            best = np.argsort(exact, kind="stable")[:k]
+        distances[i, :len(best)] = exact[best]
+        indices[i, :len(best)] = rows[best]
+    return distances, indices
+
+
+def recall_report(
+    vectors: np.ndarray,
+    mode: str,
+    queries: int = 200,
+    top_k: int = 5,
+    seed: int = 0,
+    metric: str = "l2"
+) -> dict:
+    """
+    Compare a quantization mode against exact search on stored vectors
+    Queries are stored vectors with noise added, so each has a known neighbourhood
+    """
+    import faiss
+
+    rows, dimension = vectors.shape
+    codec = codec_for(mode, rows, dimension)
+    full_bytes = rows * dimension * 4
+    if codec == "none" or rows == 0:
+        return {"mode": mode, "codec": codec, "rows": rows, "full_bytes": full_bytes}
+
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(vectors[rng.choice(rows, min(queries, rows), replace=False)], dtype=np.float32)
+    scale = float(np.linalg.norm(sample, axis=1).mean()) / np.sqrt(dimension)
+    query_embeddings = sample + rng.normal(0, 0.1 * scale, sample.shape).astype(np.float32)
+
+    k = min(top_k, rows)
+    if metric == "cosine":
+        query_embeddings = normalize(query_embeddings)
+    _, exact = faiss.knn(query_embeddings, vectors, k, metric=_faiss_metric(metric))
+    codes = build_codes(vectors, codec, metric)
+    _, approximate = codes.search(query_embeddings, k)
+    _, rescored = rescored_search(
+        codes, vectors, query_embeddings, k, k * 2 * settings.VECTOR_RESCORE_FACTOR, metric
+    )
+
+    def recall(found: np.ndarray) -> float:
+        hits = sum(len(set(a) & set(b)) for a, b in zip(exact, found))
+        return round(hits / exact.size, 4)
+
+    return {
+        "mode": mode,
+        "codec": codec,
+        "rows": rows,
+        "top_k": k,
+        "queries": len(query_embeddings),
+        "recall_at_k_codes_only": recall(approximate),
+        "recall_at_k_rescored": recall(rescored),
+        "full_bytes": full_bytes,
+        "codes_bytes": codes_bytes(codes),
+        "compression": round(full_bytes / max(1, codes_bytes(codes)), 2),
+    }
+
+
+def _user_ids(user_id: str = None) -> List[str]:
+    if user_id:
+        return [user_id]
+    if not settings.VECTOR_STORE_DIR.exists():
+        return []
+    return sorted(p.name for p in settings.VECTOR_STORE_DIR.iterdir() if p.is_dir())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage vector index quantization")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    set_parser = commands.add_parser("set", help="Set a user's quantization mode and rebuild codes")
+    set_parser.add_argument("user_id")
+    set_parser.add_argument("mode", choices=MODES + ("default",))
+
+    migrate_parser = commands.add_parser(
+        "migrate", help="Convert legacy faiss_index.bin files and build codes for the configured modes"
+    )
+    migrate_parser.add_argument("--user", help="Only this user (default: all)")
+
+    report_parser = commands.add_parser("report", help="Recall and memory of a mode against exact search")
+    report_parser.add_argument("--user", help="Only this user (default: all)")
+    report_parser.add_argument("--mode", choices=MODES, help="Mode to evaluate (default: the user's mode)")
+    report_parser.add_argument("--queries", type=int, default=200)
+    report_parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    from vector_store import VectorStore
+
+    vector_store = VectorStore()
+    if args.command == "set":
+        codec = vector_store.set_quantization(args.user_id, None if args.mode == "default" else args.mode)
+        print(json.dumps({"user_id": args.user_id, "codec": codec}))
+    elif args.command == "migrate":
+        for user_id in _user_ids(args.user):
+            print(json.dumps({"user_id": user_id, "codec": vector_store.migrate_quantization(user_id)}))
+    else:
+        reports = []
+        for user_id in _user_ids(args.user):
+            vectors, _ = vector_store.load_index(user_id, check_embedding=False)
+            mode = args.mode or vector_store.quantization_mode(user_id)
+            metric = vector_store._read_info(user_id)["metric"]
+            reports.append({
+                "user_id": user_id,
+                **recall_report(vectors, mode, args.queries, args.top_k, metric=metric)
+            })
+        json.dump(reports, sys.stdout, indent=2)
+        print()
@@ -2,30 +2,34 @@
 RAG Engine Module
 Handles retrieval-augmented generation for chat and Q&A
 """
-from typing import List, Optional, Dict
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
+from typing import List, Optional, Dict, Tuple
 from config import settings
 from models import ChatResponse, SourceReference
-from vector_store import VectorStore
+from vector_store import VectorStore, create_vector_store
+from reranker import CrossEncoderReranker
+from chat_sessions import ChatSession, ChatSessionStore, SESSION_TURNS
+from llm import create_chat_model
+from llm_scheduler import llm_user
+from startup import timed
+from metrics import stage
 
 class RAGEngine:
     """Retrieval-Augmented Generation engine for Study Copilot"""
     
-    def __init__(self):
-        """Initialize LLM and vector store"""
-        self.llm = ChatGoogleGenerativeAI(
-            model=settings.MODEL_NAME,
-            google_api_key=settings.GOOGLE_API_KEY,
-            temperature=settings.TEMPERATURE,
-            max_output_tokens=settings.MAX_OUTPUT_TOKENS
-        )
-        self.vector_store = VectorStore()
+    def __init__(
+        self,
+        vector_store: Optional[VectorStore] = None,
+        reranker: Optional[CrossEncoderReranker] = None,
+        sessions: Optional[ChatSessionStore] = None
+    ):
+        """Initialize vector store; the LLM client is created on first use"""
+        self._llm = None
+        self.vector_store = vector_store or create_vector_store()
+        self.reranker = reranker or (CrossEncoderReranker() if settings.RERANK_ENABLED else None)
+        self.sessions = sessions or ChatSessionStore()
         
         # Chat prompt template
-        self.chat_prompt = PromptTemplate(
-            input_variables=["context", "question"],
-            template="""You are Velosify Study Copilot, an AI learning assistant.
+        self.chat_prompt = """You are Velosify Study Copilot, an AI learning assistant.
 
 STRICT RULES:
 1. Answer ONLY based on the provided context
@@ -36,41 +40,199 @@ STRICT RULES:
 
 CONTEXT FROM DOCUMENTS:
 {context}
-
+{history}
 STUDENT QUESTION:
 {question}
 
 ANSWER:"""
-        )
+    
+    @property
+    def llm(self):
+        """Chat model client, created on first access"""
+        if self._llm is None:
+            with timed("rag_engine.llm"):
+                self._llm = create_chat_model()
+        return self._llm
     
     def chat(
         self,
         user_id: str,
         query: str,
         document_ids: Optional[List[str]] = None,
-        max_results: int = 5
+        max_results: int = 5,
+        session_id: Optional[str] = None,
+        start_session: bool = False
     ) -> ChatResponse:
         """
         Process a chat query using RAG
+        With sessions enabled, a turn that passes session_id or asks to
+        start_session joins that (or a new) session: on-topic follow-ups
+        reuse its retrieved chunks and the prompt carries a summary of
+        earlier turns. Other calls are stateless.
         """
-        # Retrieve relevant chunks
-        relevant_chunks = self.vector_store.search(
-            user_id=user_id,
-            query=query,
-            top_k=max_results,
-            document_ids=document_ids
-        )
+        if settings.CHAT_SESSIONS_ENABLED and (session_id or start_session):
+            return self._session_chat(user_id, query, document_ids, max_results, session_id)
+        
+        # Retrieve relevant chunks, over-fetching when re-ranking
+        with stage("rag.retrieve"):
+            relevant_chunks = self.vector_store.search(
+                user_id=user_id,
+                query=query,
+                top_k=self._candidate_count(max_results),
+                document_ids=document_ids
+            )
+        relevant_chunks = self._rerank(query, relevant_chunks, max_results)
         
         # Check if we found relevant information
         if not relevant_chunks:
-            return ChatResponse(
-                answer="I couldn't find this information in your uploaded documents. Please make sure you've uploaded relevant study materials.",
-                sources=[],
-                found_in_documents=False,
-                query=query
+            return self._not_found_response(query)
+        
+        # Generate answer using LLM
+        with stage("rag.prompt"):
+            prompt = self._build_prompt(query, relevant_chunks)
+        
+        return self._build_response(query, relevant_chunks, self._generate(user_id, prompt))
+    
+    def _session_chat(
+        self,
+        user_id: str,
+        query: str,
+        document_ids: Optional[List[str]],
+        max_results: int,
+        session_id: Optional[str]
+    ) -> ChatResponse:
+        """One conversation turn with cached retrieval"""
+        session = self.sessions.get_or_create(user_id, session_id)
+        with stage("rag.retrieve"):
+            candidates, outcome = self._session_candidates(session, user_id, query, document_ids, max_results)
+        SESSION_TURNS.inc(outcome)
+        relevant_chunks = self._rerank(query, candidates, max_results)
+        
+        if not relevant_chunks:
+            response = self._not_found_response(query)
+        else:
+            with stage("rag.prompt"):
+                prompt = self._build_prompt(query, relevant_chunks, session.history())
+            response = self._build_response(query, relevant_chunks, self._generate(user_id, prompt))
+        
+        self.sessions.record_turn(session, query, response.answer)
+        return response.copy(update={"session_id": session.session_id})
+    
+    def _session_candidates(
+        self,
+        session: ChatSession,
+        user_id: str,
+        query: str,
+        document_ids: Optional[List[str]],
+        max_results: int
+    ) -> Tuple[List[Dict], str]:
+        """
+        Chunks for a session turn: the cached set while the question stays
+        on topic, else a fresh search; a follow-up whose search finds
+        nothing on its own is searched again with the previous question,
+        then falls back to the cached set
+        Returns: (candidate chunks, outcome for metrics)
+        """
+        cached = session.cached_chunks(document_ids)
+        query_embedding = self.vector_store.create_query_embedding(query)
+        if cached and session.topic_similarity(query_embedding) >= settings.CHAT_SESSION_TOPIC_THRESHOLD:
+            return cached, "cached"
+        
+        # Fetch enough for the prompt and for follow-ups to draw on
+        top_k = max(self._candidate_count(max_results), settings.CHAT_SESSION_MAX_CHUNKS)
+        chunks = self.vector_store.search_embeddings(user_id, query_embedding, top_k, document_ids)[0]
+        if chunks:
+            self.sessions.remember_chunks(session, chunks, query_embedding, document_ids)
+            return chunks, "fresh"
+        if session.last_query:
+            context_embedding = self.vector_store.create_query_embedding(f"{session.last_query}\n{query}")
+            chunks = self.vector_store.search_embeddings(user_id, context_embedding, top_k, document_ids)[0]
+            if chunks:
+                self.sessions.remember_chunks(session, chunks, context_embedding, document_ids)
+                return chunks, "contextual"
+        if cached:
+            return cached, "followup"
+        return [], "none"
+    
+    def _generate(self, user_id: str, prompt: str) -> str:
+        """Answer text for a prompt; errors are returned as the answer"""
+        try:
+            with stage("rag.llm"), llm_user(user_id):
+                response = self.llm.invoke(prompt)
+            return response.content
+        except Exception as e:
+            return f"Error generating response: {str(e)}"
+    
+    def chat_batch(
+        self,
+        user_id: str,
+        queries: List[str],
+        document_ids: Optional[List[str]] = None,
+        max_results: int = 5
+    ) -> List[ChatResponse]:
+        """
+        Process several chat queries in one pass
+        Index load, query embedding and search are done once for the whole
+        batch; LLM calls run concurrently
+        """
+        # Retrieve relevant chunks for every query at once
+        with stage("rag.retrieve"):
+            all_chunks = self.vector_store.search_batch(
+                user_id=user_id,
+                queries=queries,
+                top_k=self._candidate_count(max_results),
+                document_ids=document_ids
             )
+        all_chunks = [
+            self._rerank(query, chunks, max_results)
+            for query, chunks in zip(queries, all_chunks)
+        ]
+        
+        # Only queries with context go to the LLM
+        answerable = [i for i, chunks in enumerate(all_chunks) if chunks]
+        with stage("rag.prompt"):
+            prompts = [self._build_prompt(queries[i], all_chunks[i]) for i in answerable]
+        
+        answers = {}
+        if prompts:
+            with stage("rag.llm"), llm_user(user_id):
+                results = self.llm.batch(
+                    prompts,
+                    config={"max_concurrency": settings.BATCH_CHAT_CONCURRENCY},
+                    return_exceptions=True
+                )
+            for i, result in zip(answerable, results):
+                if isinstance(result, Exception):
+                    answers[i] = f"Error generating response: {str(result)}"
+                else:
+                    answers[i] = result.content
         
-        # Build context from retrieved chunks
+        return [
+            self._build_response(query, all_chunks[i], answers[i]) if i in answers
+            else self._not_found_response(query)
+            for i, query in enumerate(queries)
+        ]
+    
+    def _candidate_count(self, max_results: int) -> int:
+        """Number of chunks to fetch from the vector store"""
+        if self.reranker is None:
+            return max_results
+        return max(max_results, settings.RERANK_CANDIDATES)
+    
+    def _rerank(self, query: str, chunks: List[Dict], max_results: int) -> List[Dict]:
+        """Keep the best chunks for the prompt; vector order if re-ranking is off"""
+        if self.reranker is None:
+            return chunks[:max_results]
+        top_n = min(max_results, settings.RERANK_TOP_N)
+        try:
+            with stage("rag.rerank"):
+                return self.reranker.rerank(query, chunks, top_n)
+        except Exception as e:
+            print(f"Error re-ranking chunks: {e}")
+            return chunks[:top_n]
+    
+    def _build_prompt(self, query: str, relevant_chunks: List[Dict], history: str = "") -> str:
+        """Build the chat prompt from retrieved chunks and any conversation summary"""
         context_parts = []
         for i, chunk in enumerate(relevant_chunks, 1):
             context_parts.append(
@@ -79,16 +241,13 @@ ANSWER:"""
         
         context = "\n".join(context_parts)
         
-        # Generate answer using LLM
-        prompt = self.chat_prompt.format(context=context, question=query)
-        
-        try:
-            response = self.llm.invoke(prompt)
-            answer = response.content
-        except Exception as e:
-            answer = f"Error generating response: {str(e)}"
+        if history:
+            history = f"\nEARLIER IN THIS CONVERSATION:\n{history}\n"
         
-        # Build source references
+        return self.chat_prompt.format(context=context, history=history, question=query)
+    
+    def _build_response(self, query: str, relevant_chunks: List[Dict], answer: str) -> ChatResponse:
+        """Build a chat response with source references"""
         sources = []
         for chunk in relevant_chunks:
             source = SourceReference(
@@ -106,6 +265,15 @@ ANSWER:"""
             query=query
         )
     
+    def _not_found_response(self, query: str) -> ChatResponse:
+        """Response when no relevant chunks were retrieved"""
+        return ChatResponse(
+            answer="I couldn't find this information in your uploaded documents. Please make sure you've uploaded relevant study materials.",
+            sources=[],
+            found_in_documents=False,
+            query=query
+        )
+    
     def get_context_for_topic(
         self,
         user_id: str,
@@ -0,0 +1,98 @@
+"""
+Reranker Module
+Re-scores retrieved chunks with a local cross-encoder
+"""
+import time
+from typing import List, Dict, Optional
+from config import settings
+from startup import timed
+
+class CrossEncoderReranker:
+    """
+    Cross-encoder re-ranking on CPU with a latency budget
+
+    Candidates are scored in batches. The expected cost is predicted from
+    a running average of per-pair latency, and re-ranking is skipped when
+    it would exceed the budget. If scoring runs over budget part-way,
+    the remaining candidates keep their vector-search order after the
+    scored ones.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, batch_size: Optional[int] = None):
+        self.model_name = model_name or settings.RERANK_MODEL
+        self.batch_size = batch_size or settings.RERANK_BATCH_SIZE
+        self._encoder = None
+        # Running average of milliseconds per (query, chunk) pair
+        self._ms_per_pair: Optional[float] = None
+
+    @property
+    def encoder(self):
+        """Cross-encoder model, loaded on first access"""
+        if self._encoder is None:
+            with timed("reranker.encoder"):
+                from sentence_transformers import CrossEncoder
+                self._encoder = CrossEncoder(self.model_name, device="cpu", max_length=512)
+        return self._encoder
+
+    def estimate_ms(self, num_candidates: int) -> Optional[float]:
+        """Predicted re-ranking latency, None until first measurement"""
+        if self._ms_per_pair is None:
+            return None
+        return self._ms_per_pair * num_candidates
+
+    def _record_latency(self, elapsed_ms: float, pairs: int):
+        """Update the per-pair latency average"""
+        per_pair = elapsed_ms / pairs
+        if self._ms_per_pair is None:
+            self._ms_per_pair = per_pair
+        else:
+            self._ms_per_pair = 0.8 * self._ms_per_pair + 0.2 * per_pair
+
+    def rerank(
+        self,
+        query: str,
+        chunks: List[Dict],
+        top_n: int,
+        budget_ms: Optional[float] = None
+    ) -> List[Dict]:
+        """
+        Re-order chunks by cross-encoder relevance
+        Returns: best top_n chunks, each with a "rerank_score" when scored
+        """
+        if not chunks:
+            return []
+
+        budget_ms = settings.RERANK_BUDGET_MS if budget_ms is None else budget_ms
+
+        # Skip entirely if the predicted cost is over budget; decay the
+        # estimate so a transient slowdown doesn't disable re-ranking forever
+        estimate = self.estimate_ms(len(chunks))
+        if estimate is not None and estimate > budget_ms:
+            self._ms_per_pair *= 0.95
+            return chunks[:top_n]
+
+        # Load outside the timed section so the load isn't mistaken for per-pair cost
+        encoder = self.encoder
+        start = time.perf_counter()
+        scored = []
+        for i in range(0, len(chunks), self.batch_size):
+            batch = chunks[i:i + self.batch_size]
+            pairs = [(query, chunk["text"]) for chunk in batch]
+
+            batch_start = time.perf_counter()
+            scores = encoder.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            self._record_latency((time.perf_counter() - batch_start) * 1000, len(pairs))
+
+            for chunk, score in zip(batch, scores):
+                chunk = chunk.copy()
+                chunk["rerank_score"] = float(score)
+                scored.append(chunk)
+
+            # Early cutoff: keep vector order for what wasn't scored in time
+            if (time.perf_counter() - start) * 1000 > budget_ms:
+                break
+
+        scored.sort(key=lambda chunk: chunk["rerank_score"], reverse=True)
+        unscored = chunks[len(scored):]
+
+        return (scored + unscored)[:top_n]
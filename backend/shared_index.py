@@ -0,0 +1,661 @@
+"""
+Shared Index Module
+Multi-tenant vector storage: all users in a few large sharded matrices
+
+Layout under SHARED_INDEX_DIR:
+    index.db                 SQLite (WAL) mapping of tenants to vector blocks
+    shard-<n>-<dim>.f32      append-only float32 matrices, one per shard
+
+A block is the unit-length vectors of one document's chunks, stored
+contiguously in one shard. Blocks are keyed by a hash of the chunk texts
+and the embedding signature, so a file uploaded by many users is stored
+and embedded once; each user's copy is a `tenant_documents` row pointing
+at the block. The shard is chosen from the block key.
+
+Searches look up the caller's blocks in SQLite (user_id, and document_ids
+when given, are part of the query) and score only those row ranges, so
+another tenant's rows are never read. Appends happen inside an SQLite
+write transaction, which serializes writers across processes; readers
+map only committed rows.
+
+Usage:
+    python shared_index.py migrate [--user USER_ID] [--remove-source]
+    python shared_index.py stats
+"""
+import argparse
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from config import settings
+from embeddings import EmbeddingProvider
+from metrics import stage
+from quantization import normalize
+from vector_store import EmbeddingMismatchError, VectorStore
+
+# Chunk fields that belong to a user's copy of a document, not to the block
+TENANT_FIELDS = ("document_id", "filename")
+
+# Positions bound per payload query; SQLite caps host parameters per statement
+PAYLOAD_BATCH_SIZE = 500
+
+
+class SharedVectorStore(VectorStore):
+    """VectorStore interface over sharded multi-tenant indexes (cosine only)"""
+
+    def __init__(self, embedder: Optional[EmbeddingProvider] = None, base_dir: Optional[Path] = None):
+        super().__init__(embedder)
+        self.base_dir = base_dir or settings.SHARED_INDEX_DIR
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.base_dir / "index.db"
+        # One connection per thread; sqlite3 connections are not thread-safe
+        self._local = threading.local()
+        # Mapped shards: {shard: (rows, memmap)}
+        self._shards: Dict[str, Tuple[int, np.ndarray]] = {}
+        self._shards_lock = threading.Lock()
+        self._create_schema()
+
+    # ------------------------------------------------------------------
+    # Database
+    # ------------------------------------------------------------------
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """Get this thread's database connection (autocommit; writes use _write)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        """Write transaction holding the database lock, so shard appends are serialized"""
+        conn = self._get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _create_schema(self):
+        """Create tables and indexes if they don't exist"""
+        with self._write() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS shards (
+                    shard TEXT PRIMARY KEY,
+                    dimension INTEGER NOT NULL,
+                    rows INTEGER NOT NULL,
+                    dead_rows INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS blocks (
+                    block_key TEXT PRIMARY KEY,
+                    shard TEXT NOT NULL REFERENCES shards (shard),
+                    start_row INTEGER NOT NULL,
+                    rows INTEGER NOT NULL,
+                    embedding TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    block_key TEXT NOT NULL REFERENCES blocks (block_key) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    payload BLOB NOT NULL,
+                    PRIMARY KEY (block_key, position)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tenant_documents (
+                    user_id TEXT NOT NULL,
+                    document_id TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    block_key TEXT NOT NULL REFERENCES blocks (block_key),
+                    added_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, document_id)
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_tenant_documents_block
+                ON tenant_documents (block_key)
+            """)
+
+    # ------------------------------------------------------------------
+    # Shards
+    # ------------------------------------------------------------------
+
+    def _shard_for(self, block_key: str, dimension: int) -> str:
+        return f"{int(block_key[:8], 16) % settings.SHARED_INDEX_SHARDS:03d}-{dimension}"
+
+    def _shard_path(self, shard: str) -> Path:
+        return self.base_dir / f"shard-{shard}.f32"
+
+    def _map_shard(self, shard: str, rows: int, dimension: int) -> np.ndarray:
+        """Read-only map of a shard covering at least `rows` committed rows"""
+        with self._shards_lock:
+            mapped = self._shards.get(shard)
+            if mapped is None or mapped[0] < rows:
+                with stage("vector_store.load"):
+                    mapped = (rows, np.memmap(
+                        self._shard_path(shard), dtype=np.float32, mode='r', shape=(rows, dimension)
+                    ))
+                self._shards[shard] = mapped
+            return mapped[1]
+
+    def _append_block(
+        self,
+        conn: sqlite3.Connection,
+        block_key: str,
+        chunks: List[Dict],
+        vectors: np.ndarray,
+        embedding: str
+    ):
+        """Append a block's vectors past the shard's committed rows (write lock held)"""
+        dimension = vectors.shape[1]
+        shard = self._shard_for(block_key, dimension)
+        row = conn.execute("SELECT rows FROM shards WHERE shard = ?", (shard,)).fetchone()
+        start_row = row[0] if row else 0
+
+        shard_path = self._shard_path(shard)
+        committed_bytes = start_row * dimension * 4
+        with open(shard_path, 'r+b' if shard_path.exists() else 'wb') as f:
+            # Drop any uncommitted tail left by an interrupted write
+            f.truncate(committed_bytes)
+            f.seek(committed_bytes)
+            f.write(np.ascontiguousarray(normalize(vectors), dtype=np.float32).tobytes())
+
+        conn.execute(
+            "INSERT INTO shards (shard, dimension, rows) VALUES (?, ?, ?) "
+            "ON CONFLICT (shard) DO UPDATE SET rows = excluded.rows",
+            (shard, dimension, start_row + len(vectors))
+        )
+        conn.execute(
+            "INSERT INTO blocks (block_key, shard, start_row, rows, embedding) VALUES (?, ?, ?, ?, ?)",
+            (block_key, shard, start_row, len(vectors), embedding)
+        )
+        conn.executemany(
+            "INSERT INTO chunks (block_key, position, payload) VALUES (?, ?, ?)",
+            [
+                (block_key, position, pickle.dumps({k: v for k, v in chunk.items() if k not in TENANT_FIELDS}))
+                for position, chunk in enumerate(chunks)
+            ]
+        )
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def _block_key(self, chunks: List[Dict], embedding: str) -> str:
+        """Content identity of a document's chunks under one embedding provider"""
+        material = [embedding, [(c.get("page_number"), c["text"]) for c in chunks]]
+        return hashlib.sha256(json.dumps(material).encode()).hexdigest()
+
+    def _has_block(self, block_key: str) -> bool:
+        return self._get_connection().execute(
+            "SELECT 1 FROM blocks WHERE block_key = ?", (block_key,)
+        ).fetchone() is not None
+
+    def _add_document(
+        self,
+        user_id: str,
+        document_id: str,
+        chunks: List[Dict],
+        vectors: Optional[np.ndarray],
+        embedding: str
+    ) -> int:
+        """
+        Point the user's document at a block, appending the block if new
+        Vectors are only computed when no other tenant has the block
+        """
+        block_key = self._block_key(chunks, embedding)
+        while True:
+            if vectors is None and not self._has_block(block_key):
+                vectors = self.create_embeddings([chunk["text"] for chunk in chunks])
+
+            with stage("vector_store.save"), self._write() as conn:
+                linked = self._link_document(conn, user_id, document_id, chunks, vectors, embedding, block_key)
+            if linked:
+                return len(chunks)
+            # The block's last tenant dropped it after the check above: embed outside the lock, then retry
+
+    def _link_document(
+        self,
+        conn: sqlite3.Connection,
+        user_id: str,
+        document_id: str,
+        chunks: List[Dict],
+        vectors: Optional[np.ndarray],
+        embedding: str,
+        block_key: str
+    ) -> bool:
+        """
+        Point the user's document at a block, appending the block if new (write lock held)
+        Returns: False, with nothing changed, if the block is missing and no vectors were given
+        """
+        # Re-check under the lock: another process may have added or dropped it
+        if conn.execute("SELECT 1 FROM blocks WHERE block_key = ?", (block_key,)).fetchone() is None:
+            if vectors is None:
+                return False
+            self._append_block(conn, block_key, chunks, vectors, embedding)
+        current = conn.execute(
+            "SELECT block_key FROM tenant_documents WHERE user_id = ? AND document_id = ?",
+            (user_id, document_id)
+        ).fetchone()
+        if current is not None and current[0] == block_key:
+            # Same content again: unlinking would garbage-collect the block we point at
+            conn.execute(
+                "UPDATE tenant_documents SET filename = ?, added_at = ? WHERE user_id = ? AND document_id = ?",
+                (chunks[0].get("filename", ""), time.time(), user_id, document_id)
+            )
+            return True
+        self._unlink_document(conn, user_id, document_id)
+        conn.execute(
+            "INSERT INTO tenant_documents (user_id, document_id, filename, block_key, added_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (user_id, document_id, chunks[0].get("filename", ""), block_key, time.time())
+        )
+        return True
+
+    def _unlink_document(self, conn: sqlite3.Connection, user_id: str, document_id: str) -> bool:
+        """Drop a tenant's document and any block no tenant references any more (write lock held)"""
+        row = conn.execute(
+            "SELECT block_key FROM tenant_documents WHERE user_id = ? AND document_id = ?",
+            (user_id, document_id)
+        ).fetchone()
+        if row is None:
+            return False
+        conn.execute(
+            "DELETE FROM tenant_documents WHERE user_id = ? AND document_id = ?", (user_id, document_id)
+        )
+        block_key = row[0]
+        if conn.execute("SELECT 1 FROM tenant_documents WHERE block_key = ? LIMIT 1", (block_key,)).fetchone():
+            return True
+        # Unreferenced rows stay in the shard file but are never searched
+        shard, rows = conn.execute(
+            "SELECT shard, rows FROM blocks WHERE block_key = ?", (block_key,)
+        ).fetchone()
+        conn.execute("DELETE FROM blocks WHERE block_key = ?", (block_key,))
+        conn.execute("UPDATE shards SET dead_rows = dead_rows + ? WHERE shard = ?", (rows, shard))
+        return True
+
+    def add_documents(
+        self,
+        user_id: str,
+        chunks: List[Dict],
+        embeddings: Optional[np.ndarray] = None
+    ) -> int:
+        """
+        Add document chunks for a user
+        Documents another tenant already added reuse the stored block
+        Returns: number of chunks added
+        """
+        if not chunks:
+            return 0
+        if embeddings is not None and embeddings.shape[1] != self.dimension:
+            raise EmbeddingMismatchError(
+                f"Embeddings have dimension {embeddings.shape[1]}, index expects {self.dimension}"
+            )
+
+        rows_by_document: Dict[str, List[int]] = defaultdict(list)
+        for i, chunk in enumerate(chunks):
+            rows_by_document[chunk["document_id"]].append(i)
+
+        added = 0
+        for document_id, rows in rows_by_document.items():
+            added += self._add_document(
+                user_id,
+                document_id,
+                [chunks[i] for i in rows],
+                None if embeddings is None else embeddings[rows],
+                self.embedder.signature
+            )
+        return added
+
+    def add_documents_stream(
+        self,
+        user_id: str,
+        chunks: Iterable[Dict],
+        batch_size: Optional[int] = None
+    ) -> Iterator[Tuple[List[Dict], np.ndarray]]:
+        """
+        Blocks are keyed by a document's full chunk list, so chunks are
+        collected first; embedding still runs in EMBEDDING_BATCH_SIZE calls
+        Yields: (chunks, embeddings) once, for the whole document
+        """
+        chunks = list(chunks)
+        if not chunks:
+            return
+        embeddings = self.create_embeddings([chunk["text"] for chunk in chunks])
+        self.add_documents(user_id, chunks, embeddings)
+        yield chunks, embeddings
+
+    def save_index(
+        self,
+        user_id: str,
+        vectors: np.ndarray,
+        metadata: List[Dict],
+        embedding: Optional[str] = None,
+        metric: Optional[str] = None
+    ):
+        """
+        Replace all of a user's documents with the given vectors and chunks
+        in one transaction; documents whose chunks are unchanged keep their block
+        """
+        embedding = embedding or self.embedder.signature
+        rows_by_document: Dict[str, List[int]] = defaultdict(list)
+        for i, chunk in enumerate(metadata):
+            rows_by_document[chunk["document_id"]].append(i)
+
+        with stage("vector_store.save"), self._write() as conn:
+            for document_id, rows in rows_by_document.items():
+                chunks = [metadata[i] for i in rows]
+                self._link_document(
+                    conn,
+                    user_id,
+                    document_id,
+                    chunks,
+                    np.asarray(vectors[rows], dtype=np.float32),
+                    embedding,
+                    self._block_key(chunks, embedding)
+                )
+            # Linked first, so a block moving between documents is never dropped
+            for (document_id,) in conn.execute(
+                "SELECT document_id FROM tenant_documents WHERE user_id = ?", (user_id,)
+            ).fetchall():
+                if document_id not in rows_by_document:
+                    self._unlink_document(conn, user_id, document_id)
+
+    def _write_document(
+        self,
+        user_id: str,
+        document_id: str,
+        chunks: List[Dict],
+        embeddings: np.ndarray,
+        vectors: np.ndarray,
+        metadata: List[Dict]
+    ):
+        """Point the document at the revised block; the old one is unlinked in the same transaction"""
+        if chunks:
+            self._add_document(user_id, document_id, chunks, embeddings, self.embedder.signature)
+        else:
+            self.delete_document(user_id, document_id)
+
+    def delete_document(self, user_id: str, document_id: str) -> bool:
+        """Remove a user's document; its block is dropped once no tenant uses it"""
+        try:
+            with self._write() as conn:
+                return self._unlink_document(conn, user_id, document_id)
+        except Exception as e:
+            print(f"Error deleting document from shared index: {e}")
+            return False
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def _tenant_blocks(
+        self,
+        user_id: str,
+        document_ids: Optional[List[str]] = None,
+        check_embedding: bool = True
+    ) -> List[Tuple]:
+        """
+        The user's (document_id, filename, block_key, shard, start_row, rows, dimension)
+        Tenant isolation: only blocks this user_id points at are returned
+        """
+        query = (
+            "SELECT t.document_id, t.filename, b.block_key, b.shard, b.start_row, b.rows, "
+            "s.dimension, b.embedding, s.rows "
+            "FROM tenant_documents t "
+            "JOIN blocks b ON b.block_key = t.block_key "
+            "JOIN shards s ON s.shard = b.shard "
+            "WHERE t.user_id = ?"
+        )
+        params: list = [user_id]
+        if document_ids:
+            query += f" AND t.document_id IN ({', '.join('?' * len(document_ids))})"
+            params.extend(document_ids)
+        query += " ORDER BY t.added_at, t.document_id"
+        blocks = self._get_connection().execute(query, params).fetchall()
+
+        if check_embedding:
+            stale = [b for b in blocks if b[7] != self.embedder.signature]
+            if stale:
+                if not settings.EMBEDDING_AUTO_MIGRATE:
+                    raise EmbeddingMismatchError(
+                        f"Index for user '{user_id}' was built with '{stale[0][7]}' "
+                        f"but the current embedding provider is '{self.embedder.signature}'"
+                    )
+                self.migrate_embeddings(user_id)
+                return self._tenant_blocks(user_id, document_ids, check_embedding=False)
+        return blocks
+
+    def _payloads(self, block_key: str, positions: List[int]) -> Dict[int, Dict]:
+        """Chunk payloads of a block by position, read PAYLOAD_BATCH_SIZE positions per query"""
+        conn = self._get_connection()
+        payloads = {}
+        for start in range(0, len(positions), PAYLOAD_BATCH_SIZE):
+            batch = positions[start:start + PAYLOAD_BATCH_SIZE]
+            rows = conn.execute(
+                f"SELECT position, payload FROM chunks WHERE block_key = ? "
+                f"AND position IN ({', '.join('?' * len(batch))})",
+                [block_key, *batch]
+            ).fetchall()
+            payloads.update((position, pickle.loads(payload)) for position, payload in rows)
+        return payloads
+
+    def load_index(self, user_id: str, check_embedding: bool = True) -> Tuple[np.ndarray, List[Dict]]:
+        """
+        Copy a user's vectors out of the shards
+        Returns: (vectors of shape (rows, dimension), metadata_list)
+        """
+        blocks = self._tenant_blocks(user_id, check_embedding=check_embedding)
+        if not blocks:
+            return np.empty((0, self.dimension), dtype=np.float32), []
+
+        segments, metadata = [], []
+        for document_id, filename, block_key, shard, start_row, rows, dimension, _, shard_rows in blocks:
+            vectors = self._map_shard(shard, shard_rows, dimension)
+            segments.append(np.asarray(vectors[start_row:start_row + rows]))
+            payloads = self._payloads(block_key, list(range(rows)))
+            metadata.extend(
+                {**payloads[position], "document_id": document_id, "filename": filename}
+                for position in range(rows)
+            )
+        return np.vstack(segments), metadata
+
+    def migrate_embeddings(self, user_id: str) -> int:
+        """
+        Re-embed the user's documents that use another provider
+        Returns: number of chunks re-embedded
+        """
+        migrated = 0
+        for document_id, filename, block_key, _, _, rows, _, embedding, _ in self._tenant_blocks(
+            user_id, check_embedding=False
+        ):
+            if embedding == self.embedder.signature:
+                continue
+            payloads = self._payloads(block_key, list(range(rows)))
+            chunks = [
+                {**payloads[position], "document_id": document_id, "filename": filename}
+                for position in range(rows)
+            ]
+            migrated += self._add_document(user_id, document_id, chunks, None, self.embedder.signature)
+        return migrated
+
+    def search(
+        self,
+        user_id: str,
+        query: str,
+        top_k: int = 5,
+        document_ids: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """
+        Search the user's documents
+        Returns: List of matching chunks with scores
+        """
+        blocks = self._tenant_blocks(user_id, document_ids)
+        if not blocks:
+            return []
+        return self._search_blocks(blocks, self.create_query_embedding(query), top_k)[0]
+
+    def search_batch(
+        self,
+        user_id: str,
+        queries: List[str],
+        top_k: int = 5,
+        document_ids: Optional[List[str]] = None
+    ) -> List[List[Dict]]:
+        """
+        Search for several queries at once
+        Returns: one result list per query
+        """
+        blocks = self._tenant_blocks(user_id, document_ids)
+        if not blocks or not queries:
+            return [[] for _ in queries]
+        return self._search_blocks(blocks, self.create_query_embeddings(queries), top_k)
+
+    def search_embeddings(
+        self,
+        user_id: str,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        document_ids: Optional[List[str]] = None
+    ) -> List[List[Dict]]:
+        """
+        Search with query embeddings computed by the caller
+        Returns: one result list per query
+        """
+        query_embeddings = np.atleast_2d(query_embeddings)
+        blocks = self._tenant_blocks(user_id, document_ids)
+        if not blocks:
+            return [[] for _ in query_embeddings]
+        return self._search_blocks(blocks, query_embeddings, top_k)
+
+    def _search_blocks(self, blocks: List[Tuple], query_embeddings: np.ndarray, top_k: int) -> List[List[Dict]]:
+        """
+        Cosine search over the given blocks' row ranges only
+        Returns: one result list per query
+        """
+        with stage("vector_store.search"):
+            query_embeddings = normalize(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+            scores = np.hstack([
+                query_embeddings @ np.asarray(
+                    self._map_shard(shard, shard_rows, dimension)[start_row:start_row + rows]
+                ).T
+                for _, _, _, shard, start_row, rows, dimension, _, shard_rows in blocks
+            ])
+            # Column -> (block, position within block)
+            owners = np.repeat(np.arange(len(blocks)), [b[5] for b in blocks])
+            offsets = np.concatenate([[0], np.cumsum([b[5] for b in blocks])[:-1]])
+
+            all_results = []
+            for query_scores in scores:
+                hits = np.flatnonzero(query_scores >= settings.COSINE_SIMILARITY_THRESHOLD)
+                if len(hits) > top_k:
+                    hits = hits[np.argpartition(-query_scores[hits], top_k)[:top_k]]
+                hits = hits[np.argsort(-query_scores[hits], kind="stable")]
+
+                positions = defaultdict(list)
+                for hit in hits:
+                    positions[owners[hit]].append(int(hit - offsets[owners[hit]]))
+                payloads = {
+                    block: self._payloads(blocks[block][2], block_positions)
+                    for block, block_positions in positions.items()
+                }
+
+                results = []
+                for hit in hits:
+                    block = owners[hit]
+                    document_id, filename = blocks[block][:2]
+                    chunk = {
+                        **payloads[block][int(hit - offsets[block])],
+                        "document_id": document_id,
+                        "filename": filename,
+                        "similarity_score": float(query_scores[hit]),
+                        "distance": float(1 - query_scores[hit]),
+                    }
+                    results.append(chunk)
+                all_results.append(results)
+            return all_results
+
+    def get_document_count(self, user_id: str) -> int:
+        """Get total number of chunks in user's documents"""
+        row = self._get_connection().execute(
+            "SELECT COALESCE(SUM(b.rows), 0) FROM tenant_documents t "
+            "JOIN blocks b ON b.block_key = t.block_key WHERE t.user_id = ?",
+            (user_id,)
+        ).fetchone()
+        return row[0]
+
+    def stats(self) -> Dict:
+        """Shard sizes and how much tenants share"""
+        conn = self._get_connection()
+        shards = conn.execute("SELECT shard, rows, dead_rows FROM shards ORDER BY shard").fetchall()
+        tenants, tenant_rows = conn.execute(
+            "SELECT COUNT(DISTINCT t.user_id), COALESCE(SUM(b.rows), 0) "
+            "FROM tenant_documents t JOIN blocks b ON b.block_key = t.block_key"
+        ).fetchone()
+        stored_rows = sum(rows - dead for _, rows, dead in shards)
+        return {
+            "shards": len(shards),
+            "tenants": tenants,
+            "stored_rows": stored_rows,
+            "dead_rows": sum(dead for _, _, dead in shards),
+            "tenant_rows": tenant_rows,
+            "sharing_ratio": round(tenant_rows / stored_rows, 2) if stored_rows else None,
+            "files": len(shards) + 1,
+        }
+
+
+def migrate_user(per_user: VectorStore, shared: SharedVectorStore, user_id: str) -> Dict:
+    """
+    Copy one user's per-user index into the shared index, without re-embedding
+    Returns: {"user_id", "chunks", "migrated"}; migrated is False if counts differ
+    """
+    vectors, metadata = per_user.load_index(user_id, check_embedding=False)
+    info = per_user._read_info(user_id)
+    if metadata:
+        shared.save_index(user_id, vectors, metadata, embedding=info["embedding"])
+    migrated = shared.get_document_count(user_id) == len(metadata)
+    return {"user_id": user_id, "chunks": len(metadata), "migrated": migrated}
+
+
+if __name__ == "__main__":
+    import shutil
+
+    parser = argparse.ArgumentParser(description="Manage the shared multi-tenant index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="Copy per-user indexes into the shared index")
+    migrate_parser.add_argument("--user", help="Only this user (default: all)")
+    migrate_parser.add_argument(
+        "--remove-source", action="store_true", help="Delete each per-user directory once verified"
+    )
+    commands.add_parser("stats", help="Shard and sharing statistics")
+    args = parser.parse_args()
+
+    shared = SharedVectorStore()
+    if args.command == "stats":
+        print(json.dumps(shared.stats(), indent=2))
+    else:
+        per_user = VectorStore(shared.embedder)
+        user_ids = [args.user] if args.user else sorted(
+            p.name for p in settings.VECTOR_STORE_DIR.iterdir() if p.is_dir()
+        )
+        for user_id in user_ids:
+            result = migrate_user(per_user, shared, user_id)
+            if result["migrated"] and args.remove_source:
+                shutil.rmtree(settings.VECTOR_STORE_DIR / user_id)
+            print(json.dumps(result))
@@ -0,0 +1,186 @@
+"""
+Startup Module
+Lazy service construction and startup time reporting
+
+Run directly for a startup report:
+    python startup.py [--budget-ms 800] [--json]
+"""
+import json
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+# Heavy modules worth tracking in the import report
+TRACKED_MODULES = [
+    "numpy",
+    "faiss",
+    "PyPDF2",
+    "langchain.text_splitter",
+    "langchain.prompts",
+    "langchain_google_genai",
+    "fastapi",
+    "main",
+]
+
+# Construction times recorded in this process: {name: seconds}
+service_timings: Dict[str, float] = {}
+
+
+@contextmanager
+def timed(name: str):
+    """Record how long the wrapped block takes under the given name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        service_timings[name] = time.perf_counter() - start
+
+
+class LazyService:
+    """
+    Proxy that constructs a service on first attribute access
+
+    Keeps module import cheap: heavy clients are only built when a request
+    actually needs them, and construction time is recorded for the report.
+    """
+
+    def __init__(self, name: str, factory: Callable):
+        self._name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get_instance(self):
+        """Return the service instance, constructing it if needed"""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    with timed(self._name):
+                        self._instance = self._factory()
+        return self._instance
+
+    @property
+    def service_name(self) -> str:
+        return self._name
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._instance is not None
+
+    def __getattr__(self, item):
+        return getattr(self.get_instance(), item)
+
+
+def measure_import_time(module: str) -> float:
+    """
+    Measure cold import time of a module in a fresh interpreter
+    Returns: seconds
+    """
+    code = (
+        "import time, importlib\n"
+        "start = time.perf_counter()\n"
+        f"importlib.import_module({module!r})\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=str(Path(__file__).parent),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}: {result.stderr.strip()}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure_import_times(modules: Optional[List[str]] = None) -> Dict[str, Optional[float]]:
+    """Measure cold import time of each module; None if it fails to import"""
+    timings = {}
+    for module in modules or TRACKED_MODULES:
+        try:
+            timings[module] = measure_import_time(module)
+        except RuntimeError:
+            timings[module] = None
+    return timings
+
+
+def check_import_budget(budget_ms: float, module: str = "main") -> Dict:
+    """Check that importing the app stays within the budget"""
+    elapsed_ms = measure_import_time(module) * 1000
+    return {
+        "module": module,
+        "import_ms": round(elapsed_ms, 1),
+        "budget_ms": budget_ms,
+        "within_budget": elapsed_ms <= budget_ms
+    }
+
+
+def measure_service_construction() -> Dict[str, float]:
+    """Construct every service and its clients, returning timings in seconds"""
+    import main
+    import startup
+
+    for service in main.services:
+        service.get_instance()
+
+    # Force lazily created clients as well
+    main.vector_store.embedder.load()
+    main.rag_engine.llm
+    main.ai_services.llm
+    main.pdf_processor.text_splitter
+
+    # Read from the imported module: under `python startup.py` this file is __main__
+    return dict(startup.service_timings)
+
+
+def build_report(budget_ms: float) -> Dict:
+    """Build the full startup report"""
+    return {
+        "import_budget": check_import_budget(budget_ms),
+        "import_times_ms": {
+            module: None if seconds is None else round(seconds * 1000, 1)
+            for module, seconds in measure_import_times().items()
+        },
+        "service_construction_ms": {
+            name: round(seconds * 1000, 1)
+            for name, seconds in measure_service_construction().items()
+        }
+    }
+
+
+def print_report(report: Dict):
+    """Print a startup report in human-readable form"""
+    budget = report["import_budget"]
+    status = "OK" if budget["within_budget"] else "OVER BUDGET"
+    print(f"Import of '{budget['module']}': {budget['import_ms']} ms "
+          f"(budget {budget['budget_ms']} ms) [{status}]")
+
+    print("\nCold import time per module:")
+    for module, ms in report["import_times_ms"].items():
+        print(f"  {module:<32} {'failed' if ms is None else f'{ms} ms'}")
+
+    print("\nService construction time:")
+    for name, ms in report["service_construction_ms"].items():
+        print(f"  {name:<32} {ms} ms")
+
+
+if __name__ == "__main__":
+    import argparse
+    from config import settings
+
+    parser = argparse.ArgumentParser(description="Measure service startup time")
+    parser.add_argument("--budget-ms", type=float, default=settings.IMPORT_TIME_BUDGET_MS)
+    parser.add_argument("--json", action="store_true", help="Emit JSON")
+    args = parser.parse_args()
+
+    report = build_report(args.budget_ms)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    sys.exit(0 if report["import_budget"]["within_budget"] else 1)
@@ -0,0 +1,340 @@
+"""
+Study Planner Module
+Deterministic study plan scheduling from document topics
+
+Topics are sections of the user's documents (contiguous page ranges of
+roughly equal text length). Study hours are split across topics in
+proportion to their size, with weak topics weighted up; each finished
+topic gets spaced revision sessions, and the last days before the exam
+are mock tests. The only optional LLM involvement is a single call that
+names the topics, with keyword-based names as the fallback.
+"""
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional
+from config import settings
+from models import DailyTask, StudyPlanResponse
+from vector_store import VectorStore, create_vector_store
+
+STOPWORDS = {
+    "about", "after", "also", "been", "before", "being", "between", "both", "each",
+    "from", "have", "here", "into", "more", "most", "only", "other", "over", "same",
+    "some", "such", "than", "that", "their", "them", "then", "there", "these", "they",
+    "this", "those", "through", "under", "very", "were", "what", "when", "where",
+    "which", "while", "will", "with", "would", "your", "page", "chapter", "figure",
+}
+
+
+@dataclass
+class Topic:
+    """A section of a document to be studied as one unit"""
+    name: str
+    filename: str
+    first_page: int
+    last_page: int
+    text: str
+    keywords: List[str] = field(default_factory=list)
+    weight: float = 1.0
+    is_weak: bool = False
+
+    @property
+    def resource(self) -> str:
+        if self.first_page == self.last_page:
+            return f"{self.filename} p. {self.first_page}"
+        return f"{self.filename} pp. {self.first_page}-{self.last_page}"
+
+
+def _tokens(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z]{4,}", text.lower()) if t not in STOPWORDS]
+
+
+def parse_days_remaining(exam_date: str, today: date) -> int:
+    """Days from today until the exam, with the planner's historical defaults"""
+    try:
+        days_remaining = (date.fromisoformat(exam_date[:10]) - today).days
+        if days_remaining <= 0:
+            days_remaining = 7  # Default to 1 week
+    except ValueError:
+        days_remaining = 30  # Default to 1 month
+    return min(days_remaining, settings.PLANNER_MAX_DAYS)
+
+
+class StudyPlanner:
+    """Builds study plans algorithmically from document sections"""
+
+    def __init__(
+        self,
+        vector_store: Optional[VectorStore] = None,
+        labeler: Optional[Callable[[List[Topic]], Optional[List[str]]]] = None
+    ):
+        """`labeler` may name topics (e.g. one LLM call); it returns None on failure"""
+        self.vector_store = vector_store or create_vector_store()
+        self.labeler = labeler
+
+    # ------------------------------------------------------------------
+    # Topics
+    # ------------------------------------------------------------------
+
+    def extract_topics(self, user_id: str, document_ids: Optional[List[str]], max_topics: int) -> List[Topic]:
+        """Split the documents' pages into at most max_topics sections"""
+        if not document_ids:
+            return []
+
+        # Page texts per document, in the order document_ids were given
+        _, metadata = self.vector_store.load_index(user_id, check_embedding=False)
+        pages: Dict[str, Dict[int, List[str]]] = {document_id: {} for document_id in document_ids}
+        filenames: Dict[str, str] = {}
+        for chunk in metadata:
+            document_pages = pages.get(chunk["document_id"])
+            if document_pages is None:
+                continue
+            filenames[chunk["document_id"]] = chunk["filename"]
+            document_pages.setdefault(chunk["page_number"], []).append(chunk["text"])
+
+        sizes = {
+            document_id: sum(len(t) for texts in document_pages.values() for t in texts)
+            for document_id, document_pages in pages.items()
+        }
+        total_size = sum(sizes.values())
+        if total_size == 0:
+            return []
+
+        topics = []
+        for document_id, document_pages in pages.items():
+            if not document_pages:
+                continue
+            # Sections per document in proportion to its size
+            page_numbers = sorted(document_pages)
+            sections = max(1, min(len(page_numbers), round(max_topics * sizes[document_id] / total_size)))
+            target = sizes[document_id] / sections
+
+            current, current_size = [], 0
+            for page_number in page_numbers:
+                current.append(page_number)
+                current_size += sum(len(t) for t in document_pages[page_number])
+                if current_size >= target and page_number != page_numbers[-1]:
+                    topics.append(self._make_topic(filenames[document_id], document_pages, current))
+                    current, current_size = [], 0
+            if current:
+                topics.append(self._make_topic(filenames[document_id], document_pages, current))
+
+        self._assign_keywords(topics)
+        return topics
+
+    def _make_topic(self, filename: str, document_pages: Dict[int, List[str]], page_numbers: List[int]) -> Topic:
+        text = " ".join(t for page_number in page_numbers for t in document_pages[page_number])
+        return Topic(
+            name="",
+            filename=filename,
+            first_page=page_numbers[0],
+            last_page=page_numbers[-1],
+            text=text,
+            weight=max(1, len(text))
+        )
+
+    def _assign_keywords(self, topics: List[Topic]):
+        """Distinctive words per topic (tf-idf) and keyword-based fallback names"""
+        counts = [Counter(_tokens(topic.text)) for topic in topics]
+        document_frequency = Counter(word for count in counts for word in count)
+        for topic, count in zip(topics, counts):
+            scored = sorted(
+                count.items(),
+                key=lambda item: (-item[1] * math.log((1 + len(topics)) / document_frequency[item[0]]), item[0])
+            )
+            topic.keywords = [word for word, _ in scored[:5]]
+            label = ", ".join(word.capitalize() for word in topic.keywords[:3]) or "Overview"
+            topic.name = f"{label} ({topic.resource})"
+
+    def _apply_labels(self, topics: List[Topic]):
+        """Replace fallback names with labeler names when available"""
+        if not self.labeler or not settings.PLANNER_LLM_LABELS or not topics:
+            return
+        try:
+            names = self.labeler(topics)
+        except Exception as e:
+            print(f"Error labeling topics: {e}")
+            return
+        if names and len(names) == len(topics):
+            for topic, name in zip(topics, names):
+                if isinstance(name, str) and name.strip():
+                    topic.name = name.strip()
+
+    def _mark_weak_topics(self, topics: List[Topic], weak_topics: List[str]) -> List[str]:
+        """
+        Weight up topics matching the user's weak topics
+        Unmatched weak topics become topics of their own
+        Returns: weak topics the plan focuses on
+        """
+        average_weight = sum(t.weight for t in topics) / len(topics) if topics else 1.0
+        focus = []
+        for weak_topic in weak_topics:
+            terms = set(_tokens(weak_topic)) or {weak_topic.lower().strip()}
+            # Topics named after the weak topic, else the one mentioning it most
+            matches = [
+                topic for topic in topics
+                if any(term in f"{topic.name} {' '.join(topic.keywords)}".lower() for term in terms)
+            ]
+            if not matches and topics:
+                mentions = [sum(topic.text.lower().count(term) for term in terms) for topic in topics]
+                if max(mentions) > 0:
+                    matches = [topics[mentions.index(max(mentions))]]
+            for topic in matches:
+                if not topic.is_weak:
+                    topic.is_weak = True
+                    topic.weight *= settings.PLANNER_WEAK_TOPIC_WEIGHT
+            if not matches:
+                topics.append(Topic(
+                    name=weak_topic.strip(),
+                    filename="",
+                    first_page=0,
+                    last_page=0,
+                    text="",
+                    weight=average_weight * settings.PLANNER_WEAK_TOPIC_WEIGHT,
+                    is_weak=True
+                ))
+            focus.append(weak_topic.strip())
+        return focus
+
+    # ------------------------------------------------------------------
+    # Scheduling
+    # ------------------------------------------------------------------
+
+    def plan(
+        self,
+        user_id: str,
+        exam_date: str,
+        available_hours_per_day: float,
+        weak_topics: Optional[List[str]] = None,
+        document_ids: Optional[List[str]] = None,
+        today: Optional[date] = None
+    ) -> StudyPlanResponse:
+        """Build a complete day-by-day plan up to the exam"""
+        today = today or date.today()
+        days = parse_days_remaining(exam_date, today)
+        hours = max(0.5, available_hours_per_day)
+
+        topics = self.extract_topics(user_id, document_ids, settings.PLANNER_MAX_TOPICS)
+        self._apply_labels(topics)
+        focus = self._mark_weak_topics(topics, weak_topics or [])
+        if not topics:
+            topics = [Topic(name="General comprehensive preparation", filename="", first_page=0, last_page=0, text="")]
+
+        # Final days are mock tests: 1 for short horizons, up to 3 for long ones
+        mock_days = 0 if days < 3 else 1 if days < 14 else 2 if days < 45 else 3
+        study_days = days - mock_days
+
+        tasks = self._schedule_study(topics, study_days, hours, today)
+        tasks += self._schedule_mock_tests(topics, study_days, mock_days, hours, today)
+
+        revision_slots = sorted({task.day for task in tasks if task.task_type == "revision"})
+        return StudyPlanResponse(
+            success=True,
+            total_days=days,
+            daily_tasks=tasks,
+            revision_slots=revision_slots,
+            weak_topic_focus=focus
+        )
+
+    def _schedule_study(self, topics: List[Topic], study_days: int, hours: float, today: date) -> List[DailyTask]:
+        """Spread study time over the days, inserting spaced revision"""
+        if study_days <= 0:
+            return []
+
+        intervals = settings.PLANNER_REVISION_INTERVALS
+        revision_hours = _round_hours(min(hours / 2, max(0.25, hours * settings.PLANNER_REVISION_SHARE)))
+
+        # Study hours per topic in proportion to weight, leaving room for revision
+        study_budget = study_days * hours * (1 - settings.PLANNER_REVISION_SHARE)
+        total_weight = sum(topic.weight for topic in topics)
+        remaining = [study_budget * topic.weight / total_weight for topic in topics]
+
+        due: Dict[int, List[int]] = {}  # day -> topic indexes to revise
+        tasks: List[DailyTask] = []
+        current = 0
+
+        for day in range(1, study_days + 1):
+            day_date = (today + timedelta(days=day - 1)).isoformat()
+            capacity = hours
+
+            # Revision of topics due today comes first
+            for index in due.pop(day, []):
+                if capacity < 0.25:
+                    break
+                duration = min(revision_hours, capacity)
+                tasks.append(DailyTask(
+                    day=day, date=day_date, topic=topics[index].name,
+                    duration_hours=_round_hours(duration), task_type="revision",
+                    resources=_resources(topics[index])
+                ))
+                capacity -= duration
+
+            # Then new material, continuing where yesterday stopped
+            while capacity >= 0.25 and current < len(topics):
+                duration = min(capacity, remaining[current])
+                if duration >= 0.25:
+                    tasks.append(DailyTask(
+                        day=day, date=day_date, topic=topics[current].name,
+                        duration_hours=_round_hours(duration), task_type="study",
+                        resources=_resources(topics[current])
+                    ))
+                capacity -= duration
+                remaining[current] -= duration
+                if remaining[current] <= 1e-6 or duration < 0.25:
+                    # Topic finished: schedule spaced revisions (weak topics get one more)
+                    topic_intervals = intervals + ([intervals[-1] * 2] if topics[current].is_weak and intervals else [])
+                    for interval in topic_intervals:
+                        if day + interval <= study_days:
+                            due.setdefault(day + interval, []).append(current)
+                    current += 1
+
+            # Once everything is covered, spare time goes to practice
+            if current >= len(topics) and capacity >= 0.25:
+                practice = topics[(day - 1) % len(topics)]
+                tasks.append(DailyTask(
+                    day=day, date=day_date, topic=practice.name,
+                    duration_hours=_round_hours(capacity), task_type="practice",
+                    resources=_resources(practice)
+                ))
+
+        return tasks
+
+    def _schedule_mock_tests(
+        self,
+        topics: List[Topic],
+        study_days: int,
+        mock_days: int,
+        hours: float,
+        today: date
+    ) -> List[DailyTask]:
+        """Full-length mock tests on the final days, with weak-topic review"""
+        tasks = []
+        weak = [topic for topic in topics if topic.is_weak] or topics
+        for offset in range(mock_days):
+            day = study_days + offset + 1
+            day_date = (today + timedelta(days=day - 1)).isoformat()
+            mock_hours = min(hours, 3.0)
+            tasks.append(DailyTask(
+                day=day, date=day_date, topic=f"Mock test {offset + 1}",
+                duration_hours=_round_hours(mock_hours), task_type="mock_test",
+                resources=sorted({topic.filename for topic in topics if topic.filename})
+            ))
+            if hours - mock_hours >= 0.25:
+                review = weak[offset % len(weak)]
+                tasks.append(DailyTask(
+                    day=day, date=day_date, topic=review.name,
+                    duration_hours=_round_hours(hours - mock_hours), task_type="revision",
+                    resources=_resources(review)
+                ))
+        return tasks
+
+
+def _round_hours(value: float) -> float:
+    """Round to the nearest quarter hour"""
+    return max(0.25, round(value * 4) / 4)
+
+
+def _resources(topic: Topic) -> List[str]:
+    return [topic.resource] if topic.filename else []
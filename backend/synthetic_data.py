@@ -0,0 +1,136 @@
+"""
+Synthetic Data Module
+Generates reproducible PDFs and queries for benchmarks and load tests
+"""
+import random
+from typing import List, Dict
+
+# Small topical vocabularies so generated pages have distinguishable content
+TOPICS = {
+    "biology": "cell membrane mitochondria photosynthesis enzyme protein chromosome gene mitosis osmosis tissue",
+    "physics": "force mass acceleration velocity momentum energy friction gravity wave quantum",
+    "chemistry": "atom molecule bond reaction acid base catalyst electron oxidation compound",
+    "history": "empire revolution treaty dynasty colony parliament war constitution trade monarchy",
+    "economics": "market demand supply inflation interest capital labour tariff budget currency",
+    "mathematics": "integral derivative matrix vector theorem proof probability series limit function",
+    "geography": "climate river plateau monsoon erosion latitude population glacier delta volcano",
+    "computing": "algorithm array pointer recursion compiler network database cache thread memory",
+}
+
+FILLER = "the of and in to is a that for with as by on are this from which an be".split()
+
+
+def make_pdf(pages: List[str], line_width: int = 90) -> bytes:
+    """
+    Build a minimal PDF with one text page per string
+    Uses only the standard Helvetica font, no external dependencies
+    """
+    objects = []
+    page_count = len(pages)
+    font_obj = 3 + 2 * page_count
+    kids = " ".join(f"{3 + 2 * i} 0 R" for i in range(page_count))
+
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {page_count} >>".encode())
+
+    for i, text in enumerate(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Contents {4 + 2 * i} 0 R /Resources << /Font << /F1 {font_obj} 0 R >> >> >>".encode()
+        )
+
+        # Wrap text into lines and emit one text-showing operator per line
+        words, lines, line = text.split(), [], ""
+        for word in words:
+            if len(line) + len(word) + 1 > line_width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}".strip()
+        if line:
+            lines.append(line)
+
+        ops = ["BT /F1 10 Tf 12 TL 40 750 Td"]
+        for text_line in lines:
+            escaped = text_line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            ops.append(f"({escaped}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", errors="replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode()
+    output += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref_offset}\n%%EOF\n"
+    ).encode()
+    return output
+
+
+def make_page_text(rng: random.Random, topic: str, words: int) -> str:
+    """Generate page text mixing topic vocabulary and filler words"""
+    vocabulary = TOPICS[topic].split()
+    sentence, sentences = [], []
+    for _ in range(words):
+        sentence.append(rng.choice(vocabulary) if rng.random() < 0.4 else rng.choice(FILLER))
+        if len(sentence) >= rng.randint(8, 16):
+            sentences.append(" ".join(sentence).capitalize() + ".")
+            sentence = []
+    if sentence:
+        sentences.append(" ".join(sentence).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def make_corpus(
+    num_documents: int,
+    pages_per_document: int,
+    words_per_page: int,
+    seed: int = 42
+) -> List[Dict]:
+    """
+    Generate synthetic documents
+    Returns: [{"filename", "topic", "pages": [text, ...], "pdf": bytes}]
+    """
+    rng = random.Random(seed)
+    topics = list(TOPICS)
+    documents = []
+    for doc_index in range(num_documents):
+        topic = topics[doc_index % len(topics)]
+        pages = [make_page_text(rng, topic, words_per_page) for _ in range(pages_per_document)]
+        documents.append({
+            "filename": f"synthetic_{doc_index:04d}_{topic}.pdf",
+            "topic": topic,
+            "pages": pages,
+            "pdf": make_pdf(pages),
+        })
+    return documents
+
+
+def make_queries(documents: List[Dict], num_queries: int, seed: int = 7) -> List[Dict]:
+    """
+    Sample queries from document pages
+    Returns: [{"query", "filename", "page_number"}] with the page the query came from
+    """
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(num_queries):
+        document = rng.choice(documents)
+        page_index = rng.randrange(len(document["pages"]))
+        words = document["pages"][page_index].rstrip(".").split()
+        start = rng.randrange(max(1, len(words) - 12))
+        queries.append({
+            "query": " ".join(words[start:start + 12]),
+            "filename": document["filename"],
+            "page_number": page_index + 1,
+        })
+    return queries
@@ -1,23 +1,13 @@
-
-print("Testing startup...")
+"""
+Startup check for Velosify Study Copilot Backend
+Reports import and service construction times and enforces the import budget
+"""
 import sys
-print("Importing settings...")
 from config import settings
-print("Importing PDFProcessor...")
-from pdf_processor import PDFProcessor
-print("Importing VectorStore...")
-from vector_store import VectorStore
-print("Importing RAGEngine...")
-from rag_engine import RAGEngine
-print("Importing AIServices...")
-from ai_services import AIServices
+from startup import build_report, print_report
 
-print("Initializing PDFProcessor...")
-pdf = PDFProcessor()
-print("Initializing VectorStore...")
-vs = VectorStore()
-print("Initializing RAGEngine...")
-rag = RAGEngine()
-print("Initializing AIServices...")
-ai = AIServices()
-print("Startup test complete!")
+if __name__ == "__main__":
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else settings.IMPORT_TIME_BUDGET_MS
+    report = build_report(budget_ms)
+    print_report(report)
+    sys.exit(0 if report["import_budget"]["within_budget"] else 1)
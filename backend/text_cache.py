@@ -0,0 +1,107 @@
+"""
+Text Cache Module
+Extracted page text and chunk lists by file content, gzip-compressed
+
+Entries are keyed by the SHA-256 of the uploaded bytes plus the versions
+of the extractors that may read the file, so upgrading or reordering
+extractors starts a new entry. Each entry holds the cleaned page texts
+and one chunk list per chunk configuration:
+
+    TEXT_CACHE_DIR/<key[:2]>/<key>/pages.json.gz
+    TEXT_CACHE_DIR/<key[:2]>/<key>/chunks-<size>-<overlap>.json.gz
+
+A retried upload, a re-chunking experiment or an index rebuild reads
+these instead of running extraction (and chunking) again. Extractions
+with unreadable pages are not cached, so a later attempt can do better.
+"""
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+from config import settings
+from metrics import Counter, register
+
+TEXT_CACHE_REQUESTS = register(Counter(
+    "velosify_text_cache_requests_total", "Text cache lookups by kind (pages, chunks) and outcome",
+    ["kind", "outcome"]
+))
+
+# Bump when page cleaning or the stored layout changes
+FORMAT_VERSION = 1
+
+
+class TextCache:
+    """Content-addressed cache of extracted pages and chunk lists"""
+
+    def __init__(self, base_dir: Optional[Path] = None):
+        self.base_dir = base_dir or settings.TEXT_CACHE_DIR
+
+    def cache_key(self, content_hash: str, extractor_versions: List[str]) -> str:
+        """Key for a file's bytes as read by these extractors"""
+        material = json.dumps([FORMAT_VERSION, content_hash, extractor_versions])
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _get_entry_dir(self, key: str) -> Path:
+        return self.base_dir / key[:2] / key
+
+    def _chunks_path(self, key: str) -> Path:
+        return self._get_entry_dir(key) / f"chunks-{settings.CHUNK_SIZE}-{settings.CHUNK_OVERLAP}.json.gz"
+
+    def _read(self, path: Path, kind: str):
+        try:
+            with open(path, 'rb') as f:
+                value = json.loads(gzip.decompress(f.read()))
+        except FileNotFoundError:
+            TEXT_CACHE_REQUESTS.inc(kind, "miss")
+            return None
+        except Exception as e:
+            print(f"Error reading text cache entry {path}: {e}")
+            TEXT_CACHE_REQUESTS.inc(kind, "miss")
+            return None
+        TEXT_CACHE_REQUESTS.inc(kind, "hit")
+        return value
+
+    def _write(self, path: Path, value):
+        """Write compressed JSON to a temporary file and rename it into place"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(gzip.compress(json.dumps(value, separators=(",", ":")).encode(), compresslevel=6))
+        os.replace(tmp_path, path)
+
+    def get_pages(self, key: str) -> Optional[Dict[int, str]]:
+        """Cleaned page texts, or None"""
+        pages = self._read(self._get_entry_dir(key) / "pages.json.gz", "pages")
+        return None if pages is None else {int(page): text for page, text in pages.items()}
+
+    def put_pages(self, key: str, page_texts: Dict[int, str]):
+        try:
+            self._write(self._get_entry_dir(key) / "pages.json.gz", page_texts)
+        except Exception as e:
+            print(f"Error writing text cache entry {key}: {e}")
+
+    def get_chunks(self, key: str) -> Optional[List[Dict]]:
+        """
+        Chunk templates for the current CHUNK_SIZE/CHUNK_OVERLAP, or None
+        Returns: [{"page_number", "chunk_index", "text"}]
+        """
+        rows = self._read(self._chunks_path(key), "chunks")
+        if rows is None:
+            return None
+        return [
+            {"page_number": page_number, "chunk_index": chunk_index, "text": text}
+            for page_number, chunk_index, text in rows
+        ]
+
+    def put_chunks(self, key: str, chunks: List[Dict]):
+        """Store a chunk list; only kept next to complete page texts"""
+        if not (self._get_entry_dir(key) / "pages.json.gz").exists():
+            return
+        try:
+            self._write(
+                self._chunks_path(key),
+                [[chunk["page_number"], chunk["chunk_index"], chunk["text"]] for chunk in chunks]
+            )
+        except Exception as e:
+            print(f"Error writing text cache entry {key}: {e}")
@@ -1,37 +1,74 @@
 """
 Vector Store Module
 Handles embeddings generation and FAISS vector storage
+
+Per-user layout under VECTOR_STORE_DIR/<user_id>:
+    vectors.f32      raw float32 matrix, one row per chunk
+    index_info.json  dimension, committed row count, embedding signature, metric
+    metadata.pkl     chunk metadata, aligned with vector rows
+    vectors.codes    optional quantized FAISS index for shortlist search
+
+Vectors are opened read-only with np.memmap, so every worker process
+shares the same pages through the OS page cache instead of holding its
+own heap copy. Writers never modify pages that readers may have mapped:
+appends go past the committed row count, and rewrites go to a temporary
+file that atomically replaces the old one. Writers take a per-user lock
+(flock on VECTOR_STORE_DIR/.locks/<user_id>.lock) and read the committed
+row count under it, so concurrent workers can't overwrite or truncate
+each other's rows.
+
+With quantization (VECTOR_QUANTIZATION or per user) searches scan the
+compact codes and re-score a shortlist exactly from vectors.f32; see
+quantization.py.
+
+Cosine indexes (VECTOR_METRIC=cosine) store unit-length vectors and keep
+only hits scoring at least COSINE_SIMILARITY_THRESHOLD. Indexes written
+before metrics were recorded are L2; reads serve them as stored, and the
+next append (or a maintenance rebuild) normalizes them.
 """
+import json
 import os
 import pickle
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import Iterable, Iterator, List, Dict, Optional, Tuple
 import numpy as np
-import faiss
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from config import settings
+from embeddings import EmbeddingProvider, get_embedding_provider
+from metrics import stage
+from quantization import MODES, build_codes, codec_for, normalize, rescored_search
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized within one process
+    fcntl = None
+
+# Indexes written before embedding signatures were recorded used Gemini
+LEGACY_EMBEDDING_SIGNATURE = "google:models/embedding-001:768"
+
+class EmbeddingMismatchError(ValueError):
+    """Raised when an index was built with a different embedding provider"""
 
 class VectorStore:
     """Manages vector embeddings and similarity search using FAISS"""
     
-    def __init__(self):
-        """Initialize embeddings model"""
-        self.embeddings_model = GoogleGenerativeAIEmbeddings(
-            model=settings.EMBEDDING_MODEL,
-            google_api_key=settings.GOOGLE_API_KEY
-        )
-        self.dimension = 768  # Gemini embedding dimension
+    def __init__(self, embedder: Optional[EmbeddingProvider] = None):
+        """Embedding provider is chosen by EMBEDDING_PROVIDER unless given"""
+        self.embedder = embedder or get_embedding_provider()
+        # Loaded quantized indexes: {codes path: (mtime_ns, size, index)}
+        self._codes_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._codes_lock = threading.Lock()
+        # Users whose writer lock this thread holds (the lock is reentrant per thread)
+        self._held = threading.local()
+        self._process_locks: Dict[str, threading.Lock] = {}
     
-    def _get_user_index_path(self, user_id: str) -> Path:
-        """Get path to user's FAISS index"""
-        user_dir = settings.VECTOR_STORE_DIR / user_id
-        user_dir.mkdir(parents=True, exist_ok=True)
-        return user_dir / "faiss_index.bin"
-    
-    def _get_user_metadata_path(self, user_id: str) -> Path:
-        """Get path to user's metadata file"""
-        user_dir = settings.VECTOR_STORE_DIR / user_id
-        return user_dir / "metadata.pkl"
+    @property
+    def dimension(self) -> int:
+        """Dimension of the current embedding provider"""
+        return self.embedder.dimension
     
     def create_embeddings(self, texts: List[str]) -> np.ndarray:
         """
@@ -39,82 +76,519 @@ class VectorStore:
         Returns: numpy array of shape (n_texts, dimension)
         """
         try:
-            embeddings = self.embeddings_model.embed_documents(texts)
-            return np.array(embeddings, dtype=np.float32)
+            with stage("vector_store.embed"):
+                return self.embedder.embed_documents(texts)
         except Exception as e:
             raise Exception(f"Failed to generate embeddings: {str(e)}")
     
     def create_query_embedding(self, query: str) -> np.ndarray:
         """Generate embedding for a single query"""
         try:
-            embedding = self.embeddings_model.embed_query(query)
-            return np.array([embedding], dtype=np.float32)
+            with stage("vector_store.embed_query"):
+                return self.embedder.embed_query(query)
         except Exception as e:
             raise Exception(f"Failed to generate query embedding: {str(e)}")
     
-    def load_or_create_index(self, user_id: str) -> Tuple[faiss.Index, List[Dict]]:
+    def create_query_embeddings(self, queries: List[str]) -> np.ndarray:
         """
-        Load existing FAISS index or create new one
-        Returns: (index, metadata_list)
+        Generate embeddings for several queries in one batched call
+        Returns: numpy array of shape (n_queries, dimension)
         """
-        index_path = self._get_user_index_path(user_id)
-        metadata_path = self._get_user_metadata_path(user_id)
+        try:
+            with stage("vector_store.embed_query"):
+                return self.embedder.embed_queries(queries)
+        except Exception as e:
+            raise Exception(f"Failed to generate query embeddings: {str(e)}")
+    
+    @contextmanager
+    def _writer(self, user_id: str):
+        """Exclusive per-user write lock across threads and worker processes"""
+        held = getattr(self._held, "users", None)
+        if held is None:
+            held = self._held.users = set()
+        if user_id in held:
+            yield
+            return
         
-        if index_path.exists() and metadata_path.exists():
-            # Load existing index
-            index = faiss.read_index(str(index_path))
-            with open(metadata_path, 'rb') as f:
-                metadata = pickle.load(f)
-            return index, metadata
-        else:
-            # Create new index
-            index = faiss.IndexFlatL2(self.dimension)
-            metadata = []
-            return index, metadata
-    
-    def save_index(self, user_id: str, index: faiss.Index, metadata: List[Dict]):
-        """Save FAISS index and metadata to disk"""
-        index_path = self._get_user_index_path(user_id)
-        metadata_path = self._get_user_metadata_path(user_id)
+        # Staging IDs such as ".maintenance/<user>" get a matching subdirectory
+        lock_path = settings.VECTOR_STORE_DIR / ".locks" / f"{user_id}.lock"
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(lock_path, 'a+b') as lock_file:
+            if fcntl is not None:
+                # flock is per open file, so threads of one process exclude each other too
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                process_lock = None
+            else:
+                process_lock = self._process_locks.setdefault(user_id, threading.Lock())
+                process_lock.acquire()
+            held.add(user_id)
+            try:
+                yield
+            finally:
+                held.discard(user_id)
+                if process_lock is not None:
+                    process_lock.release()
+    
+    def _get_user_dir(self, user_id: str) -> Path:
+        """Get user's vector store directory"""
+        user_dir = settings.VECTOR_STORE_DIR / user_id
+        user_dir.mkdir(parents=True, exist_ok=True)
+        return user_dir
+    
+    def _get_user_vectors_path(self, user_id: str) -> Path:
+        """Get path to user's raw vector matrix"""
+        return self._get_user_dir(user_id) / "vectors.f32"
+    
+    def _get_user_info_path(self, user_id: str) -> Path:
+        """Get path to user's index info file"""
+        return self._get_user_dir(user_id) / "index_info.json"
+    
+    def _get_user_legacy_index_path(self, user_id: str) -> Path:
+        """Get path to a FAISS index written by older versions"""
+        return self._get_user_dir(user_id) / "faiss_index.bin"
+    
+    def _get_user_codes_path(self, user_id: str) -> Path:
+        """Get path to user's quantized index"""
+        return self._get_user_dir(user_id) / "vectors.codes"
+    
+    def _get_user_metadata_path(self, user_id: str) -> Path:
+        """Get path to user's metadata file"""
+        return self._get_user_dir(user_id) / "metadata.pkl"
+    
+    def _read_info(self, user_id: str) -> Dict:
+        """Read index info, or defaults for an empty index"""
+        info_path = self._get_user_info_path(user_id)
+        if not info_path.exists():
+            return {
+                "dimension": self.dimension,
+                "rows": 0,
+                "embedding": self.embedder.signature,
+                "metric": settings.VECTOR_METRIC
+            }
+        with open(info_path, 'r') as f:
+            info = json.load(f)
+        info.setdefault("embedding", LEGACY_EMBEDDING_SIGNATURE)
+        info.setdefault("metric", "l2")
+        return info
+    
+    def _check_embedding(self, user_id: str, info: Dict) -> Dict:
+        """
+        Make sure the index was built with the current embedding provider
+        Migrates it when EMBEDDING_AUTO_MIGRATE is set, otherwise rejects it
+        Returns: info for the (possibly migrated) index
+        """
+        if info["rows"] == 0 or info["embedding"] == self.embedder.signature:
+            return info
+        
+        if settings.EMBEDDING_AUTO_MIGRATE:
+            self.migrate_embeddings(user_id)
+            return self._read_info(user_id)
         
-        # Save index
-        faiss.write_index(index, str(index_path))
+        raise EmbeddingMismatchError(
+            f"Index for user '{user_id}' was built with '{info['embedding']}' "
+            f"but the current embedding provider is '{self.embedder.signature}'"
+        )
+    
+    def _convert_metric(self, user_id: str) -> Dict:
+        """
+        Normalize an L2 index when VECTOR_METRIC is cosine (writer lock held)
+        Rows only need rescaling, not re-embedding
+        Returns: info for the (possibly converted) index
+        """
+        info = self._read_info(user_id)
+        if info["rows"] == 0 or info["metric"] == settings.VECTOR_METRIC or settings.VECTOR_METRIC != "cosine":
+            return info
         
-        # Save metadata
-        with open(metadata_path, 'wb') as f:
+        vectors = np.memmap(
+            self._get_user_vectors_path(user_id),
+            dtype=np.float32,
+            mode='r',
+            shape=(info["rows"], info["dimension"])
+        )
+        metadata = self._load_metadata(user_id)[:info["rows"]]
+        self.save_index(user_id, vectors, metadata, embedding=info["embedding"], metric="cosine")
+        return self._read_info(user_id)
+    
+    def _commit_info(
+        self,
+        user_id: str,
+        previous: Dict,
+        rows: int,
+        dimension: int,
+        embedding: str,
+        metric: str,
+        codec: Optional[str]
+    ):
+        """Write index info for new rows, keeping the user's quantization setting"""
+        info = {"dimension": dimension, "rows": rows, "embedding": embedding, "metric": metric, "codec": codec}
+        if previous.get("quantization"):
+            info["quantization"] = previous["quantization"]
+        self._write_info(user_id, info)
+    
+    def _write_info(self, user_id: str, info: Dict):
+        """Atomically replace index info"""
+        info_path = self._get_user_info_path(user_id)
+        tmp_path = info_path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(info, f)
+        os.replace(tmp_path, info_path)
+    
+    def _load_metadata(self, user_id: str) -> List[Dict]:
+        """Load chunk metadata"""
+        metadata_path = self._get_user_metadata_path(user_id)
+        if not metadata_path.exists():
+            return []
+        with open(metadata_path, 'rb') as f:
+            return pickle.load(f)
+    
+    def _save_metadata(self, user_id: str, metadata: List[Dict]):
+        """Atomically replace chunk metadata"""
+        metadata_path = self._get_user_metadata_path(user_id)
+        tmp_path = metadata_path.with_suffix(".tmp")
+        with open(tmp_path, 'wb') as f:
             pickle.dump(metadata, f)
+        os.replace(tmp_path, metadata_path)
+    
+    def _migrate_legacy_index(self, user_id: str):
+        """Convert a faiss_index.bin from older versions to the mmap layout"""
+        import faiss
+        
+        legacy_path = self._get_user_legacy_index_path(user_id)
+        index = faiss.read_index(str(legacy_path))
+        vectors = index.reconstruct_n(0, index.ntotal) if index.ntotal else np.empty((0, index.d), dtype=np.float32)
+        self.save_index(user_id, vectors, self._load_metadata(user_id), embedding=LEGACY_EMBEDDING_SIGNATURE)
+        legacy_path.unlink()
+    
+    def _ensure_migrated(self, user_id: str):
+        """Migrate the user's legacy FAISS index if one is present"""
+        if self._get_user_legacy_index_path(user_id).exists():
+            with self._writer(user_id):
+                # Another worker may have migrated it while we waited
+                if self._get_user_legacy_index_path(user_id).exists():
+                    self._migrate_legacy_index(user_id)
+    
+    def load_index(self, user_id: str, check_embedding: bool = True) -> Tuple[np.ndarray, List[Dict]]:
+        """
+        Open user's vectors memory-mapped and read-only
+        Returns: (vectors of shape (rows, dimension), metadata_list)
+        """
+        self._ensure_migrated(user_id)
+        
+        info = self._read_info(user_id)
+        if check_embedding:
+            info = self._check_embedding(user_id, info)
+        rows, dimension = info["rows"], info["dimension"]
+        
+        if rows == 0:
+            return np.empty((0, dimension), dtype=np.float32), []
+        
+        with stage("vector_store.load"):
+            vectors = np.memmap(
+                self._get_user_vectors_path(user_id),
+                dtype=np.float32,
+                mode='r',
+                shape=(rows, dimension)
+            )
+            # Rows are committed before metadata is replaced, so trim any excess
+            metadata = self._load_metadata(user_id)[:rows]
+        return vectors, metadata
+    
+    def save_index(
+        self,
+        user_id: str,
+        vectors: np.ndarray,
+        metadata: List[Dict],
+        embedding: Optional[str] = None,
+        metric: Optional[str] = None
+    ):
+        """
+        Replace user's vectors and metadata
+        `embedding` is the signature the vectors were built with (defaults
+        to the current provider); `metric` defaults to VECTOR_METRIC and
+        cosine vectors are normalized before writing
+        The new matrix is written to a temporary file and renamed over the old
+        one, so processes that still map the old file keep valid pages
+        """
+        with self._writer(user_id), stage("vector_store.save"):
+            previous = self._read_info(user_id)
+            metric = metric or settings.VECTOR_METRIC
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            if metric == "cosine":
+                vectors = normalize(vectors)
+            
+            vectors_path = self._get_user_vectors_path(user_id)
+            tmp_path = vectors_path.with_suffix(".tmp")
+            vectors.tofile(tmp_path)
+            os.replace(tmp_path, vectors_path)
+            
+            self._save_metadata(user_id, metadata)
+            dimension = vectors.shape[1] if vectors.ndim == 2 else self.dimension
+            codec = self._write_codes(user_id, vectors, self._mode(previous), metric)
+            self._commit_info(
+                user_id, previous, len(vectors), dimension, embedding or self.embedder.signature, metric, codec
+            )
+    
+    def migrate_embeddings(self, user_id: str) -> int:
+        """
+        Re-embed all of a user's chunks with the current provider
+        Returns: number of chunks re-embedded
+        """
+        with self._writer(user_id):
+            self._ensure_migrated(user_id)
+            metadata = self._load_metadata(user_id)[:self._read_info(user_id)["rows"]]
+            
+            batch_size = settings.EMBEDDING_BATCH_SIZE
+            batches = [
+                self.create_embeddings([chunk["text"] for chunk in metadata[i:i + batch_size]])
+                for i in range(0, len(metadata), batch_size)
+            ]
+            vectors = np.vstack(batches) if batches else np.empty((0, self.dimension), dtype=np.float32)
+            
+            self.save_index(user_id, vectors, metadata)
+            return len(metadata)
+    
+    def _append_vectors(self, user_id: str, rows: int, embeddings: np.ndarray):
+        """Append rows after the committed ones without touching mapped pages"""
+        vectors_path = self._get_user_vectors_path(user_id)
+        committed_bytes = rows * embeddings.shape[1] * 4
+        
+        with open(vectors_path, 'r+b' if vectors_path.exists() else 'wb') as f:
+            # Drop any uncommitted tail left by an interrupted write
+            f.truncate(committed_bytes)
+            f.seek(committed_bytes)
+            f.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+    
+    # ------------------------------------------------------------------
+    # Quantization
+    # ------------------------------------------------------------------
+    
+    def _mode(self, info: Dict) -> str:
+        return info.get("quantization") or settings.VECTOR_QUANTIZATION
+    
+    def quantization_mode(self, user_id: str) -> str:
+        """User's quantization mode, falling back to VECTOR_QUANTIZATION"""
+        return self._mode(self._read_info(user_id))
+    
+    def _write_codes(self, user_id: str, vectors: np.ndarray, mode: str, metric: str) -> Optional[str]:
+        """
+        Build and atomically replace the user's quantized index
+        Returns: codec written, or None when the mode stores no codes
+        """
+        import faiss
+        
+        codes_path = self._get_user_codes_path(user_id)
+        codec = codec_for(mode, len(vectors), vectors.shape[1] if vectors.ndim == 2 else self.dimension)
+        if codec == "none" or len(vectors) == 0:
+            codes_path.unlink(missing_ok=True)
+            return None
+        
+        with stage("vector_store.quantize"):
+            tmp_path = codes_path.with_name("vectors.codes.tmp")
+            faiss.write_index(build_codes(vectors, codec, metric), str(tmp_path))
+            os.replace(tmp_path, codes_path)
+        return codec
+    
+    def _append_codes(self, user_id: str, info: Dict, rows: int, embeddings: np.ndarray) -> Optional[str]:
+        """
+        Encode appended rows with the existing codebook
+        Retrains from the full matrix when the codec changes (e.g. int8 -> pq
+        once the index has enough rows) or the codes are out of step
+        Returns: codec of the updated codes
+        """
+        import faiss
+        
+        total = rows + len(embeddings)
+        codec = codec_for(self._mode(info), total, embeddings.shape[1])
+        codes_path = self._get_user_codes_path(user_id)
+        
+        if codec != "none" and info.get("codec") == codec and codes_path.exists():
+            codes = faiss.read_index(str(codes_path))
+            if codes.ntotal == rows:
+                with stage("vector_store.quantize"):
+                    codes.add(np.ascontiguousarray(embeddings, dtype=np.float32))
+                    tmp_path = codes_path.with_name("vectors.codes.tmp")
+                    faiss.write_index(codes, str(tmp_path))
+                    os.replace(tmp_path, codes_path)
+                return codec
+        
+        vectors = np.memmap(
+            self._get_user_vectors_path(user_id), dtype=np.float32, mode='r', shape=(total, embeddings.shape[1])
+        )
+        return self._write_codes(user_id, vectors, self._mode(info), info["metric"])
+    
+    def migrate_quantization(self, user_id: str) -> Optional[str]:
+        """
+        Bring the user's codes in line with their quantization mode
+        Also converts a legacy faiss_index.bin on the way
+        Returns: codec now in use, or None for exact search
+        """
+        with self._writer(user_id):
+            vectors, _ = self.load_index(user_id, check_embedding=False)
+            info = self._read_info(user_id)
+            codec = self._write_codes(user_id, vectors, self._mode(info), info["metric"])
+            info["codec"] = codec
+            self._write_info(user_id, info)
+            return codec
+    
+    def set_quantization(self, user_id: str, mode: Optional[str]) -> Optional[str]:
+        """
+        Set a user's quantization mode (None follows VECTOR_QUANTIZATION)
+        and rebuild their codes
+        Returns: codec now in use
+        """
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"Unknown quantization mode '{mode}', expected one of {', '.join(MODES)}")
+        with self._writer(user_id):
+            self._ensure_migrated(user_id)
+            info = self._read_info(user_id)
+            if mode is None:
+                info.pop("quantization", None)
+            else:
+                info["quantization"] = mode
+            self._write_info(user_id, info)
+            return self.migrate_quantization(user_id)
+    
+    def _load_codes(self, user_id: str):
+        """
+        User's quantized index, or None for exact search
+        Stale codes (mode changed, interrupted write) are rebuilt first
+        """
+        import faiss
+        
+        info = self._read_info(user_id)
+        expected = codec_for(self._mode(info), info["rows"], info["dimension"])
+        if info["rows"] and expected != (info.get("codec") or "none"):
+            self.migrate_quantization(user_id)
+            info = self._read_info(user_id)
+        if not info.get("codec") or info["rows"] == 0:
+            return None
+        
+        codes_path = self._get_user_codes_path(user_id)
+        key = str(codes_path)
+        stat = codes_path.stat()
+        with self._codes_lock:
+            cached = self._codes_cache.get(key)
+            if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                self._codes_cache.move_to_end(key)
+                codes = cached[2]
+            else:
+                codes = None
+        
+        if codes is None:
+            codes = faiss.read_index(key)
+            with self._codes_lock:
+                self._codes_cache[key] = (stat.st_mtime_ns, stat.st_size, codes)
+                while len(self._codes_cache) > settings.VECTOR_CODES_CACHE_USERS:
+                    self._codes_cache.popitem(last=False)
+        
+        if codes.ntotal != info["rows"]:
+            # Codes were written for rows that were never committed; rebuild
+            # for the next search and use exact search for this one
+            self.migrate_quantization(user_id)
+            return None
+        return codes
     
     def add_documents(
         self,
         user_id: str,
-        chunks: List[Dict]
+        chunks: List[Dict],
+        embeddings: Optional[np.ndarray] = None
     ) -> int:
         """
         Add document chunks to user's vector store
+        Precomputed embeddings (e.g. from the content store) skip the API call
         Returns: number of chunks added
         """
         if not chunks:
             return 0
         
-        # Load or create index
-        index, existing_metadata = self.load_or_create_index(user_id)
-        
-        # Extract texts for embedding
-        texts = [chunk["text"] for chunk in chunks]
-        
         # Generate embeddings
-        embeddings = self.create_embeddings(texts)
+        if embeddings is None:
+            texts = [chunk["text"] for chunk in chunks]
+            embeddings = self.create_embeddings(texts)
         
-        # Add to index
-        index.add(embeddings)
+        if embeddings.shape[1] != self.dimension:
+            raise EmbeddingMismatchError(
+                f"Embeddings have dimension {embeddings.shape[1]}, index expects {self.dimension}"
+            )
         
-        # Update metadata
-        existing_metadata.extend(chunks)
+        with self._writer(user_id), stage("vector_store.save"):
+            self._append_rows(user_id, chunks, embeddings)
+        return len(chunks)
+    
+    def _append_rows(self, user_id: str, chunks: List[Dict], embeddings: np.ndarray):
+        """
+        Append vectors after the committed rows, then metadata and codes,
+        then commit the new row count (writer lock held)
+        `embeddings` may be memory-mapped; it is copied in INGEST_BATCH_SIZE blocks
+        """
+        _, metadata = self.load_index(user_id)
+        previous = self._convert_metric(user_id)
+        metric = previous["metric"] if metadata else settings.VECTOR_METRIC
+        previous["metric"] = metric
+        rows = len(metadata)
         
-        # Save updated index
-        self.save_index(user_id, index, existing_metadata)
+        step = settings.INGEST_BATCH_SIZE
+        for start in range(0, len(embeddings), step):
+            block = np.asarray(embeddings[start:start + step], dtype=np.float32)
+            self._append_vectors(user_id, rows + start, normalize(block) if metric == "cosine" else block)
+        metadata.extend(chunks)
+        self._save_metadata(user_id, metadata)
         
-        return len(chunks)
+        appended = np.memmap(
+            self._get_user_vectors_path(user_id),
+            dtype=np.float32,
+            mode='r',
+            offset=rows * self.dimension * 4,
+            shape=(len(embeddings), self.dimension)
+        )
+        codec = self._append_codes(user_id, previous, rows, appended)
+        del appended
+        self._commit_info(user_id, previous, len(metadata), self.dimension, self.embedder.signature, metric, codec)
+    
+    def add_documents_stream(
+        self,
+        user_id: str,
+        chunks: Iterable[Dict],
+        batch_size: Optional[int] = None
+    ) -> Iterator[Tuple[List[Dict], np.ndarray]]:
+        """
+        Embed chunks in batches of INGEST_BATCH_SIZE as they arrive
+        Embeddings are spooled to disk after each batch, so only one batch
+        is embedded at a time and existing vectors stay memory-mapped. The
+        document is appended and committed under the writer lock once the
+        stream ends; a stream that stops early leaves the index unchanged.
+        Consume the generator to run it
+        Yields: (chunks, embeddings) of each embedded batch
+        """
+        batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        spool_dir = settings.VECTOR_STORE_DIR / ".spool"
+        spool_dir.mkdir(parents=True, exist_ok=True)
+        spool_path = spool_dir / f"{user_id}.{os.getpid()}.{threading.get_ident()}.f32"
+        added: List[Dict] = []
+        try:
+            with open(spool_path, 'wb') as spool:
+                chunks = iter(chunks)
+                while True:
+                    batch = list(islice(chunks, batch_size))
+                    if not batch:
+                        break
+                    embeddings = self.create_embeddings([chunk["text"] for chunk in batch])
+                    if embeddings.shape[1] != self.dimension:
+                        raise EmbeddingMismatchError(
+                            f"Embeddings have dimension {embeddings.shape[1]}, index expects {self.dimension}"
+                        )
+                    spool.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+                    added.extend(batch)
+                    yield batch, embeddings
+            
+            if added:
+                spooled = np.memmap(spool_path, dtype=np.float32, mode='r', shape=(len(added), self.dimension))
+                with self._writer(user_id), stage("vector_store.save"):
+                    self._append_rows(user_id, added, spooled)
+                del spooled
+        finally:
+            spool_path.unlink(missing_ok=True)
     
     def search(
         self,
@@ -127,83 +601,286 @@ class VectorStore:
         Search for similar chunks
         Returns: List of matching chunks with scores
         """
-        # Load index
-        index, metadata = self.load_or_create_index(user_id)
-        
-        if index.ntotal == 0:
+        # Skip the query embedding for empty indexes
+        if self.get_document_count(user_id) == 0:
             return []
         
-        # Generate query embedding
         query_embedding = self.create_query_embedding(query)
+        return self.search_embeddings(user_id, query_embedding, top_k, document_ids)[0]
+    
+    def search_batch(
+        self,
+        user_id: str,
+        queries: List[str],
+        top_k: int = 5,
+        document_ids: Optional[List[str]] = None
+    ) -> List[List[Dict]]:
+        """
+        Search for several queries at once
+        Loads the index once, embeds all queries in one call and runs a
+        single multi-query search
+        Returns: one result list per query
+        """
+        if self.get_document_count(user_id) == 0 or not queries:
+            return [[] for _ in queries]
         
-        # Search
-        distances, indices = index.search(query_embedding, min(top_k * 2, index.ntotal))
+        query_embeddings = self.create_query_embeddings(queries)
+        return self.search_embeddings(user_id, query_embeddings, top_k, document_ids)
+    
+    def search_embeddings(
+        self,
+        user_id: str,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        document_ids: Optional[List[str]] = None
+    ) -> List[List[Dict]]:
+        """
+        Search with query embeddings computed by the caller, so one
+        embedding can be searched against several indexes
+        Returns: one result list per query
+        """
+        query_embeddings = np.atleast_2d(query_embeddings)
+        vectors, metadata = self.load_index(user_id)
         
-        # Filter and format results
-        results = []
-        for dist, idx in zip(distances[0], indices[0]):
-            if idx == -1:  # FAISS returns -1 for empty slots
-                continue
-            
-            chunk = metadata[idx].copy()
+        if len(vectors) == 0:
+            return [[] for _ in query_embeddings]
+        
+        codes = self._load_codes(user_id)
+        metric = self._read_info(user_id)["metric"]
+        return self._search_vectors(vectors, metadata, query_embeddings, top_k, document_ids, codes, metric)
+    
+    def _search_vectors(
+        self,
+        vectors: np.ndarray,
+        metadata: List[Dict],
+        query_embeddings: np.ndarray,
+        top_k: int,
+        document_ids: Optional[List[str]] = None,
+        codes=None,
+        metric: str = "l2"
+    ) -> List[List[Dict]]:
+        """
+        Run exact search for a batch of query embeddings over the mapped matrix
+        With `codes`, a quantized shortlist is re-scored exactly instead
+        Returns: one result list per query
+        """
+        import faiss
+        
+        with stage("vector_store.search"):
+            if metric == "cosine":
+                return self._range_search(vectors, metadata, query_embeddings, top_k, document_ids, codes)
             
-            # Filter by document_ids if specified
-            if document_ids and chunk["document_id"] not in document_ids:
-                continue
+            k = min(top_k * 2, len(vectors))
+            if document_ids:
+                # Search only the requested documents' rows, exactly (as in
+                # _range_search): a shortlist over the whole index could hold none of them
+                wanted = set(document_ids)
+                rows = np.array(
+                    [i for i, chunk in enumerate(metadata) if chunk["document_id"] in wanted], dtype=np.int64
+                )
+                k = min(top_k, len(rows))
+                if k == 0:
+                    return [[] for _ in query_embeddings]
+                distances, positions = faiss.knn(query_embeddings, np.asarray(vectors[rows], dtype=np.float32), k)
+                indices = np.where(positions >= 0, rows[positions], -1)
+            elif codes is not None:
+                distances, indices = rescored_search(
+                    codes, vectors, query_embeddings, k, k * settings.VECTOR_RESCORE_FACTOR
+                )
+            else:
+                distances, indices = faiss.knn(query_embeddings, vectors, k)
             
-            # Convert L2 distance to similarity score (0-1)
-            # Lower distance = higher similarity
-            similarity_score = 1 / (1 + dist)
+            all_results = []
+            for query_distances, query_indices in zip(distances, indices):
+                # Filter and format results
+                results = []
+                for dist, idx in zip(query_distances, query_indices):
+                    if idx == -1:  # FAISS returns -1 for empty slots
+                        continue
+                    
+                    chunk = metadata[idx].copy()
+                    
+                    # Filter by document_ids if specified
+                    if document_ids and chunk["document_id"] not in document_ids:
+                        continue
+                    
+                    # Convert L2 distance to similarity score (0-1)
+                    # Lower distance = higher similarity
+                    similarity_score = 1 / (1 + dist)
+                    
+                    chunk["similarity_score"] = float(similarity_score)
+                    chunk["distance"] = float(dist)
+                    
+                    # Only include results above threshold
+                    if similarity_score >= settings.SIMILARITY_THRESHOLD:
+                        results.append(chunk)
+                    
+                    if len(results) >= top_k:
+                        break
+                
+                all_results.append(results)
             
-            chunk["similarity_score"] = float(similarity_score)
-            chunk["distance"] = float(dist)
+            return all_results
+    
+    def _range_search(
+        self,
+        vectors: np.ndarray,
+        metadata: List[Dict],
+        query_embeddings: np.ndarray,
+        top_k: int,
+        document_ids: Optional[List[str]] = None,
+        codes=None
+    ) -> List[List[Dict]]:
+        """
+        Cosine search keeping only hits at or above COSINE_SIMILARITY_THRESHOLD
+        Scores come from one matrix product (or a re-scored quantized
+        shortlist; document-scoped searches score just those documents'
+        rows) and the threshold is applied to whole score arrays, so only
+        qualifying rows are looked at in Python
+        Returns: one result list per query
+        """
+        threshold = settings.COSINE_SIMILARITY_THRESHOLD
+        query_embeddings = normalize(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        
+        if document_ids:
+            # Score only the requested documents' rows, exactly: a shortlist
+            # over the whole index could hold none of them
+            wanted = set(document_ids)
+            rows = np.array(
+                [i for i, chunk in enumerate(metadata) if chunk["document_id"] in wanted], dtype=np.int64
+            )
+            scores = query_embeddings @ np.asarray(vectors[rows], dtype=np.float32).T
+            indices = np.broadcast_to(rows, scores.shape)
+        elif codes is not None:
+            # Quantized: exact scores for the shortlist only (sorted, -inf padded)
+            k = min(top_k, len(vectors))
+            scores, indices = rescored_search(
+                codes, vectors, query_embeddings, k, k * settings.VECTOR_RESCORE_FACTOR, metric="cosine"
+            )
+        else:
+            scores = query_embeddings @ np.asarray(vectors).T
+            indices = None
+        
+        all_results = []
+        for i, query_scores in enumerate(scores):
+            hits = np.flatnonzero(query_scores >= threshold)
+            if len(hits) > top_k:
+                hits = hits[np.argpartition(-query_scores[hits], top_k)[:top_k]]
+            hits = hits[np.argsort(-query_scores[hits], kind="stable")]
             
-            # Only include results above threshold
-            if similarity_score >= settings.SIMILARITY_THRESHOLD:
+            results = []
+            for hit in hits:
+                idx = hit if indices is None else indices[i, hit]
+                chunk = metadata[idx].copy()
+                chunk["similarity_score"] = float(query_scores[hit])
+                chunk["distance"] = float(1 - query_scores[hit])
                 results.append(chunk)
-            
-            if len(results) >= top_k:
-                break
+            all_results.append(results)
         
-        return results
+        return all_results
     
     def delete_document(self, user_id: str, document_id: str) -> bool:
         """
         Remove all chunks of a document from vector store
-        Note: FAISS doesn't support deletion, so we rebuild the index
+        Remaining vectors are copied from the stored matrix, no re-embedding
         """
         try:
-            # Load existing index and metadata
-            index, metadata = self.load_or_create_index(user_id)
-            
-            # Filter out chunks from the document to delete
-            filtered_metadata = [
-                chunk for chunk in metadata 
-                if chunk["document_id"] != document_id
-            ]
-            
-            if len(filtered_metadata) == len(metadata):
-                # Document not found
-                return False
-            
-            # Rebuild index with remaining chunks
-            new_index = faiss.IndexFlatL2(self.dimension)
-            
-            if filtered_metadata:
-                texts = [chunk["text"] for chunk in filtered_metadata]
-                embeddings = self.create_embeddings(texts)
-                new_index.add(embeddings)
-            
-            # Save new index
-            self.save_index(user_id, new_index, filtered_metadata)
-            
-            return True
+            with self._writer(user_id):
+                # Load existing vectors and metadata; rows are copied, not compared,
+                # so the embedding provider doesn't matter here
+                vectors, metadata = self.load_index(user_id, check_embedding=False)
+                info = self._read_info(user_id)
+                
+                # Keep rows that don't belong to the document
+                keep = [
+                    i for i, chunk in enumerate(metadata)
+                    if chunk["document_id"] != document_id
+                ]
+                
+                if len(keep) == len(metadata):
+                    # Document not found
+                    return False
+                
+                # Rewrite matrix with remaining rows
+                self.save_index(
+                    user_id,
+                    vectors[keep] if keep else np.empty((0, vectors.shape[1]), dtype=np.float32),
+                    [metadata[i] for i in keep],
+                    embedding=info["embedding"],
+                    metric=info["metric"]
+                )
+                
+                return True
             
         except Exception as e:
             print(f"Error deleting document from vector store: {e}")
             return False
     
+    def document_chunks(self, user_id: str, document_id: str) -> List[Dict]:
+        """Stored chunks of one document, in row order"""
+        _, metadata = self.load_index(user_id)
+        return [chunk for chunk in metadata if chunk["document_id"] == document_id]
+    
+    def replace_document(
+        self,
+        user_id: str,
+        document_id: str,
+        chunks: List[Dict],
+        sources: List[Optional[int]]
+    ) -> np.ndarray:
+        """
+        Swap a document's chunks for a revised set
+        `sources[i]` is the position in document_chunks() whose vector
+        chunk i reuses, or None for chunks that need embedding
+        Returns: the document's new embeddings, in chunk order
+        """
+        vectors, metadata = self.load_index(user_id)
+        rows = [i for i, chunk in enumerate(metadata) if chunk["document_id"] == document_id]
+        
+        embeddings = np.empty((len(chunks), self.dimension), dtype=np.float32)
+        reused = [i for i, source in enumerate(sources) if source is not None]
+        changed = [i for i, source in enumerate(sources) if source is None]
+        if reused:
+            embeddings[reused] = vectors[[rows[sources[i]] for i in reused]]
+        if changed:
+            embeddings[changed] = self.create_embeddings([chunks[i]["text"] for i in changed])
+        
+        # Other documents may have changed while embedding; rewrite from the committed index
+        with self._writer(user_id):
+            vectors, metadata = self.load_index(user_id)
+            self._write_document(user_id, document_id, chunks, embeddings, vectors, metadata)
+        return embeddings
+    
+    def _write_document(
+        self,
+        user_id: str,
+        document_id: str,
+        chunks: List[Dict],
+        embeddings: np.ndarray,
+        vectors: np.ndarray,
+        metadata: List[Dict]
+    ):
+        """Rewrite the index with the document's rows replaced, in one save"""
+        keep = [i for i, chunk in enumerate(metadata) if chunk["document_id"] != document_id]
+        info = self._read_info(user_id)
+        self.save_index(
+            user_id,
+            np.vstack([np.asarray(vectors[keep], dtype=np.float32).reshape(len(keep), self.dimension), embeddings]),
+            [metadata[i] for i in keep] + chunks,
+            metric=info["metric"] if metadata else None
+        )
+    
     def get_document_count(self, user_id: str) -> int:
         """Get total number of chunks in user's vector store"""
-        index, _ = self.load_or_create_index(user_id)
-        return index.ntotal
+        self._ensure_migrated(user_id)
+        return self._read_info(user_id)["rows"]
+
+
+def create_vector_store(embedder: Optional[EmbeddingProvider] = None) -> VectorStore:
+    """Create the configured vector storage engine"""
+    if settings.VECTOR_STORE_ENGINE == "per_user":
+        return VectorStore(embedder)
+    if settings.VECTOR_STORE_ENGINE == "shared":
+        from shared_index import SharedVectorStore
+        return SharedVectorStore(embedder)
+    raise ValueError(f"Unsupported vector store engine: {settings.VECTOR_STORE_ENGINE}")